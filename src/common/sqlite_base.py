@@ -22,18 +22,45 @@ class SQLiteBase:
             self.conn.close()
             log.debug(f"Database connection closed at {self.db_path}")
 
-    def execute(self, query, parameters=()):
-        """执行SQL语句"""
+    def execute(self, query, parameters=(), commit=True):
+        """执行SQL语句
+
+        commit 为 False 时不提交，由调用方在合适的时机调用 `commit()` 批量提交
+        """
         cursor = self.conn.cursor()
         try:
             cursor.execute(query, parameters)
-            self.conn.commit()
+            if commit:
+                self.conn.commit()
         except sqlite3.Error as e:
             log.error(f"Error executing query: {query}, parameters: {parameters}, error: {e}")
-            self.conn.rollback()
+            if commit:
+                self.conn.rollback()
+        finally:
+            cursor.close()
+
+    def executemany(self, query, seq_of_parameters, commit=True):
+        """批量执行SQL语句"""
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany(query, seq_of_parameters)
+            if commit:
+                self.conn.commit()
+        except sqlite3.Error as e:
+            log.error(f"Error executing query: {query}, error: {e}")
+            if commit:
+                self.conn.rollback()
         finally:
             cursor.close()
 
+    def commit(self):
+        """提交当前事务"""
+        try:
+            self.conn.commit()
+        except sqlite3.Error as e:
+            log.error(f"Failed to commit: {e}")
+            self.conn.rollback()
+
     def query_list(self, query, parameters=()):
         """查询并返回结果列表"""
         cursor = self.conn.cursor()
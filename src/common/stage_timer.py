@@ -0,0 +1,46 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current: ContextVar['StageTimer'] = ContextVar('stage_timer', default=None)
+""" 当前正在计时的笔记，每个线程各自独立 """
+
+
+class StageTimer(object):
+    """ 记录一篇笔记转换过程中各阶段的耗时
+
+    用法：`with StageTimer() as timer:` 内调用的 `stage(name)` 都记到这个 timer 上，
+    不在 timer 内时 `stage` 什么也不做，开销可以忽略
+    """
+
+    stages: dict[str, float]
+    """ 阶段名 -> 耗时（秒），同名阶段累加 """
+
+    elapsed: float = 0
+    """ 总耗时（秒） """
+
+    def __init__(self) -> None:
+        self.stages = {}
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.elapsed = time.perf_counter() - self._start
+        _current.reset(self._token)
+
+
+@contextmanager
+def stage(name: str):
+    """ 计时一个阶段，阶段之间不要嵌套，否则耗时会重复计算 """
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.stages[name] = timer.stages.get(name, 0) + time.perf_counter() - start
@@ -1,18 +1,115 @@
-import chardet
+import codecs
+import os
+import re
+import uuid
 from pathlib import Path
 
-def get_html_file_content(html_file: Path):
+META_CHARSET_SCAN_BYTES = 4096
+""" 在html开头的多少字节中查找 `<meta charset>` 声明 """
+
+DETECT_SCAN_BYTES = 64 * 1024
+""" 前几步都无法确定编码时，用 chardet 检测html开头的多少字节 """
+
+_BOMS = [
+    # UTF-32 的 BOM 以 UTF-16 的 BOM 开头，要先判断
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# <meta charset="gbk"> 或 <meta http-equiv="Content-Type" content="text/html; charset=gbk">
+_META_CHARSET = re.compile(rb'<meta[^>]*?charset\s*=\s*["\']?\s*([-\w.:]+)', re.IGNORECASE)
+
+# 声明的编码是 GB2312、GBK 时，实际内容常含有超出范围的字符，按其超集 GB18030 解码
+_ENCODING_ALIASES = {
+    'gb2312': 'gb18030',
+    'gbk': 'gb18030',
+}
+
+
+def decode_html(html_body_bytes: bytes):
     """
-    读取html文件为字符串文本
+    将html字节解码为字符串文本
+
+    按以下顺序确定编码，前面的步骤能确定就不再往下：
+    1. BOM
+    2. 开头几KB中的 `<meta charset>` / `http-equiv` 声明
+    3. 按 UTF-8 严格解码
+    4. 用 chardet 检测开头部分（较慢）
 
-    支持自动检测文件编码
+    Returns:
+        tuple[str, str]: 文本，以及确定编码的步骤：`bom`、`meta`、`utf-8`、`chardet`
     """
-    html_body_bytes = html_file.read_bytes()
-    # 检测文件编码
-    enc = chardet.detect(html_body_bytes)
-    return html_body_bytes.decode(encoding=enc['encoding'] or 'utf-8')
-
-def date_str2timestamp(date_str: str, format="%Y-%m-%d %H:%M:%S"):
-    """ 将日期字符串转为时间 """
-    from datetime import datetime
-    return datetime.strptime(date_str, format).timestamp()
+    for bom, encoding in _BOMS:
+        if html_body_bytes.startswith(bom):
+            return html_body_bytes.decode(encoding), 'bom'
+
+    match = _META_CHARSET.search(html_body_bytes, 0, META_CHARSET_SCAN_BYTES)
+    if match:
+        text = _try_decode(html_body_bytes, _meta_encoding(match.group(1).decode('ascii', 'ignore')))
+        if text is not None:
+            return text, 'meta'
+
+    text = _try_decode(html_body_bytes, 'utf-8')
+    if text is not None:
+        return text, 'utf-8'
+
+    # chardet 较慢，只在需要时导入，且只检测开头部分
+    from chardet.universaldetector import UniversalDetector
+    detector = UniversalDetector()
+    for start in range(0, min(len(html_body_bytes), DETECT_SCAN_BYTES), 4096):
+        detector.feed(html_body_bytes[start:start + 4096])
+        if detector.done:
+            break
+    enc = detector.close()
+    encoding = _normalize_encoding(enc['encoding'] or 'utf-8')
+    return html_body_bytes.decode(encoding, errors='replace'), 'chardet'
+
+def _meta_encoding(encoding: str):
+    """ `<meta charset>` 声明的编码
+
+    声明能按 ASCII 读出来，说明内容不是 UTF-16/UTF-32（有 BOM 的已在上一步处理），与 HTML 规范一样按 UTF-8 处理
+    """
+    try:
+        name = codecs.lookup(encoding).name
+    except LookupError:
+        return encoding
+    return 'utf-8' if name.startswith(('utf-16', 'utf-32')) else encoding
+
+def _normalize_encoding(encoding: str):
+    return _ENCODING_ALIASES.get(encoding.lower(), encoding)
+
+def _try_decode(html_body_bytes: bytes, encoding: str):
+    """ 按指定编码严格解码，编码未知或解码失败时返回 None """
+    try:
+        return html_body_bytes.decode(_normalize_encoding(encoding))
+    except (LookupError, UnicodeDecodeError):
+        return None
+
+def atomic_write_text(file: Path, text: str, encoding="UTF-8"):
+    """ 写入文本文件：先写到同目录下的临时文件，再改名为目标文件
+
+    改名是原子操作，目标文件要么是旧内容，要么是完整的新内容；改名前先落盘，断电后也不会留下空文件或半个文件
+    """
+    # 不用 tempfile.mkstemp，它创建的文件权限为 0600
+    temp_file = file.with_name(f".{file.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(temp_file, "x", encoding=encoding) as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, file)
+    except BaseException:
+        # 临时文件可能没有创建成功，不能掩盖原来的异常
+        temp_file.unlink(missing_ok=True)
+        raise
+
+def format_size(size: float):
+    """ 将字节数转为易读的形式，如 `1.5 MB` """
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
@@ -9,5 +9,101 @@ class Config:
     temp_dir = "output/temp"
     """ 转换过程的临时文件放在这个目录 """
 
+    stream_from_zip = True
+    """ 是否直接从 ziw 压缩包读取笔记内容，图片直接写入目标附件目录；为 False 时先解压到 `temp_dir` """
+
+    propagate_deletes = True
+    """ 为知中已删除的笔记，是否同时删除已转换的笔记及其附件 """
+
+    attachment_dedupe = "reflink"
+    """ 内容相同的附件、图片如何放置：`reflink`（写时复制，文件系统不支持时复制）、`hardlink`（硬链接，注意修改一处会影响所有）、`copy`（总是复制） """
+
+    html_parser = "html.parser"
+    """ 解析 html 使用的 BeautifulSoup 解析器：`html.parser`（内置）、`lxml`（更快）或 `html5lib`，后两者需要另外安装 """
+
+    download_images = True
+    """ 是否下载笔记中的 http(s) 图片到本地，下载失败的继续使用原地址 """
+
+    extract_data_uris = True
+    """ 是否把正文中 `data:image/...;base64,` 内嵌的图片提取为附件目录下的文件，不写入 markdown """
+
+    image_cache_dir = "output/image_cache"
+    """ 下载的远程图片缓存在这个目录，重复运行不再下载 """
+
+    image_download_workers = 8
+    """ 同时下载图片的线程数 """
+
+    image_download_per_host = 2
+    """ 同一个主机同时下载的图片数 """
+
+    image_download_timeout = (5, 30)
+    """ 下载图片的超时时间（秒）：(连接, 读取) """
+
+    image_download_retries = 2
+    """ 下载图片失败时的重试次数 """
+
     always_convert = False
     """ 是否总是转换，如果为True，则不会检查笔记是否已经转换过，直接转换 """
+
+    jobs = 1
+    """ 转换笔记使用的进程数，大于 1 时多进程并行转换，可通过命令行参数 `--jobs N` 指定 """
+
+    pipeline = True
+    """ 单进程转换时，是否使用流水线：读取、转换、写入在不同线程中重叠执行，见 `ConvertPipeline` """
+
+    pipeline_read_ahead = 8
+    """ 流水线读取队列的长度：最多提前读取多少篇笔记 """
+
+    pipeline_writers = 4
+    """ 流水线写入阶段的线程数 """
+
+    pipeline_write_queue = 16
+    """ 流水线写入队列的长度：最多多少篇笔记等待写入，满时转换阶段暂停 """
+
+    pipeline_prefetch_max_bytes = 16 * 1024 * 1024
+    """ 流水线读取阶段，不超过这个大小的 ziw 文件整个读入内存，更大的转换时再从磁盘读取 """
+
+    convertor_db_batch_size = 200
+    """ 转换数据库批量提交：累计多少次写入后提交一次事务 """
+
+    convertor_db_flush_interval = 5
+    """ 转换数据库批量提交：距上次提交超过多少秒，也会提交一次事务 """
+
+    slow_notes_top = 10
+    """ 转换结束时列出耗时最长的笔记数，为 0 时不列出 """
+
+    profile_notes = None
+    """ 对大笔记做性能分析：`cprofile` 或 `tracemalloc`，为 None 时不分析 """
+
+    profile_threshold = 1024 * 1024
+    """ ziw 文件大于这个大小（字节）的笔记才做性能分析 """
+
+    profile_dir = "output/profile"
+    """ 性能分析结果保存在这个目录，以笔记 guid 命名 """
+
+    wiz_document_batch_size = 500
+    """ 从为知数据库分批读取笔记，每批的笔记数，附件、标签也按批读取 """
+
+    conversion_cache = True
+    """ 是否使用转换缓存：index.html 及相关上下文没有变化时，直接使用上次转换的 markdown """
+
+    conversion_cache_path = "output/conversion_cache.db"
+    """ 转换缓存的数据库文件 """
+
+    conversion_cache_max_bytes = 256 * 1024 * 1024
+    """ 转换缓存的大小上限（字节），超过时淘汰最久未使用的缓存 """
+
+    temp_max_bytes = 2 * 1024 * 1024 * 1024
+    """ 解压目录 `temp_dir` 的大小上限（字节），超过时删除最久未使用的解压目录，仅 `stream_from_zip` 为 False 时有效 """
+
+    temp_cleanup_on_success = True
+    """ 笔记转换成功后，是否立即删除它的解压目录 """
+
+    watch_interval = 2
+    """ 监视模式下，检查为知数据库是否有变化的间隔（秒） """
+
+    watch_debounce = 3
+    """ 监视模式下，笔记最后一次修改后，等待多少秒没有新的修改再转换；连续编辑只转换一次 """
+
+    watch_retry_interval = 60
+    """ 监视模式下，转换失败的笔记（如同步中文件被占用）隔多少秒重试 """
@@ -1,16 +1,25 @@
+import time
+from collections import namedtuple
+from typing import Iterable
 from common.log import log
 from pathlib import Path
 
 from common.sqlite_base import SQLiteBase
-from common.utils import date_str2timestamp
 from wiz.entity.wiz_document import WizDocument
 from config import Config
 
+ConvertorState = namedtuple('ConvertorState', ['location', 'name', 'title', 'file_name', 'success', 'extract_time'])
+""" 一篇笔记的转换记录 """
+
 
 class ConvertorDB(SQLiteBase):
 
     def __init__(self):
         """ 转换过程中的专用数据库
+
+        写入采用 write-behind 方式：语句立即执行，但累计 `Config.convertor_db_batch_size` 次写入，
+        或距上次提交超过 `Config.convertor_db_flush_interval` 秒，才提交一次事务。
+        程序崩溃时未提交的批次会回滚，重新执行时从最后一次提交的批次继续。
         """
         log.debug("init convertor db.")
 
@@ -19,6 +28,13 @@ class ConvertorDB(SQLiteBase):
             db.parent.mkdir(parents=True, exist_ok=True)
         super().__init__(str(db))
 
+        # WAL 模式下，synchronous=NORMAL 只在 checkpoint 时 fsync，崩溃时也不会损坏数据库
+        self.query_scalar("PRAGMA journal_mode=WAL;")
+        self.execute("PRAGMA synchronous=NORMAL;")
+
+        self._pending_writes = 0
+        self._last_flush_time = time.monotonic()
+
         table_exists = self.query_scalar("SELECT count(*) FROM sqlite_master WHERE type='table' AND name='wiz_convertor';")
         if not table_exists:
             self.execute(
@@ -36,22 +52,58 @@ class ConvertorDB(SQLiteBase):
     """
             )
 
-    def is_converted(self, document: WizDocument):
-        """ 判断笔记是否已经转换
-        """
-        row = self.query_scalar(
+        # 转换器自身的状态，如监视模式的高水位时间
+        self.execute("CREATE TABLE IF NOT EXISTS convertor_meta (key TEXT PRIMARY KEY, value TEXT);")
+
+        # 转换成功的笔记正文中的内链，目标笔记移动、改名、删除或新建时，据此重新转换引用它的笔记
+        self.execute(
+            """
+            CREATE TABLE IF NOT EXISTS wiz_link (
+                source TEXT NOT NULL,       -- 内链所在笔记的 guid
+                target TEXT NOT NULL,       -- 内链指向的笔记或附件的 guid
+                link_type TEXT NOT NULL,    -- open_document 或 open_attachment，见 WizInternalLink
+                PRIMARY KEY (source, target)
+            );
             """
-            SELECT count(*)
-            FROM WIZ_CONVERTOR
-            WHERE GUID = ? AND success=1
-            """,
-            (document.guid,),
         )
-        # 转换后，笔记有更新，视为未转换
-        return row and (not self.is_modified_after_extract(document))
+        self.execute("CREATE INDEX IF NOT EXISTS idx_wiz_link_target ON wiz_link(target);")
+
+    def get_meta(self, key: str) -> str:
+        return self.query_scalar("SELECT value FROM convertor_meta WHERE key = ?", (key,))
+
+    def set_meta(self, key: str, value: str):
+        """ 连同之前未提交的写入一起立即提交，保证状态与转换记录一致
+        """
+        self.flush()
+        self.execute("INSERT OR REPLACE INTO convertor_meta(key, value) VALUES (?, ?)", (key, value))
+
+    def _write(self, query, parameters=()):
+        """ 执行写入语句，暂不提交，满足条件时批量提交
+        """
+        self.execute(query, parameters, commit=False)
+        self._wrote()
+
+    def _wrote(self):
+        self._pending_writes += 1
+        if (self._pending_writes >= Config.convertor_db_batch_size
+                or time.monotonic() - self._last_flush_time >= Config.convertor_db_flush_interval):
+            self.flush()
+
+    def flush(self):
+        """ 提交所有未提交的写入
+        """
+        if self._pending_writes:
+            self.commit()
+            log.debug(f"convertor db 提交 {self._pending_writes} 次写入")
+        self._pending_writes = 0
+        self._last_flush_time = time.monotonic()
+
+    def close(self):
+        self.flush()
+        super().close()
 
     def save_result(self, document_guid: str, success: bool):
-        self.execute(
+        self._write(
             """
             UPDATE wiz_convertor SET
                 success=?
@@ -60,39 +112,130 @@ class ConvertorDB(SQLiteBase):
             (success, document_guid)
         )
 
-    def add(self, document: WizDocument):
-        self.execute(
+    def add_all(self, documents: list[WizDocument]):
+        """ 批量添加笔记，已存在的笔记不会覆盖，在一个事务中完成
+        """
+        self.flush()
+        self.executemany(
             """
-            INSERT INTO wiz_convertor(guid, location, name, title, file_name)
-            SELECT ?, ?, ?, ?, ?
-            WHERE NOT EXISTS (SELECT 1 FROM wiz_convertor WHERE guid = ?)
+            INSERT OR IGNORE INTO wiz_convertor(guid, location, name, title, file_name)
+            VALUES (?, ?, ?, ?, ?)
             """,
-            (document.guid, document.location, document.name, document.title, document.output_file_name or document.title, document.guid),
+            [(document.guid, document.location, document.name, document.title, document.output_file_name or document.title) for document in documents],
         )
 
-    def save_extract_time(self, document_guid: str):
-        """ 记录解压笔记的时间
+    def get_all_state(self) -> dict[str, ConvertorState]:
+        """ 一次查询读出所有笔记的转换记录
         """
-        self.execute(
+        rows = self.query_list(
+            """
+            SELECT guid, location, name, title, file_name, success, extract_time
+            FROM wiz_convertor
+            """
+        )
+        return {row[0]: ConvertorState(*row[1:]) for row in rows}
+
+    def update_location(self, document: WizDocument):
+        """ 笔记移动或改名后，更新记录中的位置和文件名
+        """
+        self._write(
             """
             UPDATE wiz_convertor SET
-                extract_time = datetime('now', 'localtime')                
+                location=?, name=?, title=?, file_name=?
             WHERE guid=?
             """,
-            (document_guid,)
+            (document.location, document.name, document.title, document.output_file_name or document.title, document.guid)
         )
 
-    def is_modified_after_extract(self, document: WizDocument):
-        """ 解压后，笔记是否有更新
+    def delete(self, document_guid: str):
+        """ 笔记在为知中已删除，删除其转换记录及正文中的内链
+        """
+        self._write("DELETE FROM wiz_convertor WHERE guid=?", (document_guid,))
+        self._write("DELETE FROM wiz_link WHERE source=?", (document_guid,))
+
+    def save_links(self, document_guid: str, links: Iterable[tuple[str, str]]):
+        """ 记录笔记正文中的内链，替换之前的记录
+
+        Args:
+            links: (link_type, guid)，见 `find_internal_links`
+        """
+        self.execute("DELETE FROM wiz_link WHERE source=?", (document_guid,), commit=False)
+        self.executemany("INSERT OR IGNORE INTO wiz_link(source, target, link_type) VALUES (?, ?, ?)",
+                         [(document_guid, guid, link_type) for link_type, guid in links], commit=False)
+        self._wrote()
+
+    def get_backlinks(self, target_guid: str) -> list[tuple[str, str]]:
+        """ 反向链接：正文中链接到这篇笔记（或这个附件）的笔记
+
+        Returns:
+            list[tuple[str, str]]: (笔记 guid, link_type)
+        """
+        return self.query_list("SELECT source, link_type FROM wiz_link WHERE target=? ORDER BY source", (target_guid,))
+
+    def get_linking_documents(self, target_guids: Iterable[str]) -> set[str]:
+        """ 正文中有笔记内链指向 target_guids 中任一笔记的笔记 guid
+        """
+        sources = set()
+        target_guids = list(target_guids)
+        for i in range(0, len(target_guids), Config.wiz_document_batch_size):
+            batch = target_guids[i:i + Config.wiz_document_batch_size]
+            rows = self.query_list(
+                f"""
+                SELECT DISTINCT source FROM wiz_link
+                WHERE link_type='open_document' AND target IN ({','.join('?' * len(batch))})
+                """,
+                batch
+            )
+            sources.update(row[0] for row in rows)
+        return sources
+
+    def save_extract_time(self, document_guid: str, extract_time: str):
+        """ 记录解压笔记的时间
+
+        Args:
+            extract_time (str): 开始读取笔记文件的时间，`%Y-%m-%d %H:%M:%S` 格式的本地时间，见 `ConvertResult.extract_time`
         """
-        extract_time = self.query_scalar(
+        self._write(
             """
-            SELECT
-                extract_time
-            FROM WIZ_CONVERTOR
-            WHERE GUID = ?
+            UPDATE wiz_convertor SET
+                extract_time = ?
+            WHERE guid=?
             """,
-            (document.guid,)
+            (extract_time, document_guid)
         )
-        
-        return (not extract_time) or date_str2timestamp(extract_time) < document.get_modified()
+
+    def merge(self, other_db_path: str) -> int:
+        """ 合并另一个 ConvertorDB（如其他分片）的转换记录
+
+        同一篇笔记两边都有记录时，保留转换成功的；都成功或都未成功时，保留解压时间较新的
+
+        Returns:
+            int: 合并后，来自另一个数据库的记录数
+        """
+        self.flush()
+        self.execute("ATTACH DATABASE ? AS other", (other_db_path,))
+        try:
+            self.execute(
+                """
+                INSERT INTO wiz_convertor(guid, location, name, title, file_name, success, extract_time)
+                SELECT guid, location, name, title, file_name, success, extract_time FROM other.wiz_convertor WHERE true
+                ON CONFLICT(guid) DO UPDATE SET
+                    location=excluded.location, name=excluded.name, title=excluded.title, file_name=excluded.file_name,
+                    success=excluded.success, extract_time=excluded.extract_time
+                WHERE (COALESCE(excluded.success, 0), COALESCE(excluded.extract_time, ''))
+                    > (COALESCE(wiz_convertor.success, 0), COALESCE(wiz_convertor.extract_time, ''))
+                """
+            )
+            count = self.query_scalar("SELECT changes()")
+            if self.query_scalar("SELECT count(*) FROM other.sqlite_master WHERE type='table' AND name='wiz_link'"):
+                self.execute("INSERT OR IGNORE INTO wiz_link SELECT source, target, link_type FROM other.wiz_link")
+            return count
+        finally:
+            self.execute("DETACH DATABASE other")
+
+    def reset_extract_time(self, document_guids: list[str]):
+        """ 清除解压时间：解压目录已不存在、且没有转换成功的笔记，记录的解压时间已无意义
+        """
+        self.flush()
+        self.executemany("UPDATE wiz_convertor SET extract_time = NULL WHERE guid=?", [(guid,) for guid in document_guids])
+
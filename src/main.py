@@ -1,20 +1,84 @@
+import argparse
 from common.log import log
 from pathlib import Path
+from config import Config
 from convertor_db import ConvertorDB
 from wiz.wiz_db import WizDB
 from wiz.wiz_storage import WizStorage
 from wiz.wiz_convertor import WizConvertor
+from wiz.wiz_document_filter import WizDocumentFilter, parse_shard
+from wiz.wiz_watcher import WizWatcher
 
-# 获取为知笔记的数据目录
-wiz_dir = input("笔记文件夹参考：C:\\Users\\windows用户名\\Documents\\My Knowledge\\Data\\为知账号名\n输入为知笔记文件夹路径：")
-wiz_dir = Path(wiz_dir).expanduser()
-print(f'\n\n账号:{wiz_dir.name}')
 
+def _parse_args() -> tuple[argparse.Namespace, argparse.ArgumentParser]:
+    parser = argparse.ArgumentParser(description='为知笔记 转 Obsidian（Markdown）')
+    parser.add_argument('wiz_dir', nargs='?', help='为知笔记的数据目录，不指定时交互输入')
+    parser.add_argument('--jobs', '-j', type=int, default=Config.jobs, help='转换笔记使用的进程数，默认为 1')
+    parser.add_argument('--output', help=f'转换后笔记的输出目录，默认为 {Config.output_dir}')
+    parser.add_argument('--temp', help=f'解压笔记的临时目录，默认为 {Config.temp_dir}')
+    parser.add_argument('--db', help=f'转换记录数据库的路径，默认为 {Config.convertor_db_path}；转换缓存放在同一目录下')
 
-log.info('初始化几个重要对象')
-wiz_db = WizDB(wiz_dir)
-convertor_db = ConvertorDB()
-wiz_storage = WizStorage(wiz_dir, wiz_db, convertor_db)
+    group = parser.add_argument_group('筛选笔记', '多个条件同时满足；筛选范围外的笔记不转换，其转换结果也不删除')
+    group.add_argument('--folder', action='append', help='只处理这个文件夹（含子文件夹）下的笔记，如 /My Notes/工作/，可多次指定')
+    group.add_argument('--tag', action='append', help='只处理有这个标签（含子标签）的笔记，如 技术/python，可多次指定')
+    group.add_argument('--modified-since', help='只处理这个时间之后修改的笔记，如 2024-01-01 或 "2024-01-01 08:00:00"')
+    group.add_argument('--shard', help='按 guid 分成 m 片，只处理第 i 片，格式为 i/m，如 1/4')
 
-log.info('启动转换器')
-WizConvertor(convertor_db, wiz_storage)
+    parser.add_argument('--watch', action='store_true',
+                        help='监视模式：同步后继续运行，为知中修改过的笔记几秒内自动转换，按 Ctrl+C 退出')
+    parser.add_argument('--merge-db', nargs='+', metavar='DB',
+                        help='把其他分片的转换记录数据库合并到 --db 指定的数据库中，然后退出')
+    return parser.parse_args(), parser
+
+
+def main():
+    args, parser = _parse_args()
+    Config.jobs = args.jobs
+    if args.output:
+        Config.output_dir = args.output
+    if args.temp:
+        Config.temp_dir = args.temp
+    if args.db:
+        Config.convertor_db_path = args.db
+        Config.conversion_cache_path = str(Path(args.db).with_name('conversion_cache.db'))
+
+    if args.merge_db:
+        convertor_db = ConvertorDB()
+        for db_path in args.merge_db:
+            if not Path(db_path).is_file():
+                parser.error(f'数据库不存在：{db_path}')
+            count = convertor_db.merge(db_path)
+            log.info(f'合并 {db_path}：{count} 条转换记录')
+        convertor_db.close()
+        return
+
+    try:
+        document_filter = WizDocumentFilter(args.folder, args.tag, args.modified_since,
+                                            parse_shard(args.shard) if args.shard else None)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # 获取为知笔记的数据目录
+    wiz_dir = args.wiz_dir
+    if not wiz_dir:
+        wiz_dir = input("笔记文件夹参考：C:\\Users\\windows用户名\\Documents\\My Knowledge\\Data\\为知账号名\n输入为知笔记文件夹路径：")
+    wiz_dir = Path(wiz_dir).expanduser()
+    print(f'\n\n账号:{wiz_dir.name}')
+
+
+    log.info('初始化几个重要对象')
+    wiz_db = WizDB(wiz_dir)
+    convertor_db = ConvertorDB()
+    wiz_storage = WizStorage(wiz_dir, wiz_db, convertor_db)
+
+    if args.watch:
+        WizWatcher(wiz_dir, wiz_db, convertor_db, wiz_storage, document_filter).run()
+        return
+
+    log.info('启动转换器')
+    WizConvertor(convertor_db, wiz_storage, document_filter)
+
+
+# 多进程转换时，子进程会重新导入本模块，入口代码不能在导入时执行
+if __name__ == '__main__':
+    main()
@@ -3,16 +3,18 @@ class WizAttachment(object):
 
     在为知笔记中，附件属于一种资源，拥有自己的 guid
     """
+    __slots__ = ('guid', 'doc_guid', 'name', 'modified')
+
     # 附件的 guid
-    guid: str = None
+    guid: str
 
     # 附件所属的文档 guid
-    doc_guid: str = None
+    doc_guid: str
 
     # 附件的名称，一般是文件名
-    name: str = None
+    name: str
 
-    modified: str = None
+    modified: str
 
     def __init__(self, guid: str, doc_guid: str, name: str, modified: str) -> None:
         self.guid = guid
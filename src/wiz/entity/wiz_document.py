@@ -3,47 +3,59 @@ from pathlib import Path
 
 from .wiz_attachment import WizAttachment
 from .wiz_tag import WizTag
+from ..wiz_note_file import WizNoteFile
 
 FORMAT_STRING = "%Y-%m-%d %H:%M:%S"
 
+_NO_ITEMS = ()
+""" 没有附件、标签的笔记共用，不可修改 """
+
 
 class WizDocument(object):
     """ 为知笔记文档
         DOCUMENT_GUID, DOCUMENT_TITLE, DOCUMENT_LOCATION, DOCUMENT_NAME,
         DOCUMENT_TYPE, DT_CREATED, DT_MODIFIED, DT_ACCESSED, DOCUMENT_ATTACHMENT_COUNT
+
+    笔记数量可能很多，使用 `__slots__` 节省内存；路径、时间戳用到时才计算，算好后缓存
     """
+    __slots__ = ('guid', 'title', 'location', 'name', 'type', 'created', 'modified', 'accessed', 'url',
+                 'attachment_count', 'wiz_dir', 'tags', 'attachments',
+                 '_output_file_name', '_file', '_created_timestamp', '_modified_timestamp', '_accessed_timestamp')
+
     # 文档的 guid
-    guid: str = None
-    title: str = None
+    guid: str
+    title: str
     """ 笔记名 """
 
-    output_file_name: str = None
-    """ 输出文件名，title值替换掉一些特殊字符 """
-
-    location: str = None
+    location: str
     """ 笔记所属文件夹，格式为：`/folder1/folder2/.../` """
-    name: str = None
+    name: str
     """ 笔记的文件名，格式为：`name.ziw`，ziw实际是zip压缩包 """
-    type: str = None
+    type: str
 
-    created: str = None
-    modified: str = None
-    accessed: str = None
+    created: str
+    modified: str
+    accessed: str
 
     # 文档的标签
-    tags: list[WizTag] = []
+    tags: list[WizTag]
 
     # 从数据库中读取的附件数量，如果大于 0 说明这个文档有附件
-    attachment_count: int = 0
+    attachment_count: int
     # 文档的附件
-    attachments: list[WizAttachment] = []
+    attachments: list[WizAttachment]
 
-    file: Path = None
-    """ 笔记ziw文件的完整路径 """
-    attachments_dir: Path = None
+    wiz_dir: Path
 
     # 笔记是从其他地方剪辑来的，一般会有来源网址
-    url: str = None
+    url: str
+
+    _output_file_name: str
+    _file: Path
+    _created_timestamp: float
+    _modified_timestamp: float
+    _accessed_timestamp: float
+    """ 已解析的时间戳，见 `created_timestamp` 等属性 """
 
     def __init__(self, guid: str, title: str, location: str, name: str, type: str, created: str, modified: str, accessed: str, url: str, attachment_count: int, wiz_dir: Path) -> None:
         self.guid = guid
@@ -57,66 +69,125 @@ class WizDocument(object):
         self.attachment_count = attachment_count
         self.wiz_dir = wiz_dir
         self.url = url
+        self.tags = _NO_ITEMS
+        self.attachments = _NO_ITEMS
+        self._output_file_name = None
+        self._file = None
+        self._created_timestamp = None
+        self._modified_timestamp = None
+        self._accessed_timestamp = None
+
+    @property
+    def output_file_name(self) -> str:
+        """ 输出文件名，title值替换掉一些特殊字符 """
+        if self._output_file_name is None:
+            self._ensure_file_name_valid()
+        return self._output_file_name
+
+    @property
+    def file(self) -> Path:
+        """ 笔记ziw文件的完整路径 """
+        if self._file is None:
+            self._file = Path(str(self.wiz_dir) + self.location + self.name).expanduser()
+        return self._file
+
+    @property
+    def attachments_dir(self) -> Path:
+        """ 笔记附件所在的目录，没有附件时为 None
+
+        `attachment_count` 可能与附件记录不一致，有附件记录时以附件记录为准
+        """
+        if self.attachment_count == 0 and not self.attachments:
+            return None
+        return Path(str(self.file.parent.joinpath(self.file.stem)) + "_Attachments")
 
-        self.file = Path(str(self.wiz_dir) + self.location + self.name).expanduser()
-        self._ensure_file_name_valid()
-
-        if self.attachment_count == 0:
-            return
-        self.attachments_dir = Path(str(self.file.parent.joinpath(self.file.stem)) + "_Attachments")
+    @property
+    def attachments_by_guid(self) -> dict[str, WizAttachment]:
+        """ 附件 guid -> 附件，处理附件内链时按 guid 查找，只在转换时用到，不常驻内存 """
+        return {attachment.guid: attachment for attachment in self.attachments}
 
     def resolve_attachments(self, attachments: list[WizAttachment]) -> None:
-        self.attachments = attachments
+        # 大部分笔记没有附件、标签，共用一个空元组
+        self.attachments = attachments or _NO_ITEMS
 
     def resolve_tags(self, tags: list[WizTag]) -> None:
-        self.tags = tags
+        self.tags = tags or _NO_ITEMS
 
     def is_markdown(self):
         return self.title.endswith('.md')
 
-    def is_todolist(self, file_extract_dir: Path):
+    def is_todolist(self, note_file: WizNoteFile):
         # 部分情况下 type 为 null，根据是否存在 wiz_todolist.xml 来判断，增加鲁棒性
         # 可以直接根据 wiz_todolist.xml 来判断，考虑存在未知的情况，暂时不动
-        return self.type == "todolist2" or file_extract_dir.joinpath("index_files").joinpath("wiz_todolist.xml").exists()
+        return self.type == "todolist2" or note_file.has_todolist()
+
+    @property
+    def created_timestamp(self) -> float:
+        """ 创建时间的时间戳，解析一次后缓存 """
+        if self._created_timestamp is None:
+            self._created_timestamp = datetime.strptime(self.created, FORMAT_STRING).timestamp()
+        return self._created_timestamp
+
+    @property
+    def modified_timestamp(self) -> float:
+        """ 修改时间的时间戳，解析一次后缓存 """
+        if self._modified_timestamp is None:
+            self._modified_timestamp = datetime.strptime(self.modified, FORMAT_STRING).timestamp()
+        return self._modified_timestamp
+
+    @property
+    def accessed_timestamp(self) -> float:
+        """ 访问时间的时间戳，解析一次后缓存 """
+        if self._accessed_timestamp is None:
+            self._accessed_timestamp = datetime.strptime(self.accessed, FORMAT_STRING).timestamp()
+        return self._accessed_timestamp
 
     def get_created(self):
-        return datetime.strptime(self.created, FORMAT_STRING).timestamp()
+        return self.created_timestamp
 
     def get_modified(self):
-        return datetime.strptime(self.modified, FORMAT_STRING).timestamp()
+        return self.modified_timestamp
 
     def get_accessed(self):
-        return datetime.strptime(self.accessed, FORMAT_STRING).timestamp()
+        return self.accessed_timestamp
 
     def _ensure_file_name_valid(self):
         """ 笔记名将做为文件名，不能含有某些特殊字符，需要替换掉，确保文件名合法
 
         `document.output_file_name`为最终文件名，是在`document.title`的基础上替换掉特殊字符
         """
-        # key为文件名不允许出现的字符，value为替换为的字符
-        char_to_replace = {
-            "*": "-",
-            '"': "''",
-            "\\": "╲",
-            "/": "╱",
-            "<": "〈",
-            ">": "〉",
-            ":": "：",
-            "|": "｜",
-            "?": "？",
-        }
-
-        name = self.title
-        for k in char_to_replace:
-            name = name.replace(k, char_to_replace[k])
-
-        # 文件名不能以.开头
-        if (name.startswith('.')):
-            name = '_' + name.strip('.')
-        
-        # 移除文件名中的.md
-        # 为知的markdown笔记，文件名以`.md`结尾，这里要去掉，否则最终的输出文件名会有两个.md
-        if (name.endswith('.md')):
-            name = name.rstrip('.md')
-        
-        self.output_file_name = name
+        self._output_file_name = get_output_file_name(self.title)
+
+
+def get_output_file_name(title: str) -> str:
+    """ 由笔记名得到输出文件名：替换掉文件名中不允许的特殊字符，去掉 markdown 笔记的 `.md` 后缀
+
+    生成内链路径时不必创建 `WizDocument`，直接用笔记名计算
+    """
+    # key为文件名不允许出现的字符，value为替换为的字符
+    char_to_replace = {
+        "*": "-",
+        '"': "''",
+        "\\": "╲",
+        "/": "╱",
+        "<": "〈",
+        ">": "〉",
+        ":": "：",
+        "|": "｜",
+        "?": "？",
+    }
+
+    name = title
+    for k in char_to_replace:
+        name = name.replace(k, char_to_replace[k])
+
+    # 文件名不能以.开头
+    if (name.startswith('.')):
+        name = '_' + name.strip('.')
+    
+    # 移除文件名中的.md
+    # 为知的markdown笔记，文件名以`.md`结尾，这里要去掉，否则最终的输出文件名会有两个.md
+    if (name.endswith('.md')):
+        name = name.rstrip('.md')
+    
+    return name
@@ -3,11 +3,13 @@ class WizImage(object):
 
     在为知笔记中，本地图像不属于资源，也没有自己的 guid
     """
+    __slots__ = ('outer_html', 'src')
+
     # 原始图像的整个 HTML 内容，包括 <img src="index_files/name.jpg">
-    outer_html: str = None
+    outer_html: str
 
     # 仅包含图像的 src 部分
-    src: str = None
+    src: str
 
     def __init__(self, outer_html: str, src: str) -> None:
         self.outer_html = outer_html
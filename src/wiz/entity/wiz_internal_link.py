@@ -1,19 +1,23 @@
+import re
 from common.log import log
 from urllib.parse import parse_qs, urlparse
 
 # 笔记内链 wiz://open_document/?guid=bda9f178-04d5-4cbb-a054-e691b81e87a0&kbguid=&private_kbguid=3d251a9b-2f9a-102d-bd16-dd2e4f011a7d
 # 附件内链 wiz://open_attachment?guid=52a00459-92d8-4b9f-b2b7-d3fb6708559d
 
+_WIZ_LINK = re.compile(rb'wiz://(open_\w+)/?\?[^"\'>\s]*?guid=([0-9A-Za-z-]+)')
+
 
 class WizInternalLink(object):
     """ 嵌入 html 正文中的为知笔记内部链接，可能是笔记，也可能是附件
     """
+    __slots__ = ('guid', 'link_type')
 
-    guid: str = None
+    guid: str
     """ 原始链接中的资源 guid，可能是 attachment 或者是 wiz_document
     """
 
-    link_type: str = None
+    link_type: str
     """ 值为 open_attachment 或者 open_document
     """
 
@@ -24,6 +28,8 @@ class WizInternalLink(object):
             wiz_internal_link (str): wiz内链，应当是 `wiz://` 开头
         """
 
+        self.guid = None
+        self.link_type = None
         url = urlparse(wiz_internal_link)
         if (url.scheme != 'wiz'):
             log.error(f"wiz 内部链接必须以 `wiz://` 开头：`{wiz_internal_link}`")
@@ -37,3 +43,12 @@ class WizInternalLink(object):
 
     def is_document(self):
         return "open_document" == self.link_type
+
+
+def find_internal_links(html_bytes: bytes) -> set[tuple[str, str]]:
+    """ 直接在 index.html 的原始字节中查找内链，不解析 html
+
+    Returns:
+        set[tuple[str, str]]: (link_type, guid)，link_type 为 open_document 或 open_attachment
+    """
+    return {(link_type.decode('ascii'), guid.decode('ascii')) for link_type, guid in _WIZ_LINK.findall(html_bytes)}
@@ -1,14 +1,18 @@
+from common.log import log
+
+
 class WizTag(object):
     """ 为知笔记 TAG
     """
+    __slots__ = ('guid', 'parent_guid', 'name', 'nesting_name')
 
     # tag 的 guid
-    guid: str = None
-    parent_guid: str = None
+    guid: str
+    parent_guid: str
 
-    name: str = None
+    name: str
 
-    nesting_name: str = None
+    nesting_name: str
     """
     嵌套的 tag 名称
 
@@ -19,27 +23,51 @@ class WizTag(object):
         self.guid = guid
         self.name = name
         self.parent_guid = parent_guid
+        self.nesting_name = None
+
+
+class WizTagTree(object):
+    """ 标签树
+
+    建立 guid -> tag 的索引，一次性计算所有标签的嵌套名称，已算好的上级标签直接复用
+    """
 
-    @staticmethod
-    def compute_nesting_name(tags: list['WizTag']) -> None:
-        """ 计算嵌套名称 """
+    tags_by_guid: dict[str, WizTag]
+
+    def __init__(self, tags: list[WizTag]) -> None:
+        self.tags_by_guid = {tag.guid: tag for tag in tags}
+        for tag in tags:
+            tag.nesting_name = None
         for tag in tags:
-            tag.nesting_name = tag.name
-            if tag.parent_guid is None:
-                continue
-            parent_tag = next(t for t in tags if t.guid == tag.parent_guid)
-            while parent_tag:
-                if parent_tag.nesting_name:
-                    tag.nesting_name = f"{parent_tag.nesting_name}/{tag.nesting_name}"
-                    break
-                tag.nesting_name = f"{parent_tag.name}/{tag.nesting_name}"
-                parent_tag = next((t for t in tags if t.guid == parent_tag.parent_guid), None)
-
-    def set_nesting_name(self, all_tags: list["WizTag"]):
-        """ 
-
-        Args:
-            all_tags (list[&quot;WizTag&quot;]): 所有已经算好neting_name的所有tag的信息
+            self._compute_nesting_name(tag)
+
+    def get(self, guid: str) -> WizTag:
+        return self.tags_by_guid.get(guid)
+
+    def _compute_nesting_name(self, tag: WizTag):
+        """ 沿上级标签往上找，直到根标签或已算好嵌套名称的标签，再往下依次计算
+
+        上级标签不存在、或者上级标签形成环，都当做根标签处理
         """
-        self.nesting_name = next((tag.nesting_name for tag in all_tags if tag.guid == self.guid), self.name)
-        return self
+        path: list[WizTag] = []
+        visited: set[str] = set()
+        node = tag
+        while node is not None and node.nesting_name is None:
+            if node.guid in visited:
+                log.warning(f'标签 `{node.name}` 的上级标签形成环，从 `{path[-1].name}` 处断开')
+                node = None
+                break
+            visited.add(node.guid)
+            path.append(node)
+            if not node.parent_guid:
+                node = None
+                break
+            parent = self.tags_by_guid.get(node.parent_guid)
+            if parent is None:
+                log.warning(f'标签 `{node.name}` 的上级标签 {node.parent_guid} 不存在，做为根标签处理')
+            node = parent
+
+        prefix = node.nesting_name if node is not None else None
+        for t in reversed(path):
+            t.nesting_name = f"{prefix}/{t.name}" if prefix else t.name
+            prefix = t.nesting_name
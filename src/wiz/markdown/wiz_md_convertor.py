@@ -1,81 +1,167 @@
 from pathlib import Path
 from common.log import log
 from ..entity.wiz_attachment import WizAttachment
-from ..wiz_storage import WizStorage
+from ..wiz_note_file import WizNoteFile
 import re
-import shutil
 from bs4 import BeautifulSoup, NavigableString
-from common.utils import get_html_file_content
+from common.stage_timer import stage
 from config import Config
+from wiz.entity.wiz_image import WizImage
 from wiz.entity.wiz_internal_link import WizInternalLink
 from markdownify import MarkdownConverter
 
-def wiz_html_to_md(index_html_file: Path, attachments: list[WizAttachment], target_attachments_dir: Path, wiz_storage: WizStorage):
+def wiz_html_to_md(html_content: str, note_file: WizNoteFile, attachments: dict[str, WizAttachment], target_attachments_dir: Path, link_targets: dict[str, str],
+                   unresolved_links: set[str] = None, remote_images: dict[str, Path] = None, copied_images: list[str] = None):
+    """ 将为知笔记的 index.html 转为 markdown
+
+    Args:
+        html_content (str): 解码后的 index.html 内容
+        note_file (WizNoteFile): 笔记 ziw 文件，从中读取图片
+        attachments (dict[str, WizAttachment]): 附件 guid -> 附件，见 `WizDocument.attachments_by_guid`
+        link_targets (dict[str, str]): 笔记 guid -> 笔记内链路径，见 `WizStorage.get_link_targets`
+        unresolved_links (set[str]): 找不到目标的内链 guid 会加入这个集合，运行结束时统一汇报
+        remote_images (dict[str, Path]): 已下载到本地的 http(s) 图片，url -> 缓存文件，见 `ImageDownloader`
+        copied_images (list[str]): 复制到附件目录的图片（`index_files/` 下的资源或 http(s) 地址）会加入这个列表，
+            命中转换缓存时用 `copy_images` 重新复制
+    """
     # 用 BeautifulSoup 解析 wiz html
-    html_content = get_html_file_content(index_html_file)
-    soup = BeautifulSoup(html_content, "html.parser",
-        multi_valued_attributes=None,    #不做多值属性解析，比如class属性值，默认解析为list，现在会合并为一个str
-    )
-
-    # 处理嵌套列表：转换不规范的嵌套列表html，这样后续 markdown 转换为 html 时，不会丢失嵌套列表
-    # 见：[Nested List Formatting Issue](https://github.com/matthewwithanm/python-markdownify/issues/84)
-    for list in soup.find_all(['ul','dl']):
-        # 找上个兄弟节点，如果是空白文字节点，就继续往上找
-        sibling = list.previous_sibling
-        while sibling and isinstance(sibling, NavigableString) and sibling.strip() == '':
-            sibling = sibling.previous_sibling
-        # 上个兄弟节点是li，将当前的 ul 或 dl 节点移动到 li 节点的内部
-        if sibling and sibling.name == 'li':
-            sibling.append(list)
+    with stage("parse"):
+        soup = BeautifulSoup(html_content, Config.html_parser,
+            multi_valued_attributes=None,    #不做多值属性解析，比如class属性值，默认解析为list，现在会合并为一个str
+        )
 
     # 计算图片或附件的相对路径，在处理内链时用到
-    attachment_relative_path = str(target_attachments_dir.relative_to(Config.output_dir)).replace('\\','/') + '/'
-
-    # 处理图片链接
-    # <img src="index_files/1cde3ccd-3c93-413f-8582-fa727bc19afe.png"/>
-    # index_files 替换为 target_attachments_dir基于ouptut_dir的相对路径
-    # obsidian的内链图片格式为：![[filename]]
-    for img in soup.find_all("img", src=lambda x: x and x.startswith("index_files/")):
-        src = img.get("src")
-        internal_link = src.replace("index_files/", attachment_relative_path)
-        img.replace_with(f'![[{internal_link}]]')
-        _convert_image(index_html_file.parent.joinpath(src), target_attachments_dir)
-
-    # 处理内链：直接转为 obsidian 的内链格式
-    # 笔记内链 <a href="wiz://open_document/?guid=bda9f178-04d5-4cbb-a054-e691b81e87a0&kbguid=&private_kbguid=3d251a9b-2f9a-102d-bd16-dd2e4f011a7d">text</a>
-    # 附件内链 <a href="wiz://open_attachment?guid=52a00459-92d8-4b9f-b2b7-d3fb6708559d">
-    # obsidian 的内链格式为：[[Internal links|custom display text]]
-    for a in soup.find_all("a", href=lambda x: x and x.startswith("wiz://")):
-        href = a.get("href")
-        link = WizInternalLink(href)
-        # 笔记内链
-        if link.is_document():
-            # 找到 document，生成相对路径
-            document = wiz_storage.get_document(link.guid)
-            if not document:
-                log.warning(f"处理笔记内链：{link.guid} 文档找不到")
-                continue
-            internal_link = document.location + document.output_file_name
-            a.replace_with(f'[[{internal_link}|{a.text.replace('\r','').replace('\n','')}]]')
-        # 附件内链
-        else:
-            attachment_file_name = _get_attachment(link.guid, attachments)
-            if attachment_file_name is None:
-                log.warning(f"处理附件内链：{link.guid} 附件找不到")
-                continue
-            internal_link = attachment_relative_path + attachment_file_name
-            a.replace_with(f'[[{internal_link}]]')
+    attachment_relative_path = get_attachment_relative_path(target_attachments_dir)
 
+    # 只遍历一次文档树：嵌套列表当场修正，图片、内链先收集起来，
+    # 遍历结束后再替换（图片在内链之前），替换结果与分别遍历三次相同
+    images = []
+    remote = []
+    links = []
+    with stage("traverse"):
+        for el in soup.find_all(True):
+            if el.name in ('ul', 'dl'):
+                _fix_nested_list(el)
+            elif el.name == 'img':
+                src = el.get("src")
+                if src and src.startswith("index_files/"):
+                    images.append(el)
+                elif src and remote_images and WizImage(str(el), src).is_http():
+                    remote.append(el)
+            elif el.name == 'a':
+                href = el.get("href")
+                if href and href.startswith("wiz://"):
+                    links.append(el)
+
+    with stage("images"):
+        for img in images:
+            _rewrite_image(img, note_file, target_attachments_dir, attachment_relative_path, copied_images)
+        for img in remote:
+            _rewrite_remote_image(img, note_file, target_attachments_dir, attachment_relative_path, remote_images, copied_images)
+    with stage("links"):
+        for a in links:
+            _rewrite_link(a, attachments, link_targets, attachment_relative_path, unresolved_links)
 
     # 转换为 markdown
-    return md(soup, 
-              code_language_callback=callback,
-              escape_asterisks=False,   #不转义 *
-              escape_underscores=False, #不转义 _
-              escape_misc=False,        #不转义其他符号
-              heading_style='atx',      #atx格式：# 标题
-              )
+    with stage("markdown"):
+        return md(soup, 
+                  code_language_callback=callback,
+                  escape_asterisks=False,   #不转义 *
+                  escape_underscores=False, #不转义 _
+                  escape_misc=False,        #不转义其他符号
+                  heading_style='atx',      #atx格式：# 标题
+                  )
+
+
+def get_attachment_relative_path(target_attachments_dir: Path) -> str:
+    """ 附件目录基于 `Config.output_dir` 的相对路径，笔记中的图片、附件内链以此开头 """
+    return str(target_attachments_dir.relative_to(Config.output_dir)).replace('\\','/') + '/'
+
+def copy_images(note_file: WizNoteFile, images: list[str], target_attachments_dir: Path, remote_images: dict[str, Path]):
+    """ 复制图片到附件目录，与转换时的复制相同，见 `wiz_html_to_md` 的 `copied_images` """
+    for src in images:
+        if src.startswith("index_files/"):
+            _convert_image(note_file, src, target_attachments_dir)
+        else:
+            _copy_remote_image(note_file, remote_images[src], target_attachments_dir)
+
+def _fix_nested_list(list):
+    """ 处理嵌套列表：转换不规范的嵌套列表html，这样后续 markdown 转换为 html 时，不会丢失嵌套列表
+
+    见：[Nested List Formatting Issue](https://github.com/matthewwithanm/python-markdownify/issues/84)
+    """
+    # 找上个兄弟节点，如果是空白文字节点，就继续往上找
+    sibling = list.previous_sibling
+    while sibling and isinstance(sibling, NavigableString) and sibling.strip() == '':
+        sibling = sibling.previous_sibling
+    # 上个兄弟节点是li，将当前的 ul 或 dl 节点移动到 li 节点的内部
+    if sibling and sibling.name == 'li':
+        sibling.append(list)
 
+def _rewrite_image(img, note_file: WizNoteFile, target_attachments_dir: Path, attachment_relative_path: str,
+                   copied_images: list[str]):
+    """ 处理图片链接
+
+    <img src="index_files/1cde3ccd-3c93-413f-8582-fa727bc19afe.png"/>
+    index_files 替换为 target_attachments_dir基于ouptut_dir的相对路径
+    obsidian的内链图片格式为：![[filename]]
+    """
+    src = img.get("src")
+    internal_link = src.replace("index_files/", attachment_relative_path)
+    img.replace_with(f'![[{internal_link}]]')
+    _convert_image(note_file, src, target_attachments_dir)
+    if copied_images is not None:
+        copied_images.append(src)
+
+def _rewrite_remote_image(img, note_file: WizNoteFile, target_attachments_dir: Path, attachment_relative_path: str,
+                          remote_images: dict[str, Path], copied_images: list[str]):
+    """ 处理 http(s) 图片：已下载到本地的，复制到附件目录并转为 obsidian 的内链图片，否则继续使用原地址
+    """
+    src = img.get("src")
+    cached_file = remote_images.get(src)
+    if cached_file is None:
+        return
+    img.replace_with(f'![[{attachment_relative_path}{cached_file.name}]]')
+    _copy_remote_image(note_file, cached_file, target_attachments_dir)
+    if copied_images is not None:
+        copied_images.append(src)
+
+def _copy_remote_image(note_file: WizNoteFile, cached_file: Path, target_attachments_dir: Path):
+    """ 将下载到本地的 http(s) 图片复制到目标目录 """
+    if not target_attachments_dir.exists():
+        target_attachments_dir.mkdir(parents=True, exist_ok=True)
+    note_file.sink.place_file(cached_file, target_attachments_dir.joinpath(cached_file.name))
+
+def _rewrite_link(a, attachments: dict[str, WizAttachment], link_targets: dict[str, str], attachment_relative_path: str,
+                  unresolved_links: set[str]):
+    """ 处理内链：直接转为 obsidian 的内链格式
+
+    笔记内链 <a href="wiz://open_document/?guid=bda9f178-04d5-4cbb-a054-e691b81e87a0&kbguid=&private_kbguid=3d251a9b-2f9a-102d-bd16-dd2e4f011a7d">text</a>
+    附件内链 <a href="wiz://open_attachment?guid=52a00459-92d8-4b9f-b2b7-d3fb6708559d">
+    obsidian 的内链格式为：[[Internal links|custom display text]]
+    """
+    href = a.get("href")
+    link = WizInternalLink(href)
+    # 笔记内链
+    if link.is_document():
+        # 找到 document，生成相对路径
+        internal_link = link_targets.get(link.guid)
+        if internal_link is None:
+            log.debug(f"处理笔记内链：{link.guid} 文档找不到")
+            if unresolved_links is not None:
+                unresolved_links.add(link.guid)
+            return
+        a.replace_with(f'[[{internal_link}|{a.text.replace('\r','').replace('\n','')}]]')
+    # 附件内链
+    else:
+        attachment = attachments.get(link.guid)
+        if attachment is None:
+            log.debug(f"处理附件内链：{link.guid} 附件找不到")
+            if unresolved_links is not None:
+                unresolved_links.add(link.guid)
+            return
+        internal_link = attachment_relative_path + attachment.name
+        a.replace_with(f'[[{internal_link}]]')
 
 class CustomMarkdownConverter(MarkdownConverter):
     def convert_div(self, el, text, convert_as_inline):
@@ -119,15 +205,10 @@ def _fix_code_lang(lang):
     }
     return code_dict.get(lang) or lang
 
-def _get_attachment(guid: str, attachments: list[WizAttachment]):
-    """ 查找笔记中的附件的文件名 """
-    for attachment in attachments:
-        if attachment.guid == guid:
-            return attachment.name
-    return None
-
-def _convert_image(img_file_path: Path, target_attachments_dir: Path):
-    """ 将图片复制到目标目录 """
+def _convert_image(note_file: WizNoteFile, src: str, target_attachments_dir: Path):
+    """ 将图片复制到目标目录，从 data URI 中提取的图片已写入，见 `extract_data_uris` """
+    if src in note_file.inline_resources:
+        return
     if not target_attachments_dir.exists():
-        target_attachments_dir.mkdir(parents=True)
-    shutil.copy2(img_file_path, target_attachments_dir)
+        target_attachments_dir.mkdir(parents=True, exist_ok=True)
+    note_file.copy_resource(src, target_attachments_dir)
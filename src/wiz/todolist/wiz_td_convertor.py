@@ -1,20 +1,21 @@
-from pathlib import Path
 from xml.etree import ElementTree
+from ..wiz_note_file import WizNoteFile, TODOLIST_XML
 
 
-def convert_td(file_extract_dir: Path, target_file: Path):
+def convert_td(note_file: WizNoteFile) -> str:
+    """ 将任务清单转为 markdown 文本 """
     # 解析所有 todolist
-    todolist: list[str] = _convert_todolist(file_extract_dir)
+    todolist: list[str] = _convert_todolist(note_file)
 
-    target_file.write_text("\n".join(todolist))
+    return "\n".join(todolist)
 
-def _convert_todolist(file_extract_dir: Path):
-    wiz_todolist = file_extract_dir.joinpath("index_files").joinpath("wiz_todolist.xml")
-    if not wiz_todolist.exists():
-        raise FileNotFoundError(f'todolist文件不存在！ {wiz_todolist}')
-    tree = ElementTree.parse(str(wiz_todolist))
+def _convert_todolist(note_file: WizNoteFile):
+    wiz_todolist = note_file.read_todolist()
+    if wiz_todolist is None:
+        raise FileNotFoundError(f'todolist文件不存在！ {TODOLIST_XML}')
+    root = ElementTree.fromstring(wiz_todolist)
     todolist: list[str] = []
-    _convert_todolist_children(tree.getroot(), todolist, 0)
+    _convert_todolist_children(root, todolist, 0)
     return todolist
 
 def _convert_todolist_children(parent, todolist, level):
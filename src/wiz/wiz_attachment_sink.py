@@ -0,0 +1,156 @@
+import hashlib
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Callable
+from common.log import log
+from config import Config
+
+FICLONE = 0x40049409
+""" Linux 的 reflink ioctl，btrfs、xfs 等文件系统支持 """
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class AttachmentSink(object):
+    """ 附件、图片的写入
+
+    - 目标文件已存在，且大小、修改时间、内容哈希都相同时，跳过；硬链接的文件不比较修改时间
+    - 内容相同的文件（如多篇笔记中粘贴的同一张截图），按 `Config.attachment_dedupe` 以 reflink 或硬链接的方式放置，不再完整复制
+    - 统计复制、去重、跳过的字节数
+    """
+
+    bytes_copied: int = 0
+    bytes_deduplicated: int = 0
+    bytes_skipped: int = 0
+
+    _placed: dict[str, Path]
+    """ 内容哈希 -> 本次运行中已写入的文件 """
+
+    def __init__(self, placed: dict[str, Path] = None) -> None:
+        """
+        Args:
+            placed (dict[str, Path]): 与其他 sink 共用的已写入文件，多个写线程各用一个 sink、分别统计时，仍能跨笔记去重
+        """
+        self._placed = {} if placed is None else placed
+
+    def place_file(self, source: Path, target: Path):
+        """ 将磁盘上的文件放置到 target，保留修改时间 """
+        stat = source.stat()
+        self.place(target, stat.st_size, stat.st_mtime, lambda: open(source, 'rb'))
+
+    def place(self, target: Path, size: int, mtime: float, open_source: Callable[[], BinaryIO]):
+        """ 将内容放置到 target，并设置修改时间
+
+        Args:
+            size (int): 内容大小
+            mtime (float): 要设置的修改时间
+            open_source (Callable[[], BinaryIO]): 打开源内容，可能会调用两次：计算哈希、复制
+        """
+        with open_source() as source:
+            digest = _hash(source)
+
+        if self._is_same(target, size, mtime, digest):
+            log.debug(f'内容未变化，跳过：{target}')
+            self.bytes_skipped += size
+            self._placed.setdefault(digest, target)
+            return
+
+        existing = self._placed.get(digest)
+        if existing is not None and existing != target and existing.exists() and self._link(existing, target):
+            self.bytes_deduplicated += size
+            if Config.attachment_dedupe == 'hardlink':
+                # 硬链接共用同一个 inode，设置修改时间会改掉所有链接的修改时间
+                return
+        else:
+            temp_file = _temp_file(target)
+            try:
+                with open_source() as source, open(temp_file, 'wb') as f:
+                    shutil.copyfileobj(source, f, CHUNK_SIZE)
+                os.replace(temp_file, target)
+            finally:
+                temp_file.unlink(missing_ok=True)
+            self.bytes_copied += size
+            self._placed[digest] = target
+        os.utime(target, (mtime, mtime))
+
+    def take_stats(self) -> tuple[int, int, int]:
+        """ 取出并清零统计：(复制, 去重, 跳过) 的字节数 """
+        stats = (self.bytes_copied, self.bytes_deduplicated, self.bytes_skipped)
+        self.bytes_copied = self.bytes_deduplicated = self.bytes_skipped = 0
+        return stats
+
+    @staticmethod
+    def _is_same(target: Path, size: int, mtime: float, digest: str) -> bool:
+        try:
+            stat = target.stat()
+        except FileNotFoundError:
+            return False
+        if stat.st_size != size:
+            return False
+        # 硬链接的文件修改时间是共用的，只能比较内容
+        if stat.st_nlink == 1 and int(stat.st_mtime) != int(mtime):
+            return False
+        with open(target, 'rb') as f:
+            return _hash(f) == digest
+
+    @staticmethod
+    def _link(existing: Path, target: Path) -> bool:
+        """ 以 reflink 或硬链接的方式放置内容相同的文件，文件系统不支持时返回 False，改为复制 """
+        mode = Config.attachment_dedupe
+        if mode not in ('reflink', 'hardlink'):
+            return False
+        temp_file = _temp_file(target)
+        try:
+            if mode == 'hardlink':
+                os.link(existing, temp_file)
+            else:
+                _reflink(existing, temp_file)
+            os.replace(temp_file, target)
+            return True
+        except (OSError, ImportError) as e:
+            log.debug(f'{mode} 失败，改为复制：{e}')
+            return False
+        finally:
+            temp_file.unlink(missing_ok=True)
+
+
+class DeferredSink(AttachmentSink):
+    """ 只记录要写入的内容，调用 `flush` 时才交给真正的 sink 写入
+
+    流水线转换时，转换阶段用它收集附件、图片的写入，由写入阶段的线程执行，见 `ConvertPipeline`
+    """
+
+    _pending: list[tuple]
+    """ 待写入的 `place` 参数 """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._pending = []
+
+    def place(self, target: Path, size: int, mtime: float, open_source: Callable[[], BinaryIO]):
+        self._pending.append((target, size, mtime, open_source))
+
+    def flush(self, sink: AttachmentSink):
+        for args in self._pending:
+            sink.place(*args)
+        self._pending.clear()
+
+
+def _hash(source: BinaryIO) -> str:
+    h = hashlib.blake2b()
+    while chunk := source.read(CHUNK_SIZE):
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def _temp_file(target: Path) -> Path:
+    return target.with_name(f'.{target.name}.{uuid.uuid4().hex[:8]}.tmp')
+
+
+def _reflink(source: Path, target: Path):
+    """ 写时复制：共享数据块，修改其中一个文件不影响另一个 """
+    import fcntl
+    with open(source, 'rb') as s, open(target, 'wb') as t:
+        fcntl.ioctl(t.fileno(), FICLONE, s.fileno())
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import time
+from collections import namedtuple
+from importlib import metadata
+from pathlib import Path
+from common.log import log
+from common.sqlite_base import SQLiteBase
+from config import Config
+from .entity.wiz_attachment import WizAttachment
+from .entity.wiz_internal_link import find_internal_links
+from .wiz_image_downloader import find_remote_images
+
+CACHE_VERSION = 1
+""" 缓存格式或转换后处理的规则变化，而 `wiz_md_convertor` 没有改动时，手动加 1 使旧缓存失效 """
+
+CacheEntry = namedtuple('CacheEntry', ['markdown', 'encoding_tier', 'images', 'unresolved_links'])
+""" 一篇笔记的转换缓存：markdown 正文、index.html 的编码检测方式、复制的图片、找不到目标的内链 """
+
+_fingerprint: bytes = None
+
+
+def get_converter_fingerprint() -> bytes:
+    """ 转换器版本指纹：`wiz_md_convertor` 源码（markdownify 的选项、`CustomMarkdownConverter`、`_fix_code_lang` 等）、
+    markdownify 和 BeautifulSoup 的版本、html 解析器；任何一项变化，之前的缓存都不再命中
+    """
+    global _fingerprint
+    if _fingerprint is None:
+        h = hashlib.blake2b(digest_size=16)
+        # 直接读源码文件，不导入模块，避免没有笔记需要转换时也导入 BeautifulSoup、markdownify
+        h.update(Path(__file__).parent.joinpath('markdown', 'wiz_md_convertor.py').read_bytes())
+        for package in ('markdownify', 'beautifulsoup4'):
+            try:
+                h.update(metadata.version(package).encode())
+            except metadata.PackageNotFoundError:
+                pass
+        h.update(f'{CACHE_VERSION}\0{Config.html_parser}'.encode())
+        _fingerprint = h.digest()
+    return _fingerprint
+
+
+def make_cache_key(html_bytes: bytes, attachment_relative_path: str, attachments: dict[str, WizAttachment],
+                   link_targets: dict[str, str], remote_images: dict[str, Path]) -> str:
+    """ 转换缓存的键：index.html 原始字节 + 影响转换结果的上下文 + 转换器版本指纹
+
+    上下文只取这篇笔记用到的部分：附件目录的相对路径、正文中内链指向的笔记路径或附件名、已下载的 http(s) 图片，
+    其他笔记改名不会让这篇笔记的缓存失效
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(get_converter_fingerprint())
+    h.update(html_bytes)
+    h.update(attachment_relative_path.encode())
+    for guid in sorted({guid for _, guid in find_internal_links(html_bytes)}):
+        attachment = attachments.get(guid)
+        h.update(f'\0{guid}\0{link_targets.get(guid)}\0{attachment.name if attachment else None}'.encode())
+    if remote_images:
+        for url in sorted(find_remote_images(html_bytes)):
+            cached_file = remote_images.get(url)
+            h.update(f'\0{url}\0{cached_file.name if cached_file else None}'.encode())
+    return h.hexdigest()
+
+
+class ConversionCache(SQLiteBase):
+
+    def __init__(self, db_path: str = None):
+        """ 转换缓存：index.html 没有变化时，直接使用上次转换的 markdown，不再经过 BeautifulSoup 和 markdownify
+
+        与 ConvertorDB 一样，读取在转换笔记的进程中，写入都在主进程中，批量提交；
+        超过 `Config.conversion_cache_max_bytes` 时，按最近使用时间淘汰
+        """
+        db = Path(db_path or Config.conversion_cache_path)
+        db.parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(str(db))
+        self.query_scalar("PRAGMA journal_mode=WAL;")
+        self.execute("PRAGMA synchronous=NORMAL;")
+        self.execute(
+            """
+            CREATE TABLE IF NOT EXISTS conversion_cache (
+                key TEXT PRIMARY KEY,       -- 见 make_cache_key
+                markdown TEXT NOT NULL,
+                meta TEXT NOT NULL,         -- json：encoding_tier、images、unresolved_links
+                size INTEGER NOT NULL,      -- markdown 与 meta 的字节数，用于淘汰
+                last_used REAL NOT NULL     -- 最近一次写入或命中的时间戳
+            );
+            """
+        )
+        self.execute("CREATE INDEX IF NOT EXISTS idx_conversion_cache_last_used ON conversion_cache(last_used);")
+        self._pending_writes = 0
+
+    def get(self, key: str) -> CacheEntry:
+        row = self.query_one("SELECT markdown, meta FROM conversion_cache WHERE key = ?", (key,))
+        if row is None:
+            return None
+        meta = json.loads(row[1])
+        return CacheEntry(row[0], meta['encoding_tier'], meta['images'], meta['unresolved_links'])
+
+    def put(self, key: str, entry: CacheEntry):
+        meta = json.dumps({'encoding_tier': entry.encoding_tier, 'images': entry.images,
+                           'unresolved_links': entry.unresolved_links}, ensure_ascii=False)
+        size = len(entry.markdown.encode('UTF-8')) + len(meta.encode('UTF-8'))
+        self.execute(
+            "INSERT OR REPLACE INTO conversion_cache(key, markdown, meta, size, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, entry.markdown, meta, size, time.time()), commit=False
+        )
+        self._wrote()
+
+    def touch(self, key: str):
+        """ 命中时更新最近使用时间 """
+        self.execute("UPDATE conversion_cache SET last_used = ? WHERE key = ?", (time.time(), key), commit=False)
+        self._wrote()
+
+    def _wrote(self):
+        self._pending_writes += 1
+        if self._pending_writes >= Config.convertor_db_batch_size:
+            self.commit()
+            self._pending_writes = 0
+
+    def close(self):
+        self.commit()
+        super().close()
+
+    def evict(self, max_bytes: int = None):
+        """ 总大小超过 max_bytes（默认 `Config.conversion_cache_max_bytes`）时，删除最久未使用的缓存 """
+        max_bytes = Config.conversion_cache_max_bytes if max_bytes is None else max_bytes
+        self.commit()
+        self._pending_writes = 0
+        total = self.query_scalar("SELECT COALESCE(SUM(size), 0) FROM conversion_cache")
+        if total <= max_bytes:
+            return
+        # 从最近使用的开始累计大小，超出部分全部删除
+        self.execute(
+            """
+            DELETE FROM conversion_cache WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY last_used DESC, rowid DESC) AS running FROM conversion_cache
+                ) WHERE running > ?
+            )
+            """,
+            (max_bytes,)
+        )
+        log.debug(f'转换缓存超过上限，已淘汰至 {max_bytes} 字节以内')
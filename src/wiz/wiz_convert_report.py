@@ -0,0 +1,136 @@
+import heapq
+from collections import Counter, defaultdict
+from common.log import log
+from config import Config
+from common.utils import format_size
+from .wiz_convert_task import ConvertResult
+
+
+class ConvertReport(object):
+    """ 汇总所有笔记的转换结果，运行结束时统一输出
+    """
+
+    converted: int
+    """ 转换成功的笔记数 """
+
+    failed: int
+    """ 转换失败的笔记数 """
+
+    failed_guids: set[str]
+    """ 转换失败的笔记 guid，监视模式下稍后重试 """
+
+    unresolved_links: Counter
+    """ 找不到目标的内链 guid -> 引用它的笔记数 """
+
+    encoding_tiers: Counter
+    """ 确定 index.html 编码的步骤 -> 笔记数，见 `decode_html` """
+
+    bytes_copied: int
+    bytes_deduplicated: int
+    bytes_skipped: int
+    """ 附件、图片写入的字节数，见 `AttachmentSink` """
+
+    cache_hits: int
+    cache_misses: int
+    """ 转换缓存命中、未命中的笔记数，见 `ConversionCache` """
+
+    stage_times: dict[str, list[float]]
+    """ 阶段名 -> 每篇笔记在该阶段的耗时（秒），见 `StageTimer` """
+
+    note_times: list[float]
+    """ 每篇笔记的总耗时（秒） """
+
+    slow_notes: list[tuple[float, str, str, int, str]]
+    """ 耗时最长的笔记，小顶堆：(耗时, guid, 路径, 大小, 最耗时的阶段) """
+
+    def __init__(self) -> None:
+        self.converted = 0
+        self.failed = 0
+        self.failed_guids = set()
+        self.unresolved_links = Counter()
+        self.encoding_tiers = Counter()
+        self.bytes_copied = 0
+        self.bytes_deduplicated = 0
+        self.bytes_skipped = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.stage_times = defaultdict(list)
+        self.note_times = []
+        self.slow_notes = []
+
+    def add(self, result: ConvertResult):
+        if result.success:
+            self.converted += 1
+        else:
+            self.failed += 1
+            self.failed_guids.add(result.guid)
+        self.unresolved_links.update(result.unresolved_links)
+        if result.encoding_tier:
+            self.encoding_tiers[result.encoding_tier] += 1
+        self.bytes_copied += result.bytes_copied
+        self.bytes_deduplicated += result.bytes_deduplicated
+        self.bytes_skipped += result.bytes_skipped
+        if result.cache_hit:
+            self.cache_hits += 1
+        elif result.cache_key is not None:
+            self.cache_misses += 1
+        self._add_times(result)
+
+    def _add_times(self, result: ConvertResult):
+        self.note_times.append(result.elapsed)
+        for name, seconds in result.stage_times.items():
+            self.stage_times[name].append(seconds)
+
+        if Config.slow_notes_top <= 0:
+            return
+        dominant = max(result.stage_times, key=result.stage_times.get) if result.stage_times else '-'
+        note = (result.elapsed, result.guid, result.path, result.size, dominant)
+        if len(self.slow_notes) < Config.slow_notes_top:
+            heapq.heappush(self.slow_notes, note)
+        else:
+            heapq.heappushpop(self.slow_notes, note)
+
+    def log_summary(self):
+        log.info(f'转换完成：成功 {self.converted} 篇，失败 {self.failed} 篇')
+
+        if self.encoding_tiers:
+            tiers = '，'.join(f'{tier} {count} 篇' for tier, count in self.encoding_tiers.most_common())
+            log.info(f'index.html 编码检测方式：{tiers}')
+
+        if self.bytes_copied or self.bytes_deduplicated or self.bytes_skipped:
+            log.info(f'附件及图片：复制 {format_size(self.bytes_copied)}，去重 {format_size(self.bytes_deduplicated)}，'
+                     f'未变化跳过 {format_size(self.bytes_skipped)}')
+
+        if self.cache_hits or self.cache_misses:
+            log.info(f'转换缓存：命中 {self.cache_hits} 篇，未命中 {self.cache_misses} 篇')
+
+        self._log_times()
+
+        if self.unresolved_links:
+            log.warning(f'有 {len(self.unresolved_links)} 个内链找不到对应的笔记或附件：')
+            for guid, count in self.unresolved_links.most_common():
+                log.warning(f'  {guid}（{count} 篇笔记引用）')
+
+    def _log_times(self):
+        """ 输出各阶段的总耗时、分位数，以及耗时最长的笔记 """
+        if not self.note_times:
+            return
+        log.info('各阶段耗时（秒）：')
+        log.info(f'  {"阶段":<12}{"合计":>10}{"p50":>10}{"p90":>10}{"p99":>10}{"最大":>10}')
+        rows = sorted(self.stage_times.items(), key=lambda item: sum(item[1]), reverse=True)
+        rows.append(('总计', self.note_times))
+        for name, times in rows:
+            times = sorted(times)
+            log.info(f'  {name:<12}{sum(times):>10.3f}{_percentile(times, 50):>10.4f}'
+                     f'{_percentile(times, 90):>10.4f}{_percentile(times, 99):>10.4f}{times[-1]:>10.4f}')
+
+        if self.slow_notes:
+            log.info(f'耗时最长的 {len(self.slow_notes)} 篇笔记：')
+            for elapsed, guid, path, size, dominant in sorted(self.slow_notes, reverse=True):
+                log.info(f'  {elapsed:.3f} 秒  {format_size(size):>10}  {dominant:<12}{guid}  {path}')
+
+
+def _percentile(sorted_values: list[float], percent: int) -> float:
+    """ 最近秩法计算分位数，sorted_values 已从小到大排序 """
+    index = max(0, -(-len(sorted_values) * percent // 100) - 1)
+    return sorted_values[index]
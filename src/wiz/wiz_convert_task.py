@@ -0,0 +1,594 @@
+import cProfile
+import logging
+import os
+import shutil
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler
+from pathlib import Path
+from queue import SimpleQueue
+from zipfile import ZipFile, BadZipFile
+from common.log import log
+from common.stage_timer import StageTimer, stage
+from common.utils import decode_html, atomic_write_text
+from config import Config
+from .entity.wiz_document import WizDocument, FORMAT_STRING
+from .entity.wiz_internal_link import find_internal_links
+from .todolist.wiz_td_convertor import convert_td
+from .wiz_attachment_sink import AttachmentSink, DeferredSink
+from .wiz_conversion_cache import ConversionCache, CacheEntry, make_cache_key
+from .wiz_data_uri import extract_data_uris
+from .wiz_file_index import FileStat, WizFileIndex
+from .wiz_image_downloader import ImageDownloader, find_remote_images
+from .wiz_note_file import WizNoteFile, ZipNoteFile, ExtractedNoteFile, NoteFileError
+
+PARTIAL_SUFFIX = ".partial"
+""" 正在解压的目录后缀，解压完成后改名，程序崩溃时留下的这类目录在启动时删除，见 `ExtractCache` """
+
+
+class ConvertTask(object):
+    """ 单篇笔记的转换任务
+
+    只包含转换一篇笔记所需的信息，多进程转换时会被序列化传给子进程
+    """
+    document: WizDocument
+
+    index: int
+    """ 笔记在待转换笔记中的序号，从 1 开始 """
+
+    need_extract: bool
+    """ 是否需要重新解压 ziw 文件，由主进程根据 ConvertorDB 的记录判断；直接读取压缩包时不需要 """
+
+    size: int
+    """ ziw 文件大小，用于调度：先转换大文件 """
+
+    file_exists: bool
+    """ ziw 文件是否存在，没有下载的笔记只有数据库记录 """
+
+    attachment_stats: dict[str, FileStat]
+    """ 存在的附件：附件名 -> 大小与修改时间 """
+
+    def __init__(self, document: WizDocument, index: int, need_extract: bool, file_index: WizFileIndex) -> None:
+        """
+        Args:
+            file_index (WizFileIndex): 由主进程扫描一次数据目录得到，转换时不再逐个查询文件是否存在
+        """
+        self.document = document
+        self.index = index
+        self.need_extract = need_extract
+        stat = file_index.stat(document.file)
+        self.file_exists = stat is not None
+        self.size = stat.size if stat is not None else 0
+        self.attachment_stats = file_index.get_attachment_stats(document) if stat is not None else {}
+
+
+class ConvertResult(object):
+    """ 单篇笔记的转换结果，由主进程统一写入 ConvertorDB
+    """
+    guid: str
+
+    extract_time: str = None
+    """ 开始解压（或直接读取）ziw 文件的时间，`%Y-%m-%d %H:%M:%S` 格式的本地时间；没有读取时为 None
+
+    记录到 ConvertorDB 的是这个时间而不是保存结果的时间：读取之后、保存之前修改的笔记，下次仍会重新转换
+    """
+
+    extracted_size: int = 0
+    """ 解压到临时目录的文件大小，见 `ExtractCache` """
+
+    success: bool = False
+
+    unresolved_links: set[str]
+    """ 找不到目标的内链 guid """
+
+    links: set[tuple[str, str]]
+    """ 正文中的全部内链：(link_type, guid)，由主进程记录到 ConvertorDB，见 `find_internal_links` """
+
+    encoding_tier: str = None
+    """ 确定 index.html 编码的步骤，见 `decode_html` """
+
+    bytes_copied: int = 0
+    bytes_deduplicated: int = 0
+    bytes_skipped: int = 0
+    """ 附件、图片写入的字节数，见 `AttachmentSink` """
+
+    path: str
+    """ 笔记路径：`location + title` """
+
+    size: int = 0
+    """ ziw 文件大小 """
+
+    elapsed: float = 0
+    """ 转换耗时（秒） """
+
+    stage_times: dict[str, float]
+    """ 各阶段耗时（秒），见 `StageTimer` """
+
+    cache_key: str = None
+    """ 转换缓存的键，没有使用转换缓存时为 None """
+
+    cache_hit: bool = False
+
+    cache_entry: CacheEntry = None
+    """ 未命中时新的转换结果，由主进程写入转换缓存 """
+
+    log_records: list[logging.LogRecord]
+    """ 子进程中转换时产生的日志，交给主进程统一输出，避免多个笔记的日志交错 """
+
+    def __init__(self, guid: str) -> None:
+        self.guid = guid
+        self.unresolved_links = set()
+        self.links = set()
+        self.stage_times = {}
+        self.log_records = []
+
+
+_link_targets: dict[str, str] = {}
+""" 笔记 guid -> 笔记内链路径，见 `WizStorage.get_link_targets` """
+
+_image_downloader: ImageDownloader = None
+""" 下载笔记中的 http(s) 图片，每个进程一个；有笔记用到远程图片时才打开 """
+
+_sink = AttachmentSink()
+""" 附件、图片的写入，每个进程一个，同一进程内的相同内容会去重 """
+
+_conversion_cache: ConversionCache = None
+""" 转换缓存，每个进程一个连接，只读；首次用到时打开 """
+
+_log_queue: SimpleQueue = None
+""" 子进程中收集日志的队列，为 None 表示在主进程中转换，日志直接输出 """
+
+_job_log_records: ContextVar[list] = ContextVar('job_log_records', default=None)
+""" 流水线转换时，当前线程正在处理的笔记的日志，见 `_capture_logs` """
+
+
+class NoteJob(object):
+    """ 流水线转换中一篇笔记的中间状态，依次经过读取、转换、写入三个阶段，见 `ConvertPipeline`
+    """
+    task: ConvertTask
+    result: ConvertResult
+
+    sink: DeferredSink
+    """ 转换阶段只记录附件、图片的写入，由写入阶段执行 """
+
+    note_file: WizNoteFile
+    """ 读取阶段打开的笔记文件，读取失败时为 None """
+
+    target_file: Path
+    content: str
+    """ 要写入 target_file 的内容（front matter 与正文），转换失败时为 None """
+
+    def __init__(self, task: ConvertTask) -> None:
+        document = task.document
+        self.task = task
+        self.result = ConvertResult(document.guid)
+        self.result.path = document.location + document.title
+        self.result.size = task.size
+        self.sink = DeferredSink()
+        self.note_file = None
+        self.target_file = None
+        self.content = None
+
+
+def init_task_context(link_targets: dict[str, str]):
+    """ 设置转换笔记所需的上下文，主进程直接转换时调用
+    """
+    global _link_targets
+    _link_targets = link_targets
+
+
+def close_task_context():
+    """ 主进程直接转换结束后调用：关闭图片下载器，下次转换时重新读取图片缓存，下载失败的图片可以重试
+    """
+    global _image_downloader
+    if _image_downloader is not None:
+        _image_downloader.close()
+        _image_downloader = None
+
+
+def init_worker(link_targets: dict[str, str], config: dict):
+    """ 子进程初始化：设置上下文，同步主进程的配置，并收集日志
+    """
+    global _log_queue
+    init_task_context(link_targets)
+    for key, value in config.items():
+        setattr(Config, key, value)
+
+    _log_queue = SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(_log_queue))
+
+
+def read_note(job: NoteJob):
+    """ 流水线的读取阶段：打开笔记文件，不太大的 ziw 整个读入内存；解压到临时目录时在这里解压
+    """
+    task = job.task
+    with _capture_logs(job.result), StageTimer() as timer:
+        try:
+            if _check_file(task):
+                with stage("unzip"):
+                    job.note_file = _open_note_file(task, job.result, job.sink,
+                                                    prefetch=task.size <= Config.pipeline_prefetch_max_bytes)
+        except NoteFileError as e:
+            log.error(e)
+        except Exception:
+            log.error("处理失败.", exc_info=1)
+    _add_times(job.result, timer)
+
+
+def render_note(job: NoteJob):
+    """ 流水线的转换阶段：html 转为 markdown，附件、图片的写入只记录下来
+    """
+    if job.note_file is None:
+        return
+    with _capture_logs(job.result), StageTimer() as timer, _profile(job.task):
+        try:
+            job.target_file, job.content = _render_note_file(job.task, job.note_file, job.result)
+        except NoteFileError as e:
+            log.error(e)
+        except Exception:
+            log.error("处理失败.", exc_info=1)
+    _add_times(job.result, timer)
+
+
+def write_note(job: NoteJob, sink: AttachmentSink) -> ConvertResult:
+    """ 流水线的写入阶段：复制附件、图片，写入 markdown
+
+    Args:
+        sink (AttachmentSink): 写入线程使用的 sink，这篇笔记写入的字节数从它统计
+    """
+    result = job.result
+    with _capture_logs(result), StageTimer() as timer:
+        try:
+            if job.content is not None:
+                with stage("copy"):
+                    job.sink.flush(sink)
+                _write_note(job.task.document, job.target_file, job.content)
+                result.success = True
+        except Exception:
+            log.error("处理失败.", exc_info=1)
+        finally:
+            if job.note_file is not None:
+                job.note_file.close()
+    _add_times(result, timer)
+    result.bytes_copied, result.bytes_deduplicated, result.bytes_skipped = sink.take_stats()
+    return result
+
+
+@contextmanager
+def _capture_logs(result: ConvertResult):
+    """ 收集这篇笔记在当前线程中的日志，由主进程保存结果时统一输出，避免多篇笔记的日志交错 """
+    token = _job_log_records.set(result.log_records)
+    try:
+        yield
+    finally:
+        _job_log_records.reset(token)
+
+
+def _job_log_filter(record: logging.LogRecord) -> bool:
+    records = _job_log_records.get()
+    if records is None:
+        return True
+    records.append(record)
+    return False
+
+
+log.addFilter(_job_log_filter)
+
+
+def _add_times(result: ConvertResult, timer: StageTimer):
+    result.elapsed += timer.elapsed
+    for name, elapsed in timer.stages.items():
+        result.stage_times[name] = result.stage_times.get(name, 0) + elapsed
+
+
+def convert_document(task: ConvertTask) -> ConvertResult:
+    """ 转换单个笔记，出错时记录日志，不影响后续笔记
+    """
+    document = task.document
+    result = ConvertResult(document.guid)
+    result.path = document.location + document.title
+    result.size = task.size
+    with StageTimer() as timer, _profile(task):
+        try:
+            _convert_document(task, result)
+        except Exception:
+            log.error("处理失败.", exc_info=1)
+    result.elapsed = timer.elapsed
+    result.stage_times = timer.stages
+    result.bytes_copied, result.bytes_deduplicated, result.bytes_skipped = _sink.take_stats()
+
+    while _log_queue is not None and not _log_queue.empty():
+        result.log_records.append(_log_queue.get())
+    return result
+
+
+@contextmanager
+def _profile(task: ConvertTask):
+    """ 按 `Config.profile_notes` 对大笔记做性能分析，结果保存在 `Config.profile_dir`，以笔记 guid 命名
+    """
+    if not Config.profile_notes or task.size < Config.profile_threshold:
+        yield
+        return
+
+    profile_dir = Path(Config.profile_dir)
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    if Config.profile_notes == 'cprofile':
+        profile_file = profile_dir.joinpath(f'{task.document.guid}.prof')
+        with cProfile.Profile() as profiler:
+            yield
+        profiler.dump_stats(profile_file)
+    elif Config.profile_notes == 'tracemalloc':
+        profile_file = profile_dir.joinpath(f'{task.document.guid}.tracemalloc.txt')
+        tracemalloc.start()
+        try:
+            yield
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        lines = [f'peak: {peak / 1024:.1f} KiB'] + [str(stat) for stat in snapshot.statistics('lineno')[:30]]
+        profile_file.write_text('\n'.join(lines), 'UTF-8')
+    else:
+        log.warning(f'不支持的性能分析方式：{Config.profile_notes}')
+        yield
+        return
+    log.info(f'性能分析结果：{profile_file}')
+
+
+def _convert_document(task: ConvertTask, result: ConvertResult):
+    document = task.document
+
+    # 转换前，做一些必要的检查
+    if not _check_file(task):
+        return
+
+    # `.ziw`笔记文件，是个压缩包，直接读取或解压
+    try:
+        with stage("unzip"):
+            note_file = _open_note_file(task, result, _sink)
+    except NoteFileError as e:
+        log.error(e)
+        return
+
+    with note_file:
+        try:
+            target_file, content = _render_note_file(task, note_file, result)
+            _write_note(document, target_file, content)
+        except NoteFileError as e:
+            log.error(e)
+            return
+    result.success = True
+
+
+def _check_file(task: ConvertTask) -> bool:
+    """ ziw 文件是否存在，没有下载的笔记只有数据库记录 """
+    if not task.file_exists:
+        log.error('没找到笔记文件，请先下载！')
+        log.debug(f'找不到笔记文件 `{task.document.file}`')
+        return False
+    return True
+
+
+def _render_note_file(task: ConvertTask, note_file: WizNoteFile, result: ConvertResult) -> tuple[Path, str]:
+    """ 从笔记文件中读取内容，转换为 markdown；附件、图片通过 `note_file.sink` 写入
+
+    Returns:
+        tuple[Path, str]: 输出文件、要写入的内容（front matter 与正文）
+    """
+    document = task.document
+    # 默认使用笔记名做为文件名，如果因含有特殊字符而调整过，给出提示
+    if document.title != document.output_file_name:
+        log.debug(f"文件名含有特殊字符，已做处理 `{document.title}` -> `{document.output_file_name}`")
+
+    # 拼接输出文件的全路径，所在文件夹已由主进程统一创建
+    target_file = get_target_file(document)
+
+    # 提取附件
+    target_attachments_dir = Path(str(target_file) + "_Attachments")
+    with stage("attachments"):
+        _convert_attachments(document, target_attachments_dir, note_file.sink, task.attachment_stats)
+
+    # 不同笔记类型，转md
+    target_file = Path(str(target_file) + ".md")
+    if document.is_todolist(note_file):
+        with stage("todolist"):
+            markdown = convert_td(note_file)
+    else:
+        markdown = _convert_html(document, note_file, target_attachments_dir, result)
+        markdown = markdown.replace("\r\n", "\n")  #避免多余的空行
+        if markdown == "":
+            log.warning("Markdown is empty.")
+        if document.is_markdown():
+            markdown = markdown.replace('\xa0',' ') #将特殊空格替换为普通空格
+
+    return target_file, build_front_matter(document) + "\n" + markdown
+
+
+def _write_note(document: WizDocument, target_file: Path, content: str):
+    # front matter 与正文拼接好后一次写入，写临时文件再改名，中途崩溃不会留下不完整的笔记
+    with stage("write"):
+        atomic_write_text(target_file, content)
+
+        # 更新修改时间及访问时间
+        os.utime(target_file, (document.get_accessed(), document.get_modified()))
+
+
+def _convert_html(document: WizDocument, note_file: WizNoteFile, target_attachments_dir: Path, result: ConvertResult) -> str:
+    """ index.html 转为 markdown
+
+    开启转换缓存时，index.html 与相关上下文都没有变化，直接使用缓存的 markdown，只重新复制图片
+    """
+    # BeautifulSoup、markdownify 导入较慢，有笔记需要转换时才导入
+    from .markdown.wiz_md_convertor import wiz_html_to_md, copy_images, get_attachment_relative_path
+    html_bytes = note_file.read_index_html()
+    if Config.extract_data_uris:
+        # 先把 data URI 图片提取为文件，转换缓存的键、html 解析都不再涉及大段的 base64
+        with stage("data_uri"):
+            html_bytes = extract_data_uris(html_bytes, note_file, target_attachments_dir, document.get_modified())
+    attachments = document.attachments_by_guid
+    result.links = find_internal_links(html_bytes)
+    remote_images = _download_remote_images(html_bytes)
+    if Config.conversion_cache:
+        with stage("cache"):
+            result.cache_key = make_cache_key(html_bytes, get_attachment_relative_path(target_attachments_dir),
+                                              attachments, _link_targets, remote_images)
+            entry = _get_conversion_cache().get(result.cache_key)
+        if entry is not None:
+            log.debug("命中转换缓存")
+            result.cache_hit = True
+            result.encoding_tier = entry.encoding_tier
+            result.unresolved_links.update(entry.unresolved_links)
+            with stage("images"):
+                copy_images(note_file, entry.images, target_attachments_dir, remote_images)
+            return entry.markdown
+
+    with stage("decode"):
+        html_content, result.encoding_tier = decode_html(html_bytes)
+    log.debug(f"index.html 编码检测方式：{result.encoding_tier}")
+    copied_images = []
+    markdown = wiz_html_to_md(html_content, note_file, attachments, target_attachments_dir, _link_targets,
+                              result.unresolved_links, remote_images, copied_images)
+    if result.cache_key is not None:
+        result.cache_entry = CacheEntry(markdown, result.encoding_tier, copied_images, sorted(result.unresolved_links))
+    return markdown
+
+
+def _download_remote_images(html_bytes: bytes) -> dict[str, Path]:
+    """ 下载这篇笔记中的 http(s) 图片，转换时替换为本地图片；下载失败的图片，笔记中继续使用原地址
+
+    Returns:
+        dict[str, Path]: url -> 缓存文件
+    """
+    global _image_downloader
+    if not Config.download_images:
+        return {}
+    urls = find_remote_images(html_bytes)
+    if not urls:
+        return {}
+    with stage("download"):
+        if _image_downloader is None:
+            _image_downloader = ImageDownloader()
+        return _image_downloader.download_all(urls)
+
+
+def _get_conversion_cache() -> ConversionCache:
+    global _conversion_cache
+    if _conversion_cache is None:
+        _conversion_cache = ConversionCache()
+    return _conversion_cache
+
+
+def get_target_file(document: WizDocument) -> Path:
+    """ 笔记的输出路径，不含 `.md` 后缀，附件目录为该路径加上 `_Attachments`
+    """
+    return Path(str(Path(Config.output_dir)) + document.location + document.output_file_name).expanduser()
+
+
+def _open_note_file(task: ConvertTask, result: ConvertResult, sink: AttachmentSink, prefetch: bool = False) -> WizNoteFile:
+    """ 打开笔记文件：直接读取压缩包，或解压到临时目录后读取
+
+    Args:
+        prefetch (bool): 直接读取压缩包时，是否先把整个 ziw 文件读入内存
+    """
+    document = task.document
+    if Config.stream_from_zip:
+        extract_time = _now()
+        note_file = ZipNoteFile(document.file, sink, document.file.read_bytes() if prefetch else None)
+        result.extract_time = extract_time
+        return note_file
+
+    file_extract_dir = _extract_zip(task, result)
+    log.debug(f"解压缩路径：{file_extract_dir}")
+    return ExtractedNoteFile(file_extract_dir, sink)
+
+
+def _extract_zip(task: ConvertTask, result: ConvertResult) -> Path:
+    """ 解压缩当前文档的 zip 文件到 work_dir，以 guid 为子文件夹名称
+    """
+    document = task.document
+    file_extract_dir = Path(Config.temp_dir).joinpath(document.guid)
+    # 如果目标文件夹已经存在，并且解压后笔记文件没有更新，就不解压了
+    if not task.need_extract:
+        return file_extract_dir
+
+    # 先解压到临时名称的目录，解压完成后再改名，中途崩溃不会留下不完整的解压目录
+    partial_dir = Path(str(file_extract_dir) + PARTIAL_SUFFIX)
+    extract_time = _now()
+    try:
+        with ZipFile(document.file) as zip_file:
+            zip_file.extractall(partial_dir)
+            result.extracted_size = sum(info.file_size for info in zip_file.infolist())
+    except BadZipFile:
+        shutil.rmtree(partial_dir, ignore_errors=True)
+        raise NoteFileError('解压失败，该笔记可能是加密笔记，请先解密')
+    shutil.rmtree(file_extract_dir, ignore_errors=True)
+    os.replace(partial_dir, file_extract_dir)
+    result.extract_time = extract_time
+    return file_extract_dir
+
+
+def _now() -> str:
+    """ 当前的本地时间，与为知的 `DT_MODIFIED` 格式相同 """
+    return datetime.now().strftime(FORMAT_STRING)
+
+
+def _convert_attachments(document: WizDocument, target_attachments_dir: Path, sink: AttachmentSink,
+                         attachment_stats: dict[str, FileStat]):
+    """
+    笔记如有附件，附件释放到 `target_attachments_dir`
+
+    Args:
+        target_attachments_dir (Path): 附件要释放到的目录
+        sink (AttachmentSink): 附件通过它写入
+        attachment_stats (dict[str, FileStat]): 存在的附件的大小与修改时间，见 `ConvertTask.attachment_stats`
+    """
+    if len(document.attachments) != document.attachment_count:
+        log.warning(f'附件数量不匹配，应有附件数：{document.attachment_count}，实有附件数：{len(document.attachments)}！')
+
+    if len(document.attachments) == 0:
+        log.debug("没有附件")
+        return
+    if not target_attachments_dir.exists():
+        target_attachments_dir.mkdir(parents=True, exist_ok=True)
+    for attachment in document.attachments:
+        attachment_file = document.attachments_dir.joinpath(attachment.name)
+        stat = attachment_stats.get(attachment.name)
+        if stat is None:
+            log.warning(f"{attachment_file} 附件未找到")
+            continue
+        # 与 copy2 一样保留修改时间，内容未变化时跳过；流水线转换时延后打开，文件名要绑定到 lambda 上
+        sink.place(target_attachments_dir.joinpath(attachment.name), stat.size, stat.mtime,
+                   lambda file=attachment_file: open(file, 'rb'))
+
+
+def build_front_matter(document: WizDocument) -> str:
+    """ 生成 front matter
+    """
+    front_matter = ["---"]
+
+    # wiz document guid
+    front_matter.append(f"wiz-guid: {document.guid}")
+
+    # tags 标签
+    if len(document.tags)>0:
+        tags = "\n".join([f'  - {tag.nesting_name}' for tag in document.tags])
+        front_matter.append(f"tags:\n{tags}")
+
+    # date 创建时间
+    front_matter.append(f"cdate: {document.created}")
+
+    # aliases 标题别名： 原始笔记名修改过，则添加
+    if document.title != document.output_file_name:
+        front_matter.append(f'aliases: \n  - {document.title}')
+
+    # 剪辑来源网址
+    if document.url:
+        front_matter.append(f"source: {document.url}")
+
+    front_matter.append("---")
+    return "\n".join(front_matter)
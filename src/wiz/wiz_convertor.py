@@ -1,176 +1,218 @@
-import os
-import shutil
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from common.log import log
 from pathlib import Path
-from zipfile import ZipFile, BadZipFile
 from config import Config
-from convertor_db import ConvertorDB
+from convertor_db import ConvertorDB, ConvertorState
 from .entity.wiz_document import WizDocument
-from .markdown.wiz_md_convertor import wiz_html_to_md
-from .todolist.wiz_td_convertor import convert_td
+from .wiz_convert_task import (ConvertTask, ConvertResult, convert_document, get_target_file, init_task_context,
+                                close_task_context, init_worker)
+from .wiz_convert_report import ConvertReport
+from .wiz_document_filter import WizDocumentFilter
+from .wiz_conversion_cache import ConversionCache
+from .wiz_extract_cache import ExtractCache
+from .wiz_file_index import WizFileIndex
+from .wiz_pipeline import ConvertPipeline
 from .wiz_storage import WizStorage
-
-
-def _convert_attachments(document: WizDocument, target_attachments_dir: Path):
-    """
-    笔记如有附件，附件释放到 `target_attachments_dir`
-
-    Args:
-        target_attachments_dir (Path): 附件要释放到的目录
-    """
-    if len(document.attachments) != document.attachment_count:
-        log.warning(f'附件数量不匹配，应有附件数：{document.attachment_count}，实有附件数：{len(document.attachments)}！')
-
-    if len(document.attachments) == 0:
-        log.debug("没有附件")
-        return
-    if not target_attachments_dir.exists():
-        target_attachments_dir.mkdir(parents=True)
-    for attachment in document.attachments:
-        attachment_file = document.attachments_dir.joinpath(attachment.name)
-        if not attachment_file.exists():
-            log.warning(f"{attachment_file} 附件未找到")
-            continue
-        # copy2 拷贝文件，且保留文件属性
-        shutil.copy2(attachment_file, target_attachments_dir)
-
-
-def _add_front_matter_and_update_time(file: Path, document: WizDocument):
-    """ 添加 front matter
-    """
-    front_matter = ["---"]
-
-    # wiz document guid
-    front_matter.append(f"wiz-guid: {document.guid}")
-
-    # tags 标签
-    if len(document.tags)>0:
-        tags = "\n".join([f'  - {tag.nesting_name}' for tag in document.tags])
-        front_matter.append(f"tags:\n{tags}")
-        
-    # date 创建时间
-    front_matter.append(f"cdate: {document.created}")
-
-    # aliases 标题别名： 原始笔记名修改过，则添加
-    if document.title != document.output_file_name:
-        front_matter.append(f'aliases: \n  - {document.title}')
-
-    # 剪辑来源网址
-    if document.url:
-        front_matter.append(f"source: {document.url}")
-
-    front_matter.append("---")
-
-    text = file.read_text("UTF-8")
-    text =  "\n".join(front_matter) + "\n" + text
-    file.write_text(text, "UTF-8")
-
-    # 更新修改时间及访问时间
-    os.utime(file, (document.get_accessed(), document.get_modified()))
+from .wiz_sync_plan import WizSyncPlan
 
 
 class WizConvertor(object):
     wiz_storage: WizStorage
     convertor_db: ConvertorDB
+    document_filter: WizDocumentFilter
+    """ 只处理符合条件的笔记，为 None 时处理全部笔记 """
+    documents: list[WizDocument]
+    """ 只同步这些笔记（如监视模式下修改过的笔记），为 None 时同步为知中的全部笔记 """
+    report: ConvertReport
+    conversion_cache: ConversionCache
+    """ 转换缓存的写入，读取在转换笔记时进行，见 `wiz_convert_task` """
+    extract_cache: ExtractCache
+    """ 管理解压目录，直接读取压缩包时为 None """
     temp_dir = Path(Config.temp_dir)
     target_dir = Path(Config.output_dir)
     """ 转换后笔记的相关文件，输出在这个目录下 """
 
-    def __init__(self, convertor_db: ConvertorDB, wiz_storage: WizStorage):
+    def __init__(self, convertor_db: ConvertorDB, wiz_storage: WizStorage, document_filter: WizDocumentFilter = None,
+                 documents: list[WizDocument] = None):
         """ 为知笔记转换器，重点是html转为md
+
+        `Config.jobs` 大于 1 时，使用多进程并行转换
         """
         self.convertor_db = convertor_db
         self.wiz_storage = wiz_storage
+        self.document_filter = document_filter if document_filter and not document_filter.is_empty() else None
+        self.documents = documents
+        self.report = ConvertReport()
+        self.conversion_cache = ConversionCache() if Config.conversion_cache else None
+        self.temp_dir = Path(Config.temp_dir)
+        self.target_dir = Path(Config.output_dir)
         if not self.target_dir.exists():
-            self.target_dir.mkdir()
-        if not self.temp_dir.exists():
-            self.temp_dir.mkdir()
-        
+            self.target_dir.mkdir(parents=True)
+        self.extract_cache = None
+        if not Config.stream_from_zip:
+            self.temp_dir.mkdir(parents=True, exist_ok=True)
+            self.extract_cache = ExtractCache(self.temp_dir)
+
         self._convert_all_document()
 
     def _convert_all_document(self):
         """ 转换所有笔记
         """
-        index = 0
-        for document in self.wiz_storage.documents:
-            index += 1
+        try:
+            # 对比为知数据库与转换记录得出同步计划，先执行移动、删除
+            plan = self._make_plan()
+            plan.log_summary()
+            # 解压目录对账要用到全部转换记录，同步计划可能只读出了需要处理的记录
+            states = self.convertor_db.get_all_state() if self.extract_cache is not None else None
+            plan.apply(self.convertor_db)
+            plan.add_link_dependents(self.convertor_db, self.wiz_storage, self.document_filter)
+            if self.extract_cache is not None:
+                self.extract_cache.reconcile(states, {guid for guid, _ in plan.deleted}, self.convertor_db)
+
+            tasks = self._prepare_tasks(plan)
+            self._make_target_dirs(tasks)
+            if Config.jobs > 1:
+                self._convert_parallel(tasks)
+            elif Config.pipeline and len(tasks) > 1:
+                self._convert_pipeline(tasks)
+            else:
+                self._convert_sequential(tasks)
+        finally:
+            # 提交最后一批未提交的转换记录
+            self.convertor_db.flush()
+            if self.conversion_cache is not None:
+                self.conversion_cache.evict()
+                self.conversion_cache.close()
+        self.report.log_summary()
+
+    def _make_plan(self) -> WizSyncPlan:
+        """ 生成同步计划；筛选笔记时，筛选范围外的笔记既不转换，也不删除
+        """
+        if self.documents is None and self.document_filter is None:
+            return WizSyncPlan.from_index(self.wiz_storage, self.convertor_db)
+
+        documents = self.wiz_storage.iter_documents() if self.documents is None else self.documents
+        delete_scope = None
+        if self.document_filter is not None:
+            log.info(f'只处理符合条件的笔记：{self.document_filter}')
+            documents = self.document_filter.apply(documents)
+            delete_scope = self.document_filter.in_delete_scope
+        # 判断笔记是否已删除，要对比为知中的全部笔记，而不只是要处理的笔记
+        return WizSyncPlan(documents, self.convertor_db, all_guids=set(self.wiz_storage.get_link_targets()),
+                           delete_scope=delete_scope)
+
+    def _prepare_tasks(self, plan: WizSyncPlan) -> list[ConvertTask]:
+        """ 按同步计划，生成所有待转换笔记的转换任务
+        """
+        tasks: list[ConvertTask] = []
+        documents = plan.get_pending_documents()
+        # 一次扫描得出所有笔记文件、附件是否存在，转换开始前先汇报缺失的文件
+        file_index = WizFileIndex(documents)
+        file_index.log_missing(documents)
+        for document in documents:
             try:
-                self._convert_document(document, index, len(self.wiz_storage.documents))
+                tasks.append(self._prepare_task(document, len(tasks) + 1, plan.states.get(document.guid), file_index))
             except Exception:
                 log.error("处理失败.", exc_info=1)
+        return tasks
 
-    def _convert_document(self, document: WizDocument, index: int, total: int):
-        """ 转换单个笔记
+    def _make_target_dirs(self, tasks: list[ConvertTask]):
+        """ 统一创建待转换笔记的输出文件夹，每个文件夹只创建一次，转换每篇笔记时不必再检查
         """
-        if not Config.always_convert:
-            is_converted = self.convertor_db.is_converted(document)
-            if is_converted:
-                log.debug(f"({index}/{total}) {document.location}{document.title}")
-                log.debug('已处理过，跳过.')
-                return
-
-        print('')
-        print(f"({index}/{total}) {document.location}{document.title}")
-
-        # 转换前，做一些必要的检查
-        if not document.file.exists():
-            log.error('没找到笔记文件，请先下载！')
-            log.debug(f'找不到笔记文件 `{document.file}`')
-            return
-
-        # `.ziw`笔记文件，是个压缩包，解压
-        file_extract_dir = self._extract_zip(document)
-        log.debug(f"解压缩路径：{file_extract_dir}")
-        if file_extract_dir is None:
-            return
-        # 解压后的`index.html`是笔记的内容
-        index_html_file = file_extract_dir.joinpath("index.html")
-        if not index_html_file.exists():
-            log.errorr(f"主文档文件不存在！ {index_html_file}")
-            return
-        
-        # 默认使用笔记名做为文件名，如果因含有特殊字符而调整过，给出提示
-        if document.title != document.output_file_name:
-            log.debug(f"文件名含有特殊字符，已做处理 `{document.title}` -> `{document.output_file_name}`")            
-
-        # 拼接输出文件的全路径，并创建相应文件夹
-        target_file = Path(str(self.target_dir) + document.location + document.output_file_name).expanduser()
-        if not target_file.parent.exists():
-            target_file.parent.mkdir(parents=True)
-
-        # 提取附件
-        target_attachments_dir = Path(str(target_file) + "_Attachments")
-        _convert_attachments(document, target_attachments_dir)
-
-        # 不同笔记类型，转md
-        target_file = Path(str(target_file) + ".md")
-        if document.is_todolist(file_extract_dir):
-            convert_td(file_extract_dir, target_file)
-        else:
-            markdown = wiz_html_to_md(index_html_file, document.attachments, target_attachments_dir, self.wiz_storage)
-            markdown = markdown.replace("\r\n", "\n")  #避免多余的空行
-            if markdown == "":
-                log.warning("Markdown is empty.")
-            if document.is_markdown():
-                markdown = markdown.replace('\xa0',' ') #将特殊空格替换为普通空格
-            target_file.write_text(markdown, "UTF-8")
-
-        _add_front_matter_and_update_time(target_file, document)
-        self.convertor_db.save_result(document.guid, True)
-        print('ok')
-
-    def _extract_zip(self, document: WizDocument) -> Path:
-        """ 解压缩当前文档的 zip 文件到 work_dir，以 guid 为子文件夹名称
+        for target_dir in {get_target_file(task.document).parent for task in tasks}:
+            target_dir.mkdir(parents=True, exist_ok=True)
+
+    def _convert_sequential(self, tasks: list[ConvertTask]):
+        """ 在当前进程中逐个转换笔记
         """
-        file_extract_dir = self.temp_dir.joinpath(document.guid)
-        # 如果目标文件夹已经存在，并且解压后笔记文件没有更新，就不解压了
-        if file_extract_dir.exists() and not self.convertor_db.is_modified_after_extract(document):
-            return file_extract_dir
+        init_task_context(self.wiz_storage.get_link_targets())
+        try:
+            for task in tasks:
+                document = task.document
+                print('')
+                print(f"({task.index}/{len(tasks)}) {document.location}{document.title}")
+                try:
+                    self._save_result(convert_document(task))
+                except Exception:
+                    log.error("处理失败.", exc_info=1)
+        finally:
+            close_task_context()
+
+    def _convert_pipeline(self, tasks: list[ConvertTask]):
+        """ 在当前进程中流水线转换：读取、转换、写入在不同线程中重叠执行，见 `ConvertPipeline`
+        """
+        init_task_context(self.wiz_storage.get_link_targets())
+        done = 0
+
+        def on_result(result: ConvertResult):
+            nonlocal done
+            done += 1
+            print('')
+            print(f"({done}/{len(tasks)}) {result.path}")
+            try:
+                self._save_result(result)
+            except Exception:
+                log.error("处理失败.", exc_info=1)
 
         try:
-            zip_file = ZipFile(document.file)
-            zip_file.extractall(file_extract_dir)
-            self.convertor_db.save_extract_time(document.guid)
-            return file_extract_dir
-        except BadZipFile:
-            log.error('解压失败，该笔记可能是加密笔记，请先解密')
+            ConvertPipeline(tasks, on_result).run()
+        finally:
+            close_task_context()
+
+    def _convert_parallel(self, tasks: list[ConvertTask]):
+        """ 多进程转换笔记
+
+        子进程只负责转换，ConvertorDB 的读写都在主进程中完成；
+        ziw 文件大的笔记先转换，避免最后剩下一个大笔记拖长总耗时。
+        """
+        tasks = sorted(tasks, key=lambda t: t.size, reverse=True)
+        log.info(f'待转换笔记 {len(tasks)} 篇，使用 {Config.jobs} 个进程')
+
+        config = {key: value for key, value in vars(Config).items() if not key.startswith('_')}
+        with ProcessPoolExecutor(max_workers=Config.jobs, initializer=init_worker,
+                                 initargs=(self.wiz_storage.get_link_targets(), config)) as executor:
+            futures = {executor.submit(convert_document, task): task for task in tasks}
+            for done, future in enumerate(as_completed(futures), 1):
+                document = futures[future].document
+                print('')
+                print(f"({done}/{len(tasks)}) {document.location}{document.title}")
+                try:
+                    self._save_result(future.result())
+                except Exception:
+                    log.error("处理失败.", exc_info=1)
+
+    def _prepare_task(self, document: WizDocument, index: int, state: ConvertorState, file_index: WizFileIndex) -> ConvertTask:
+        """ 生成转换任务
+
+        Args:
+            state (ConvertorState): 笔记的转换记录，新笔记为 None
+        """
+        # 如果解压目录已经存在，并且解压后笔记文件没有更新，就不解压了
+        need_extract = False
+        if self.extract_cache is not None:
+            self.extract_cache.use(document.guid)
+            file_extract_dir = self.temp_dir.joinpath(document.guid)
+            need_extract = (not file_extract_dir.exists() or state is None or not state.extract_time
+                            or state.extract_time < document.modified)
+        return ConvertTask(document, index, need_extract, file_index)
+
+    def _save_result(self, result: ConvertResult):
+        """ 输出子进程的日志，并记录转换结果
+        """
+        for record in result.log_records:
+            logging.getLogger(record.name).handle(record)
+        self.report.add(result)
+
+        if result.extract_time is not None:
+            self.convertor_db.save_extract_time(result.guid, result.extract_time)
+        if self.extract_cache is not None:
+            self.extract_cache.release(result)
+        if result.success:
+            self.convertor_db.save_result(result.guid, True)
+            self.convertor_db.save_links(result.guid, result.links)
+            if result.cache_entry is not None:
+                self.conversion_cache.put(result.cache_key, result.cache_entry)
+            elif result.cache_hit:
+                self.conversion_cache.touch(result.cache_key)
+            print('ok')
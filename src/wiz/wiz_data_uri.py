@@ -0,0 +1,124 @@
+import binascii
+import hashlib
+import io
+import mimetypes
+import re
+from pathlib import Path
+from common.log import log
+from .wiz_note_file import WizNoteFile
+
+# <img src="data:image/png;base64,iVBORw0KGgo...">
+_DATA_URI_SRC = re.compile(rb'(?<![\w-])(src\s*=\s*)(["\'])data:image/([\w.+-]+);base64,', re.IGNORECASE)
+
+_BASE64_END = re.compile(rb'[^A-Za-z0-9+/=\s]')
+""" base64 内容之后的第一个字符，应当是引号 """
+
+_WHITESPACE = re.compile(rb'\s+')
+
+_BASE64_PADDING = re.compile(rb'[^=]*={0,2}')
+""" = 只能出现在末尾，最多 2 个 """
+
+DECODE_CHUNK_SIZE = 1024 * 1024
+""" 每次解码的 base64 字节数，是 4 的倍数 """
+
+FILE_NAME_PREFIX = 'data-'
+""" 提取出的图片文件名前缀，与 `index_files/` 下原有的资源区分 """
+
+
+def extract_data_uris(html_body_bytes: bytes, note_file: WizNoteFile, target_attachments_dir: Path, mtime: float) -> bytes:
+    """ 在解析 html 之前，把 index.html 原始字节中 `data:image/...;base64,` 的图片提取为附件目录下的文件
+
+    - base64 内容分块解码，直接写入文件，不生成完整的解码结果，也不进入 BeautifulSoup 和 markdown
+    - src 替换为 `index_files/data-<内容哈希>.<扩展名>`，之后与 ziw 中的图片一样转为 obsidian 的内链图片
+    - 内容相同的图片只写入一次，文件名相同；替换后的 src 记录在 `note_file.inline_resources` 中
+
+    Returns:
+        bytes: 替换后的 index.html，没有 data URI 时原样返回
+    """
+    parts = []
+    pos = 0
+    for match in _DATA_URI_SRC.finditer(html_body_bytes):
+        start = match.end()
+        if start < pos:
+            continue
+        end_match = _BASE64_END.search(html_body_bytes, start)
+        end = end_match.start() if end_match else len(html_body_bytes)
+        if html_body_bytes[end:end + 1] != match.group(2):
+            # 不是完整的 base64 内容（如 url 编码过），保留原样
+            continue
+
+        payload = memoryview(html_body_bytes)[start:end]
+        src = _place(payload, match.group(3).decode('ascii').lower(), note_file, target_attachments_dir, mtime)
+        if src is None:
+            continue
+        parts += [html_body_bytes[pos:match.start()], match.group(1), match.group(2), src.encode('ascii')]
+        pos = end
+
+    if not parts:
+        return html_body_bytes
+    parts.append(html_body_bytes[pos:])
+    log.debug(f'提取 data URI 图片 {len(note_file.inline_resources)} 个')
+    return b''.join(parts)
+
+
+def _place(payload: memoryview, subtype: str, note_file: WizNoteFile, target_attachments_dir: Path, mtime: float) -> str:
+    """ 记录图片的写入，返回替换后的 src；base64 内容有误时返回 None，保留原来的 src """
+    if _WHITESPACE.search(payload) or len(payload) % 4:
+        # 换行折叠过、或省略了末尾 = 的 base64，整理后才能分块解码
+        payload = _WHITESPACE.sub(b'', payload)
+        payload = memoryview(payload + b'=' * (-len(payload) % 4))
+    if not _is_valid_base64(payload):
+        log.warning(f'data URI 图片（image/{subtype}）的 base64 内容有误，保留原样')
+        return None
+    digest = hashlib.blake2b(payload, digest_size=10).hexdigest()
+    src = f'index_files/{FILE_NAME_PREFIX}{digest}{_suffix(subtype)}'
+    if src in note_file.inline_resources:
+        return src
+
+    if not target_attachments_dir.exists():
+        target_attachments_dir.mkdir(parents=True, exist_ok=True)
+    size = len(payload) // 4 * 3 - bytes(payload[-2:]).count(b'=')
+    note_file.sink.place(target_attachments_dir.joinpath(Path(src).name), size, mtime, lambda: _Base64Reader(payload))
+    note_file.inline_resources.add(src)
+    return src
+
+
+def _is_valid_base64(payload: memoryview) -> bool:
+    """ 写入时才分块解码，这里先检查结构：长度是 4 的倍数，= 只出现在末尾且不超过 2 个
+
+    字符集已由 `_BASE64_END` 限定，满足这些条件就能正常解码
+    """
+    return len(payload) > 0 and len(payload) % 4 == 0 and _BASE64_PADDING.fullmatch(payload) is not None
+
+
+def _suffix(subtype: str) -> str:
+    """ image/png -> .png，image/svg+xml -> .svg """
+    suffix = mimetypes.guess_extension(f'image/{subtype}')
+    if suffix is None:
+        suffix = '.' + re.sub(r'[^a-z0-9]', '', subtype.split('+')[0])[:5]
+    return suffix
+
+
+class _Base64Reader(io.RawIOBase):
+    """ 以文件的方式读取 base64 内容解码后的字节，每次只解码一块 """
+
+    def __init__(self, payload: memoryview) -> None:
+        self._payload = payload
+        self._pos = 0
+        self._buffer = b''
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = len(self._payload)
+        while len(self._buffer) < size and self._pos < len(self._payload):
+            chunk = self._payload[self._pos:self._pos + DECODE_CHUNK_SIZE]
+            self._pos += len(chunk)
+            try:
+                self._buffer += binascii.a2b_base64(chunk)
+            except binascii.Error as e:
+                raise ValueError(f'data URI 图片的 base64 内容有误：{e}')
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
@@ -27,42 +27,128 @@ class WizDB(SQLiteBase):
             (document_guid,)
         )
 
-    def get_all_document(self):
-        """ 获取所有文档信息
+    def get_document_page(self, after_rowid: int, limit: int) -> list:
+        """ 按 rowid 分页获取文档信息，每行第一列为 rowid，用于下一页的 `after_rowid`
         """
         return self.query_list(
             '''
+            SELECT
+                rowid, DOCUMENT_GUID, DOCUMENT_TITLE, DOCUMENT_LOCATION, DOCUMENT_NAME,
+                DOCUMENT_TYPE, DT_CREATED, DT_MODIFIED, DT_ACCESSED, DOCUMENT_URL,
+                DOCUMENT_ATTACHEMENT_COUNT as DOCUMENT_ATTACHMENT_COUNT
+            FROM WIZ_DOCUMENT
+            WHERE rowid > ?
+            ORDER BY rowid
+            LIMIT ?
+            ''',
+            (after_rowid, limit)
+        )
+
+    def get_documents(self, document_guids: list[str]) -> list:
+        """ 按 guid 批量获取文档信息
+        """
+        placeholders = ','.join('?' * len(document_guids))
+        return self.query_list(
+            f'''
             SELECT
                 DOCUMENT_GUID, DOCUMENT_TITLE, DOCUMENT_LOCATION, DOCUMENT_NAME,
                 DOCUMENT_TYPE, DT_CREATED, DT_MODIFIED, DT_ACCESSED, DOCUMENT_URL,
                 DOCUMENT_ATTACHEMENT_COUNT as DOCUMENT_ATTACHMENT_COUNT
             FROM WIZ_DOCUMENT
+            WHERE DOCUMENT_GUID IN ({placeholders})
+            ORDER BY rowid
+            ''',
+            document_guids
+        )
+
+    def attach_convertor_db(self, convertor_db_path: str):
+        """ 把 ConvertorDB 附加到为知数据库的连接上，命名为 `convertor`，用一条 SQL 对比两边的记录
+        """
+        if 'convertor' not in {row[1] for row in self.query_list("PRAGMA database_list")}:
+            self.execute("ATTACH DATABASE ? AS convertor", (convertor_db_path,))
+
+    def get_sync_pending(self, always_convert: bool) -> list:
+        """ 与附加的 ConvertorDB 对比，获取需要处理（新增、更新、移动）的文档，按 rowid 排序
+
+        每行为文档信息（同 `get_document`）加上转换记录（同 `ConvertorState`），新文档的转换记录为 NULL；
+        判断条件与 `WizSyncPlan` 一致，无变化的文档不返回
+        """
+        return self.query_list(
             '''
+            SELECT
+                d.DOCUMENT_GUID, d.DOCUMENT_TITLE, d.DOCUMENT_LOCATION, d.DOCUMENT_NAME,
+                d.DOCUMENT_TYPE, d.DT_CREATED, d.DT_MODIFIED, d.DT_ACCESSED, d.DOCUMENT_URL,
+                d.DOCUMENT_ATTACHEMENT_COUNT as DOCUMENT_ATTACHMENT_COUNT,
+                c.location, c.name, c.title, c.file_name, c.success, c.extract_time
+            FROM WIZ_DOCUMENT d
+            LEFT JOIN convertor.wiz_convertor c ON c.guid = d.DOCUMENT_GUID
+            WHERE c.guid IS NULL OR ?
+                OR NOT COALESCE(c.success, 0) OR COALESCE(c.extract_time, '') = '' OR c.extract_time < d.DT_MODIFIED
+                OR c.location IS NOT d.DOCUMENT_LOCATION OR c.title IS NOT d.DOCUMENT_TITLE
+            ORDER BY d.rowid
+            ''',
+            (always_convert,)
         )
 
-    def get_document_attachments(self, document_guid: str) -> list:
-        """ 获取某个文档的附件信息
+    def get_sync_deleted(self) -> list:
+        """ 附加的 ConvertorDB 中有记录、为知中已删除的文档：guid 及其转换记录（同 `ConvertorState`）
         """
         return self.query_list(
             '''
+            SELECT guid, location, name, title, file_name, success, extract_time
+            FROM convertor.wiz_convertor
+            WHERE guid NOT IN (SELECT DOCUMENT_GUID FROM WIZ_DOCUMENT)
+            '''
+        )
+
+    def get_modified_since(self, since: str) -> list:
+        """ 获取 `DT_MODIFIED` 不早于 since 的文档的 guid 和修改时间
+        """
+        return self.query_list(
+            "SELECT DOCUMENT_GUID, DT_MODIFIED FROM WIZ_DOCUMENT WHERE DT_MODIFIED >= ? ORDER BY DT_MODIFIED",
+            (since,)
+        )
+
+    def get_max_modified(self) -> str:
+        """ 所有文档中最晚的修改时间
+        """
+        return self.query_scalar("SELECT max(DT_MODIFIED) FROM WIZ_DOCUMENT")
+
+    def get_document_count(self) -> int:
+        return self.query_scalar("SELECT count(*) FROM WIZ_DOCUMENT")
+
+    def get_all_document_locations(self) -> list:
+        """ 获取所有文档的 guid、标题、文件夹，用于生成内链路径
+        """
+        return self.query_list("SELECT DOCUMENT_GUID, DOCUMENT_TITLE, DOCUMENT_LOCATION FROM WIZ_DOCUMENT")
+
+    def get_documents_attachments(self, document_guids: list[str]) -> list:
+        """ 获取一批文档的附件信息，用于按批加载
+        """
+        placeholders = ','.join('?' * len(document_guids))
+        return self.query_list(
+            f'''
             SELECT ATTACHMENT_GUID, DOCUMENT_GUID, ATTACHMENT_NAME, DT_DATA_MODIFIED
             FROM WIZ_DOCUMENT_ATTACHMENT
-            WHERE DOCUMENT_GUID = ?
+            WHERE DOCUMENT_GUID IN ({placeholders})
             ''',
-            (document_guid,)
+            document_guids
         )
 
-    def get_document_tags(self, document_guid: str) -> list:
-        """ 获取某个文档的Tag信息
+    def get_documents_tags(self, document_guids: list[str]) -> list:
+        """ 获取一批文档的Tag信息，用于按批加载
+
+        返回的每行为：DOCUMENT_GUID, TAG_GUID, TAG_NAME
         """
+        placeholders = ','.join('?' * len(document_guids))
         return self.query_list(
-            '''
-            SELECT WIZ_DOCUMENT_TAG.TAG_GUID, TAG_NAME
+            f'''
+            SELECT DOCUMENT_GUID, WIZ_DOCUMENT_TAG.TAG_GUID, TAG_NAME
             FROM WIZ_DOCUMENT_TAG
             LEFT JOIN WIZ_TAG ON WIZ_DOCUMENT_TAG.TAG_GUID = WIZ_TAG.TAG_GUID
-            WHERE DOCUMENT_GUID = ?
+            WHERE DOCUMENT_GUID IN ({placeholders})
             ''',
-            (document_guid,)
+            document_guids
         )
 
     def get_all_tag(self):
@@ -0,0 +1,110 @@
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator
+from convertor_db import ConvertorState
+from .entity.wiz_document import WizDocument, FORMAT_STRING
+
+
+class WizDocumentFilter(object):
+    """ 按文件夹、标签、修改时间筛选要处理的笔记，并按 guid 分片
+
+    分片按 guid 的 crc32 取模，结果只与 guid 有关，可以把一个账号拆到多台机器上分别转换，
+    各自的 ConvertorDB 之后用 `--merge-db` 合并
+    """
+
+    folders: list[str]
+    """ 文件夹前缀，格式为：`/folder1/folder2/`，满足其一即可 """
+
+    tags: list[str]
+    """ 标签的嵌套名称，包含子标签，满足其一即可 """
+
+    modified_since: str
+    """ 只处理这个时间之后修改的笔记，格式为：`%Y-%m-%d %H:%M:%S` """
+
+    shard: tuple[int, int]
+    """ (i, m)：只处理 m 个分片中的第 i 个，i 从 1 开始 """
+
+    def __init__(self, folders: list[str] = None, tags: list[str] = None, modified_since: str = None,
+                 shard: tuple[int, int] = None) -> None:
+        self.folders = [_normalize_folder(folder) for folder in folders or []]
+        self.tags = [tag.strip('/') for tag in tags or []]
+        self.modified_since = _normalize_time(modified_since) if modified_since else None
+        self.shard = shard
+        if shard is not None and not 1 <= shard[0] <= shard[1]:
+            raise ValueError(f'分片参数不正确：{shard[0]}/{shard[1]}，应满足 1 <= i <= m')
+
+    def is_empty(self) -> bool:
+        return not (self.folders or self.tags or self.modified_since or self.shard)
+
+    def apply(self, documents: Iterable[WizDocument]) -> Iterator[WizDocument]:
+        return (document for document in documents if self.matches(document))
+
+    def matches(self, document: WizDocument) -> bool:
+        if not self.in_shard(document.guid):
+            return False
+        if self.folders and not self._in_folders(document.location):
+            return False
+        if self.modified_since and document.modified < self.modified_since:
+            return False
+        if self.tags and not any(self._match_tag(tag.nesting_name) for tag in document.tags):
+            return False
+        return True
+
+    def in_shard(self, guid: str) -> bool:
+        if self.shard is None:
+            return True
+        i, m = self.shard
+        return zlib.crc32(guid.encode('UTF-8')) % m == i - 1
+
+    def in_delete_scope(self, guid: str, state: ConvertorState) -> bool:
+        """ 为知中已删除的笔记，是否由本次运行删除其转换结果
+
+        已删除的笔记只剩转换记录，只能按分片和文件夹判断；按标签、修改时间筛选时，无法判断，一律不删除
+        """
+        if self.tags or self.modified_since:
+            return False
+        return self.in_shard(guid) and (not self.folders or self._in_folders(state.location))
+
+    def _in_folders(self, location: str) -> bool:
+        return any(location.startswith(folder) for folder in self.folders)
+
+    def _match_tag(self, nesting_name: str) -> bool:
+        return any(nesting_name == tag or nesting_name.startswith(tag + '/') for tag in self.tags)
+
+    def __str__(self) -> str:
+        conditions = []
+        if self.folders:
+            conditions.append(f'文件夹 {", ".join(self.folders)}')
+        if self.tags:
+            conditions.append(f'标签 {", ".join(self.tags)}')
+        if self.modified_since:
+            conditions.append(f'{self.modified_since} 之后修改')
+        if self.shard:
+            conditions.append(f'分片 {self.shard[0]}/{self.shard[1]}')
+        return '，'.join(conditions)
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """ 解析 `i/m` 格式的分片参数 """
+    try:
+        i, m = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError(f'分片参数格式应为 i/m，如 1/4：{value}')
+    return i, m
+
+
+def _normalize_folder(folder: str) -> str:
+    """ 统一为为知的文件夹格式：以 `/` 开头和结尾 """
+    folder = folder.replace('\\', '/').strip('/')
+    return f'/{folder}/' if folder else '/'
+
+
+def _normalize_time(value: str) -> str:
+    """ `2024-01-01` 补全为 `2024-01-01 00:00:00`，与为知的时间格式一致，可以直接比较字符串 """
+    value = value.strip().replace('T', ' ')
+    for time_format in (FORMAT_STRING, '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, time_format).strftime(FORMAT_STRING)
+        except ValueError:
+            continue
+    raise ValueError(f'时间格式应为 YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS：{value}')
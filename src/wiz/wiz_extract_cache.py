@@ -0,0 +1,117 @@
+import os
+import shutil
+from collections import OrderedDict
+from pathlib import Path
+from common.log import log
+from common.utils import format_size
+from config import Config
+from convertor_db import ConvertorDB, ConvertorState
+from .wiz_convert_task import ConvertResult, PARTIAL_SUFFIX
+
+
+class ExtractCache(object):
+    """ 把 `temp_dir` 当做缓存管理：每篇笔记解压到以 guid 命名的目录
+
+    - 转换成功后删除解压目录（`Config.temp_cleanup_on_success`）
+    - 总大小超过 `Config.temp_max_bytes` 时，删除最久未使用、且不在转换中的目录
+    - 启动时与 ConvertorDB 对账，删除程序崩溃等原因留下的孤立目录
+    """
+
+    temp_dir: Path
+
+    _sizes: OrderedDict[str, int]
+    """ guid -> 解压目录的大小，按最近使用排序，最久未使用的在前 """
+
+    _in_use: set[str]
+    """ 待转换笔记的 guid，它们的解压目录不能淘汰 """
+
+    total: int
+    """ 所有解压目录的总大小 """
+
+    def __init__(self, temp_dir: Path) -> None:
+        self.temp_dir = temp_dir
+        self._sizes = OrderedDict()
+        self._in_use = set()
+        self.total = 0
+        self._scan()
+
+    def _scan(self):
+        """ 统计已有解压目录的大小，按修改时间排序；删除没有解压完的目录 """
+        entries = []
+        with os.scandir(self.temp_dir) as it:
+            for entry in it:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                if entry.name.endswith(PARTIAL_SUFFIX):
+                    log.debug(f'删除未解压完的目录：{entry.path}')
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                entries.append((entry.stat().st_mtime, entry.name, _dir_size(entry.path)))
+        for _, guid, size in sorted(entries):
+            self._sizes[guid] = size
+            self.total += size
+
+    def reconcile(self, states: dict[str, ConvertorState], deleted: set[str], convertor_db: ConvertorDB):
+        """ 启动时与转换记录对账
+
+        - 没有转换记录、或笔记已在为知中删除的解压目录，删除
+        - 没有转换成功、记录了解压时间，但解压目录已不存在的笔记，清除解压时间
+          （转换成功的笔记解压目录会被清理，解压时间仍用于判断笔记是否有更新，保留）
+        """
+        orphans = [guid for guid in self._sizes if guid not in states or guid in deleted]
+        for guid in orphans:
+            self._remove(guid)
+
+        stale = [guid for guid, state in states.items()
+                 if state.extract_time and not state.success and guid not in self._sizes and guid not in deleted]
+        if stale:
+            convertor_db.reset_extract_time(stale)
+
+        if orphans or stale:
+            log.info(f'解压目录对账：删除孤立目录 {len(orphans)} 个，清除解压时间 {len(stale)} 条')
+        log.debug(f'解压目录共 {len(self._sizes)} 个，{format_size(self.total)}')
+        self._evict()
+
+    def use(self, guid: str):
+        """ 笔记即将转换，转换结束前不淘汰它的解压目录 """
+        self._in_use.add(guid)
+        if guid in self._sizes:
+            self._sizes.move_to_end(guid)
+
+    def release(self, result: ConvertResult):
+        """ 笔记转换结束：成功的删除解压目录，否则记录新解压的大小，超过上限时淘汰 """
+        guid = result.guid
+        self._in_use.discard(guid)
+        if result.success and Config.temp_cleanup_on_success:
+            self._remove(guid)
+            return
+        if result.extract_time is not None:
+            self.total += result.extracted_size - self._sizes.get(guid, 0)
+            self._sizes[guid] = result.extracted_size
+        if guid in self._sizes:
+            self._sizes.move_to_end(guid)
+        self._evict()
+
+    def _evict(self):
+        if self.total <= Config.temp_max_bytes:
+            return
+        for guid in [guid for guid in self._sizes if guid not in self._in_use]:
+            if self.total <= Config.temp_max_bytes:
+                break
+            log.debug(f'解压目录超过上限，删除最久未使用的：{guid}')
+            self._remove(guid)
+
+    def _remove(self, guid: str):
+        self.total -= self._sizes.pop(guid, 0)
+        shutil.rmtree(self.temp_dir.joinpath(guid), ignore_errors=True)
+
+
+def _dir_size(path: str) -> int:
+    size = 0
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                size += _dir_size(entry.path)
+            else:
+                size += entry.stat(follow_symlinks=False).st_size
+    return size
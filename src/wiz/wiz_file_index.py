@@ -0,0 +1,95 @@
+import os
+from collections import defaultdict, namedtuple
+from pathlib import Path
+from typing import Iterable
+from common.log import log
+from .entity.wiz_attachment import WizAttachment
+from .entity.wiz_document import WizDocument
+
+FileStat = namedtuple('FileStat', ['size', 'mtime'])
+""" 文件大小与修改时间 """
+
+
+class WizFileIndex(object):
+    """ 为知数据目录中笔记 ziw 文件及附件的大小、修改时间
+
+    不再逐篇笔记、逐个附件调用 `exists`、`stat`（数据目录在网络盘上时，每次都是一次往返）：
+    每个笔记所在的文件夹、每个附件目录只用 `os.scandir` 列一次，之后的存在性与大小都从这里查询。
+    只记录要处理的笔记及其附件，不遍历整个数据目录
+    """
+
+    _stats: dict[str, FileStat]
+    """ 文件路径（已 `normcase`） -> 大小与修改时间，不在其中的文件不存在 """
+
+    def __init__(self, documents: Iterable[WizDocument]) -> None:
+        self._stats = {}
+        # 笔记文件夹 -> 要查找的文件名：ziw 文件、附件目录
+        wanted = defaultdict(set)
+        for document in documents:
+            wanted[str(document.file.parent)].add(os.path.normcase(document.file.name))
+            if document.attachments:
+                wanted[str(document.file.parent)].add(os.path.normcase(document.attachments_dir.name))
+
+        attachments_dirs = []
+        for folder, names in wanted.items():
+            for entry in _scandir(folder):
+                if os.path.normcase(entry.name) not in names:
+                    continue
+                if entry.is_dir():
+                    attachments_dirs.append(entry.path)
+                elif entry.is_file():
+                    self._add(entry)
+        for attachments_dir in attachments_dirs:
+            for entry in _scandir(attachments_dir):
+                if entry.is_file():
+                    self._add(entry)
+        log.debug(f'扫描 {len(wanted)} 个文件夹、{len(attachments_dirs)} 个附件目录，共 {len(self._stats)} 个文件')
+
+    def _add(self, entry: os.DirEntry):
+        stat = entry.stat()
+        self._stats[os.path.normcase(entry.path)] = FileStat(stat.st_size, stat.st_mtime)
+
+    def stat(self, file: Path) -> FileStat:
+        """ 文件的大小与修改时间，文件不存在时返回 None """
+        return self._stats.get(os.path.normcase(str(file)))
+
+    def exists(self, file: Path) -> bool:
+        return self.stat(file) is not None
+
+    def get_attachment_stats(self, document: WizDocument) -> dict[str, FileStat]:
+        """ 笔记的附件中存在的那些：附件名 -> 大小与修改时间 """
+        stats = {}
+        for attachment in document.attachments:
+            stat = self.stat(document.attachments_dir.joinpath(attachment.name))
+            if stat is not None:
+                stats[attachment.name] = stat
+        return stats
+
+    def log_missing(self, documents: Iterable[WizDocument]):
+        """ 转换开始前，汇报找不到 ziw 文件的笔记（没有下载）及找不到的附件
+        """
+        missing_documents: list[WizDocument] = []
+        missing_attachments: list[tuple[WizDocument, WizAttachment]] = []
+        for document in documents:
+            if not self.exists(document.file):
+                missing_documents.append(document)
+                continue
+            missing_attachments += [(document, attachment) for attachment in document.attachments
+                                    if not self.exists(document.attachments_dir.joinpath(attachment.name))]
+
+        if missing_documents:
+            log.warning(f'有 {len(missing_documents)} 篇笔记没找到笔记文件，请先在为知笔记中下载：')
+            for document in missing_documents:
+                log.warning(f'  {document.location}{document.title}')
+        if missing_attachments:
+            log.warning(f'有 {len(missing_attachments)} 个附件未找到：')
+            for document, attachment in missing_attachments:
+                log.warning(f'  {document.location}{document.title}：{attachment.name}')
+
+
+def _scandir(path: str) -> list[os.DirEntry]:
+    try:
+        with os.scandir(path) as entries:
+            return list(entries)
+    except (FileNotFoundError, NotADirectoryError):
+        return []
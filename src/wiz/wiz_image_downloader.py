@@ -0,0 +1,177 @@
+import hashlib
+import html
+import mimetypes
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
+from common.log import log
+from common.sqlite_base import SQLiteBase
+from config import Config
+
+# <img src="https://example.com/a.png">，不包括懒加载的 data-src 等属性
+_IMG_HTTP_SRC = re.compile(rb'<img\b[^>]*?(?<![\w-])src\s*=\s*["\']?\s*(https?://[^"\'\s>]+)', re.IGNORECASE)
+
+
+def find_remote_images(html_body_bytes: bytes) -> set[str]:
+    """ 从 index.html 原始字节中找出所有 http(s) 图片地址，与 BeautifulSoup 解析出的 src 一致（已反转义） """
+    return {html.unescape(url.decode('utf-8', errors='replace')) for url in _IMG_HTTP_SRC.findall(html_body_bytes)}
+
+
+class ImageCacheDB(SQLiteBase):
+
+    def __init__(self, cache_dir: Path):
+        """ 远程图片的缓存记录：url -> 缓存文件名
+        """
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        super().__init__(str(cache_dir.joinpath("index.db")))
+        self.execute(
+            """
+            CREATE TABLE IF NOT EXISTS image_cache (
+                url TEXT PRIMARY KEY,
+                file_name TEXT NOT NULL,    -- 缓存目录下的文件名
+                size INTEGER,
+                download_time TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+            );
+            """
+        )
+
+    def get_all(self) -> dict[str, str]:
+        return dict(self.query_list("SELECT url, file_name FROM image_cache"))
+
+    def add(self, url: str, file_name: str, size: int):
+        self.execute(
+            "INSERT OR REPLACE INTO image_cache(url, file_name, size) VALUES (?, ?, ?)",
+            (url, file_name, size)
+        )
+
+
+class ImageDownloader(object):
+    """ 下载笔记中的 http(s) 图片到本地缓存目录
+
+    - 多线程并发下载，每个线程一个 `requests.Session`，复用连接
+    - 限制同一个主机的并发数，设置超时，失败自动重试
+    - 下载结果记录在缓存目录的 index.db，重复运行不再下载
+    - 转换每篇笔记时只下载这篇笔记用到的图片；同一个下载器中，已缓存、下载失败的图片不再请求
+    """
+
+    cache_dir: Path
+
+    _cached: dict[str, Path]
+    """ 已缓存的图片：url -> 缓存文件，第一次下载时从 index.db 读出 """
+
+    _failed: set[str]
+    """ 下载失败的图片 """
+
+    def __init__(self, cache_dir: Path = None) -> None:
+        self.cache_dir = Path(cache_dir or Config.image_cache_dir)
+        self.cache_db = ImageCacheDB(self.cache_dir)
+        self._local = threading.local()
+        self._host_limits: dict[str, threading.Semaphore] = {}
+        self._host_limits_lock = threading.Lock()
+        self._cached = None
+        self._failed = set()
+
+    def download_all(self, urls: set[str]) -> dict[str, Path]:
+        """ 下载所有图片，已缓存的跳过
+
+        Returns:
+            dict[str, Path]: url -> 缓存文件，下载失败的图片不在其中，继续使用原地址
+        """
+        if self._cached is None:
+            self._cached = self._get_cached()
+        cached = self._cached
+        pending = sorted(url for url in urls if url not in cached and url not in self._failed)
+        if pending:
+            log.debug(f'下载远程图片 {len(pending)} 张')
+            with ThreadPoolExecutor(max_workers=min(Config.image_download_workers, len(pending))) as executor:
+                for url, result in zip(pending, executor.map(self._download, pending)):
+                    if result is None:
+                        self._failed.add(url)
+                        continue
+                    file_name, size = result
+                    self.cache_db.add(url, file_name, size)
+                    cached[url] = self.cache_dir.joinpath(file_name)
+
+        failed = sum(1 for url in urls if url not in cached)
+        if failed:
+            log.warning(f'{failed} 张远程图片下载失败，笔记中继续使用原地址')
+        return {url: cached[url] for url in urls if url in cached}
+
+    def close(self):
+        self.cache_db.close()
+
+    def _get_cached(self) -> dict[str, Path]:
+        """ 已缓存、且缓存文件还在的图片 """
+        cached = {}
+        for url, file_name in self.cache_db.get_all().items():
+            file = self.cache_dir.joinpath(file_name)
+            if file.exists():
+                cached[url] = file
+        return cached
+
+    def _download(self, url: str):
+        """ 下载一张图片到缓存目录，失败返回 None
+
+        Returns:
+            tuple[str, int]: 缓存文件名，文件大小
+        """
+        host = urlparse(url).netloc
+        try:
+            with self._get_host_limit(host):
+                response = self._get_session().get(url, timeout=Config.image_download_timeout, stream=True)
+                with response:
+                    response.raise_for_status()
+                    content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+                    if content_type and not content_type.startswith('image/'):
+                        log.debug(f'不是图片：{url} ({content_type})')
+                        return None
+                    file_name = _cache_file_name(url, content_type)
+                    # 多进程转换时，不同进程可能同时下载同一张图片
+                    temp_file = self.cache_dir.joinpath(f'{file_name}.{os.getpid()}.part')
+                    size = 0
+                    try:
+                        with open(temp_file, 'wb') as f:
+                            for chunk in response.iter_content(64 * 1024):
+                                f.write(chunk)
+                                size += len(chunk)
+                        temp_file.replace(self.cache_dir.joinpath(file_name))
+                    finally:
+                        # 下载中途超时、连接断开时，不留下下载了一半的文件
+                        temp_file.unlink(missing_ok=True)
+                    return file_name, size
+        except Exception as e:
+            log.debug(f'下载图片失败：{url}，{e}')
+            return None
+
+    def _get_session(self):
+        """ 每个线程一个 Session，连接池在同一线程的请求间复用 """
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            retry = Retry(total=Config.image_download_retries, backoff_factor=0.5,
+                          status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET'])
+            adapter = HTTPAdapter(max_retries=retry, pool_maxsize=Config.image_download_per_host)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+        return session
+
+    def _get_host_limit(self, host: str) -> threading.Semaphore:
+        with self._host_limits_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.Semaphore(Config.image_download_per_host)
+            return self._host_limits[host]
+
+
+def _cache_file_name(url: str, content_type: str) -> str:
+    """ 以 url 的哈希为文件名，扩展名取自 url 或 Content-Type """
+    suffix = Path(urlparse(url).path).suffix.lower()
+    if not re.fullmatch(r'\.[a-z0-9]{1,5}', suffix):
+        suffix = (mimetypes.guess_extension(content_type) if content_type else None) or ''
+    return hashlib.sha1(url.encode('utf-8')).hexdigest() + suffix
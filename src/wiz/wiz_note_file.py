@@ -0,0 +1,140 @@
+import time
+from io import BytesIO
+from pathlib import Path
+from zipfile import ZipFile, BadZipFile
+from .wiz_attachment_sink import AttachmentSink
+
+ZIP_MAGIC = b'PK\x03\x04'
+""" zip 文件头 """
+
+INDEX_HTML = "index.html"
+TODOLIST_XML = "index_files/wiz_todolist.xml"
+
+
+class NoteFileError(Exception):
+    """ 笔记文件无法读取：加密笔记、文件损坏等 """
+
+
+class WizNoteFile(object):
+    """ 笔记 ziw 文件中的内容
+
+    ziw 本质是 zip 文件，`index.html` 是笔记正文，`index_files/` 下是图片等资源
+    """
+
+    sink: AttachmentSink
+    """ 图片等资源通过它写入目标目录 """
+
+    inline_resources: set[str] = frozenset()
+    """ 从 index.html 的 data URI 中提取、已写入目标目录的图片，如 `index_files/data-<哈希>.png`，见 `extract_data_uris` """
+
+    def read_index_html(self) -> bytes:
+        """ 读取 `index.html` 的原始字节 """
+        raise NotImplementedError
+
+    def read_todolist(self) -> bytes:
+        """ 读取 `index_files/wiz_todolist.xml`，不存在时返回 None """
+        raise NotImplementedError
+
+    def has_todolist(self) -> bool:
+        raise NotImplementedError
+
+    def copy_resource(self, src: str, target_dir: Path) -> Path:
+        """ 将资源文件（如 `index_files/name.png`）复制到 `target_dir`，文件名不变
+
+        Returns:
+            Path: 复制后的文件
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ZipNoteFile(WizNoteFile):
+
+    def __init__(self, file: Path, sink: AttachmentSink, data: bytes = None) -> None:
+        """ 直接从 ziw 压缩包中读取笔记内容，不解压到临时目录
+
+        打开时先检查文件头，加密或损坏的笔记抛出 `NoteFileError`
+
+        Args:
+            data (bytes): 已读入内存的 ziw 文件内容，为 None 时从 file 读取
+        """
+        self.sink = sink
+        self.inline_resources = set()
+        if data is None:
+            with open(file, 'rb') as f:
+                header = f.read(len(ZIP_MAGIC))
+        else:
+            header = data[:len(ZIP_MAGIC)]
+        if header != ZIP_MAGIC:
+            raise NoteFileError('不是 zip 文件，该笔记可能是加密笔记，请先解密')
+        try:
+            self.zip_file = ZipFile(file if data is None else BytesIO(data))
+        except BadZipFile as e:
+            raise NoteFileError(f'笔记文件已损坏：{e}')
+        self.members = {info.filename: info for info in self.zip_file.infolist()}
+        if any(info.flag_bits & 0x1 for info in self.members.values()):
+            self.close()
+            raise NoteFileError('压缩包已加密，该笔记可能是加密笔记，请先解密')
+
+    def read_index_html(self) -> bytes:
+        if INDEX_HTML not in self.members:
+            raise NoteFileError(f"主文档文件不存在！ {INDEX_HTML}")
+        return self.zip_file.read(self.members[INDEX_HTML])
+
+    def read_todolist(self) -> bytes:
+        if not self.has_todolist():
+            return None
+        return self.zip_file.read(self.members[TODOLIST_XML])
+
+    def has_todolist(self) -> bool:
+        return TODOLIST_XML in self.members
+
+    def copy_resource(self, src: str, target_dir: Path) -> Path:
+        info = self.members.get(src)
+        if info is None:
+            raise FileNotFoundError(f'资源文件不存在：{src}')
+        target_file = target_dir.joinpath(Path(src).name)
+        # 与 copy2 一样保留修改时间，取压缩包中记录的时间
+        mtime = time.mktime(info.date_time + (0, 0, -1))
+        self.sink.place(target_file, info.file_size, mtime, lambda: self.zip_file.open(info))
+        return target_file
+
+    def close(self):
+        self.zip_file.close()
+
+
+class ExtractedNoteFile(WizNoteFile):
+
+    def __init__(self, file_extract_dir: Path, sink: AttachmentSink) -> None:
+        """ 从 ziw 解压后的目录中读取笔记内容
+        """
+        self.sink = sink
+        self.inline_resources = set()
+        self.file_extract_dir = file_extract_dir
+
+    def read_index_html(self) -> bytes:
+        index_html_file = self.file_extract_dir.joinpath(INDEX_HTML)
+        if not index_html_file.exists():
+            raise NoteFileError(f"主文档文件不存在！ {index_html_file}")
+        return index_html_file.read_bytes()
+
+    def read_todolist(self) -> bytes:
+        if not self.has_todolist():
+            return None
+        return self.file_extract_dir.joinpath(TODOLIST_XML).read_bytes()
+
+    def has_todolist(self) -> bool:
+        return self.file_extract_dir.joinpath(TODOLIST_XML).exists()
+
+    def copy_resource(self, src: str, target_dir: Path) -> Path:
+        target_file = target_dir.joinpath(Path(src).name)
+        self.sink.place_file(self.file_extract_dir.joinpath(src), target_file)
+        return target_file
@@ -0,0 +1,158 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Full, SimpleQueue
+from typing import Callable
+from common.log import log
+from config import Config
+from .wiz_attachment_sink import AttachmentSink
+from .wiz_convert_task import ConvertTask, ConvertResult, NoteJob, read_note, render_note, write_note
+
+
+class QueueStats(object):
+    """ 一个队列的深度统计：每次取出（或放入）时采样 """
+
+    capacity: int
+    samples: int = 0
+    total: int = 0
+    max: int = 0
+
+    wait: float = 0
+    """ 下游等待（读取队列为空）或上游阻塞（写入队列已满）的总时间（秒） """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+
+    def sample(self, depth: int):
+        self.samples += 1
+        self.total += depth
+        self.max = max(self.max, depth)
+
+    @property
+    def average(self) -> float:
+        return self.total / self.samples if self.samples else 0
+
+    def __str__(self) -> str:
+        return f'平均 {self.average:.1f}，最大 {self.max}，上限 {self.capacity}，等待 {self.wait:.2f} 秒'
+
+
+class ConvertPipeline(object):
+    """ 流水线转换：单进程内，读取、转换、写入三个阶段重叠执行
+
+    - 读取线程：按顺序打开笔记文件，把 ziw 读入内存（或解压），放入读取队列
+    - 转换阶段（调用 `run` 的线程）：html 转为 markdown，附件、图片的写入只记录下来，交给写入线程池
+    - 写入线程池：复制附件、图片，写入 markdown，结果交回调用线程
+
+    队列都有上限：读取队列满时读取线程等待，写入中的笔记达到上限时转换阶段等待，内存占用有界。
+    两个队列的深度与等待时间见 `read_stats`、`write_stats`：转换阶段常等待读取，说明磁盘读取是瓶颈，
+    可加大 `Config.pipeline_read_ahead`；常等待写入，可加大 `Config.pipeline_writers`
+
+    ConvertorDB 等 sqlite 连接只能在创建它的线程中使用，`on_result` 都在调用 `run` 的线程中执行
+    """
+
+    tasks: list[ConvertTask]
+
+    on_result: Callable[[ConvertResult], None]
+    """ 一篇笔记转换结束（无论成功与否）后调用 """
+
+    read_stats: QueueStats
+    write_stats: QueueStats
+
+    def __init__(self, tasks: list[ConvertTask], on_result: Callable[[ConvertResult], None]) -> None:
+        self.tasks = tasks
+        self.on_result = on_result
+        self.read_stats = QueueStats(Config.pipeline_read_ahead)
+        self.write_stats = QueueStats(Config.pipeline_write_queue)
+        self._read_queue = Queue(maxsize=Config.pipeline_read_ahead)
+        self._done_queue = SimpleQueue()
+        self._writing = 0
+        self._stop = threading.Event()
+        self._local = threading.local()
+        self._placed = {}
+
+    def run(self):
+        reader = threading.Thread(target=self._read_all, name='pipeline-reader', daemon=True)
+        reader.start()
+        try:
+            with ThreadPoolExecutor(max_workers=Config.pipeline_writers, thread_name_prefix='pipeline-writer') as writers:
+                for _ in self.tasks:
+                    job = self._take()
+                    render_note(job)
+                    self._save_done()
+                    self._wait_for_writers(Config.pipeline_write_queue - 1)
+                    self.write_stats.sample(self._writing)
+                    self._writing += 1
+                    writers.submit(self._write, job)
+                while self._writing:
+                    self._save(self._done_queue.get())
+        finally:
+            self._stop.set()
+            reader.join()
+        log.info(f'流水线读取队列：{self.read_stats}')
+        log.info(f'流水线写入队列：{self.write_stats}')
+
+    def _read_all(self):
+        """ 读取线程：按顺序读取，队列满时等待；转换阶段出错退出时，停止读取
+
+        读取线程意外出错时，把异常放入读取队列，由转换阶段抛出，否则转换阶段会一直等待
+        """
+        try:
+            for task in self.tasks:
+                job = NoteJob(task)
+                read_note(job)
+                if not self._put(job):
+                    if job.note_file is not None:
+                        job.note_file.close()
+                    return
+        except BaseException as e:
+            self._put(e)
+
+    def _put(self, item) -> bool:
+        """ 放入读取队列，队列满时等待；转换阶段已退出时返回 False """
+        while not self._stop.is_set():
+            try:
+                self._read_queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _take(self) -> NoteJob:
+        self.read_stats.sample(self._read_queue.qsize())
+        start = time.perf_counter()
+        job = self._read_queue.get()
+        self.read_stats.wait += time.perf_counter() - start
+        if isinstance(job, BaseException):
+            raise RuntimeError('流水线读取线程出错') from job
+        return job
+
+    def _write(self, job: NoteJob):
+        """ 写入线程：每个线程一个 sink，各自统计写入的字节数，已写入的文件共用，跨笔记去重
+
+        意外出错时，把异常放入结果队列，由转换阶段抛出，否则转换阶段会一直等待写入完成
+        """
+        try:
+            sink = getattr(self._local, 'sink', None)
+            if sink is None:
+                sink = self._local.sink = AttachmentSink(self._placed)
+            self._done_queue.put(write_note(job, sink))
+        except BaseException as e:
+            self._done_queue.put(e)
+
+    def _save_done(self):
+        """ 保存已写入完的笔记的结果，不等待 """
+        while not self._done_queue.empty():
+            self._save(self._done_queue.get())
+
+    def _wait_for_writers(self, max_writing: int):
+        """ 写入中的笔记超过 max_writing 时，等待写入完成 """
+        start = time.perf_counter()
+        while self._writing > max_writing:
+            self._save(self._done_queue.get())
+        self.write_stats.wait += time.perf_counter() - start
+
+    def _save(self, result: ConvertResult):
+        self._writing -= 1
+        if isinstance(result, BaseException):
+            raise RuntimeError('流水线写入线程出错') from result
+        self.on_result(result)
@@ -1,9 +1,14 @@
+import time
+from collections import defaultdict
 from pathlib import Path
+from typing import Iterator
 
+from common.log import log
+from config import Config
 from .wiz_db import WizDB
-from .entity.wiz_tag import WizTag
+from .entity.wiz_tag import WizTag, WizTagTree
 from .entity.wiz_attachment import WizAttachment
-from .entity.wiz_document import WizDocument
+from .entity.wiz_document import WizDocument, get_output_file_name
 from convertor_db import ConvertorDB
 
 
@@ -12,56 +17,124 @@ class WizStorage(object):
     wiz_db: WizDB
     convertor_db: ConvertorDB
 
-    documents: list[WizDocument] = []
-    """ 全部笔记文档 """
-
-    all_tags: list[WizTag] = []
+    all_tags: list[WizTag]
     """ 全部标签 """
 
+    tag_tree: WizTagTree
+    """ 标签树，已算好所有标签的嵌套名称 """
+
+    document_count: int
+    """ 笔记总数 """
+
+    _link_targets: dict[str, str]
+    """ 见 `get_link_targets`，首次调用时建立 """
+
     def __init__(self, wiz_dir: Path, wiz_db: WizDB, convertor_db: ConvertorDB):
-        """ 从为知数据库，获取笔记、标签、附件等信息，并做一些必要处理，保存到本对象，方便后续操作。
+        """ 从为知数据库，获取笔记、标签、附件等信息，并做一些必要处理，方便后续操作。
+
+        笔记不会一次全部读入内存，通过 `iter_documents` 分批读取，附件、标签按批加载
 
         :param wiz_dir: 笔记文件夹路径
         """
         self.wiz_dir = wiz_dir
         self.wiz_db = wiz_db
         self.convertor_db = convertor_db
+        self._link_targets = None
 
         self._init()
 
     def _init(self):
+        start = time.perf_counter()
+
         # 获取所有标签，计算嵌套标签名
         self.all_tags = [WizTag(*tag) for tag in self.wiz_db.get_all_tag()]
-        WizTag.compute_nesting_name(self.all_tags)
-
-        rows = self.wiz_db.get_all_document()
-        for row in rows:
-            document = WizDocument(*row, self.wiz_dir)
-            self.documents.append(document)
-            document.resolve_attachments(self._get_attachments(document.guid))
-            document.resolve_tags(self._get_tags(document.guid))
-            
-            self.convertor_db.add(document)
-
-    def _get_attachments(self, document_guid: str) -> list[WizAttachment]:
-        rows = self.wiz_db.get_document_attachments(document_guid)
-        attachments: list[WizAttachment] = []
-        for row in rows:
-            attachments.append(WizAttachment(*row))
-        return attachments
-
-    def _get_tags(self, document_guid: str) -> list[WizTag]:
-        rows = self.wiz_db.get_document_tags(document_guid)
+        self.tag_tree = WizTagTree(self.all_tags)
+        self.document_count = self.wiz_db.get_document_count()
+
+        log.info(f'读取笔记信息完成，共 {self.document_count} 篇笔记，耗时 {time.perf_counter() - start:.2f} 秒')
+
+    def iter_documents(self, batch_size: int = None) -> Iterator[WizDocument]:
+        """ 按数据库中的顺序逐个返回笔记
+
+        每次从数据库读取 `batch_size` 篇笔记（默认 `Config.wiz_document_batch_size`），
+        并一次性读出这批笔记的附件、标签；调用方不保留笔记时，内存占用与笔记总数无关
+        """
+        batch_size = batch_size or Config.wiz_document_batch_size
+        after_rowid = 0
+        while True:
+            rows = self.wiz_db.get_document_page(after_rowid, batch_size)
+            if not rows:
+                return
+            after_rowid = rows[-1][0]
+            yield from self._load_batch([row[1:] for row in rows])
+
+    def _load_batch(self, rows: list[tuple]) -> list[WizDocument]:
+        """ 创建一批笔记，附件、标签按批一次读出
+        """
+        documents = [WizDocument(*row, self.wiz_dir) for row in rows]
+        guids = [document.guid for document in documents]
+
+        attachment_rows = defaultdict(list)
+        for row in self.wiz_db.get_documents_attachments(guids):
+            attachment_rows[row[1]].append(row)
+
+        tag_rows = defaultdict(list)
+        for document_guid, tag_guid, tag_name in self.wiz_db.get_documents_tags(guids):
+            tag_rows[document_guid].append((tag_guid, tag_name))
+
+        for document in documents:
+            document.resolve_attachments([WizAttachment(*row) for row in attachment_rows.get(document.guid, [])])
+            document.resolve_tags(self._get_tags(tag_rows.get(document.guid, [])))
+        return documents
+
+    def _get_tags(self, rows: list[tuple]) -> list[WizTag]:
         tags: list[WizTag] = []
-        for row in rows:
-            tags.append(WizTag(*row).set_nesting_name(self.all_tags))
+        for tag_guid, tag_name in rows:
+            tag = self.tag_tree.get(tag_guid)
+            if tag is None:
+                # 标签表中没有这个标签，使用原始名称
+                tag = WizTag(tag_guid, tag_name)
+                tag.nesting_name = tag_name
+            tags.append(tag)
         return tags
 
-    def get_document(self, document_guid: str):
+    def get_link_targets(self) -> dict[str, str]:
+        """ 笔记 guid -> 笔记内链路径（`location + output_file_name`）
+
+        处理笔记内链时只需要这些信息，多进程转换时传给子进程，不必传递整个 WizStorage；
+        直接从数据库读出 guid、标题、文件夹计算，不创建笔记对象
+        """
+        if self._link_targets is None:
+            self._link_targets = {guid: location + get_output_file_name(title)
+                                  for guid, title, location in self.wiz_db.get_all_document_locations()}
+        return self._link_targets
+
+    def refresh(self):
+        """ 为知数据库有变化时（如监视模式），重新读取标签，内链路径下次使用时重新计算
+        """
+        self._link_targets = None
+        self._init()
+
+    def get_documents(self, document_guids: list[str]) -> list[WizDocument]:
+        """ 按 guid 读取笔记，已删除的笔记不返回
+        """
+        documents = []
+        batch_size = Config.wiz_document_batch_size
+        for i in range(0, len(document_guids), batch_size):
+            documents += self._load_batch(self.wiz_db.get_documents(document_guids[i:i + batch_size]))
+        return documents
+
+    def load_documents(self, rows: list[tuple]) -> list[WizDocument]:
+        """ 由已查出的文档信息（同 `WizDB.get_document`）创建笔记，附件、标签按批读取
+        """
+        documents = []
+        batch_size = Config.wiz_document_batch_size
+        for i in range(0, len(rows), batch_size):
+            documents += self._load_batch(rows[i:i + batch_size])
+        return documents
+
+    def get_document(self, document_guid: str) -> WizDocument:
         row = self.wiz_db.get_document(document_guid)
-        if not row:
+        if row is None:
             return None
-        document = WizDocument(*row, self.wiz_dir)
-        document.resolve_attachments(self._get_attachments(document.guid))
-        document.resolve_tags(self._get_tags(document.guid))
-        return document
+        return self._load_batch([row])[0]
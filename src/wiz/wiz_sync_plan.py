@@ -0,0 +1,217 @@
+import os
+import shutil
+from pathlib import Path
+from typing import Callable, Iterable
+from common.log import log
+from common.utils import atomic_write_text
+from config import Config
+from convertor_db import ConvertorDB, ConvertorState
+from .entity.wiz_document import WizDocument
+from .wiz_document_filter import WizDocumentFilter
+from .wiz_convert_task import build_front_matter, get_target_file
+from .wiz_storage import WizStorage
+
+
+class WizSyncPlan(object):
+    """ 增量同步计划：对比为知数据库与 ConvertorDB 的记录，得出哪些笔记需要转换、移动、删除
+
+    为知的 `DT_MODIFIED` 与 ConvertorDB 的 `extract_time` 都是 `%Y-%m-%d %H:%M:%S` 格式的本地时间，
+    直接比较字符串即可，不必逐个解析为时间戳
+    """
+
+    new: list[WizDocument]
+    """ 新笔记，还没有转换记录 """
+
+    changed: list[WizDocument]
+    """ 转换后有更新，或者上次转换没有成功 """
+
+    moved: list[tuple[WizDocument, ConvertorState]]
+    """ 内容没有变化，只是移动了文件夹或改了标题，直接改名已转换的文件 """
+
+    deleted: list[tuple[str, ConvertorState]]
+    """ 为知中已删除的笔记 """
+
+    relinked: list[WizDocument]
+    """ 内容没有变化，但正文中链接的笔记移动、改名、删除或新建了，内链的路径要重新生成，见 `add_link_dependents` """
+
+    unchanged: int
+    """ 无需处理的笔记数 """
+
+    states: dict[str, ConvertorState]
+    """ guid -> 转换记录 """
+
+    def __init__(self, documents: Iterable[WizDocument], convertor_db: ConvertorDB, all_guids: set[str] = None,
+                 delete_scope: Callable[[str, ConvertorState], bool] = None,
+                 states: dict[str, ConvertorState] = None) -> None:
+        """ 逐个对比笔记，只保留需要处理的笔记，无变化的笔记不留在内存中
+
+        Args:
+            documents: 要处理的笔记，可能是筛选后的部分笔记
+            all_guids (set[str]): 为知中所有笔记的 guid，用于判断哪些笔记已删除；为 None 时即 documents 的 guid
+            delete_scope: 筛选笔记时，判断已删除的笔记是否在本次处理的范围内，范围外的不删除
+            states: 已查出的转换记录，为 None 时读出 ConvertorDB 中的全部记录
+        """
+        self.new = []
+        self.changed = []
+        self.moved = []
+        self.deleted = []
+        self.relinked = []
+        self.unchanged = 0
+        self.states = convertor_db.get_all_state() if states is None else states
+        self._relocated = []
+        """ 移动后又有修改的笔记：(笔记, 原来的转换记录)，在 `apply` 中删掉原来的文件 """
+
+        guids = set()
+        for document in documents:
+            if all_guids is None:
+                guids.add(document.guid)
+            state = self.states.get(document.guid)
+            if state is None:
+                self.new.append(document)
+                continue
+
+            is_moved = state.location != document.location or state.title != document.title
+            is_changed = (Config.always_convert or not state.success
+                          or not state.extract_time or state.extract_time < document.modified)
+            if is_moved and not is_changed:
+                self.moved.append((document, state))
+            elif is_moved:
+                # 移动后又有修改，在新位置重新转换，原来的文件在 apply 时删除
+                self.changed.append(document)
+                self._relocated.append((document, state))
+            elif is_changed:
+                self.changed.append(document)
+            else:
+                self.unchanged += 1
+
+        if all_guids is not None:
+            guids = all_guids
+        self.deleted = [(guid, state) for guid, state in self.states.items()
+                        if guid not in guids and (delete_scope is None or delete_scope(guid, state))]
+
+    @classmethod
+    def from_index(cls, wiz_storage: WizStorage, convertor_db: ConvertorDB) -> 'WizSyncPlan':
+        """ 快速路径：把 ConvertorDB 附加到为知数据库，一条 SQL 得出需要处理的笔记
+
+        只为需要处理的笔记创建笔记对象、读取转换记录，全部转换过的账号重新运行时几乎不用等待
+        """
+        convertor_db.flush()
+        wiz_db = wiz_storage.wiz_db
+        wiz_db.attach_convertor_db(convertor_db.db_path)
+        rows = wiz_db.get_sync_pending(Config.always_convert)
+        states = {row[0]: ConvertorState(*row[10:]) for row in rows if row[10] is not None}
+        states.update((row[0], ConvertorState(*row[1:])) for row in wiz_db.get_sync_deleted())
+
+        documents = wiz_storage.load_documents([row[:10] for row in rows])
+        plan = cls(documents, convertor_db, all_guids={row[0] for row in rows}, states=states)
+        plan.unchanged = wiz_storage.document_count - len(rows)
+        return plan
+
+    def get_pending_documents(self) -> list[WizDocument]:
+        """ 需要转换的笔记 """
+        return self.new + self.changed + self.relinked
+
+    def log_summary(self):
+        log.info(f'同步计划：新增 {len(self.new)} 篇，更新 {len(self.changed)} 篇，移动 {len(self.moved)} 篇，'
+                 f'删除 {len(self.deleted)} 篇，无变化 {self.unchanged} 篇')
+
+    def add_link_dependents(self, convertor_db: ConvertorDB, wiz_storage: WizStorage,
+                            document_filter: WizDocumentFilter = None):
+        """ 按 ConvertorDB 中记录的内链，找出链接到输出路径有变化的笔记的其他笔记，加入重新转换
+
+        markdown 中的内链是目标笔记的 `location + output_file_name`，目标移动、改名后原来的内链就失效了；
+        目标删除或新建时，内链也要在失效与可用之间切换。只重新转换这些笔记，不必全量转换。
+        在 `apply` 之后调用，移动失败改为重新转换的笔记不会重复加入
+        """
+        targets = [document.guid for document, _ in self.moved + self._relocated]
+        targets += [guid for guid, _ in self.deleted] + [document.guid for document in self.new]
+        if not targets:
+            return
+        dependents = convertor_db.get_linking_documents(targets)
+        dependents -= {document.guid for document in self.new + self.changed}
+        dependents -= {guid for guid, _ in self.deleted}
+        if not dependents:
+            return
+
+        documents = wiz_storage.get_documents(sorted(dependents))
+        if document_filter is not None:
+            documents = list(document_filter.apply(documents))
+        if any(document.guid not in self.states for document in documents):
+            # 快速路径只读出了需要处理的笔记的转换记录
+            self.states = convertor_db.get_all_state()
+        self.relinked = documents
+        self.unchanged -= len(documents)
+        log.info(f'内链变化，重新转换链接到这些笔记的笔记 {len(documents)} 篇')
+
+    def apply(self, convertor_db: ConvertorDB):
+        """ 执行移动、删除，记录新笔记
+
+        移动失败（如原来的文件已不存在，或新位置已被占用）的笔记，删掉原来的文件，改为在新位置重新转换
+        """
+        for document, state in self.moved:
+            try:
+                moved = _move_converted(document, state)
+            except OSError:
+                log.warning(f'移动笔记失败，将重新转换：{state.location}{state.title} -> {document.location}{document.title}', exc_info=1)
+                moved = False
+            if not moved:
+                _remove_converted(state)
+                self.changed.append(document)
+            convertor_db.update_location(document)
+
+        for document, state in self._relocated:
+            _remove_converted(state)
+            convertor_db.update_location(document)
+
+        if Config.propagate_deletes:
+            for guid, state in self.deleted:
+                log.info(f'笔记已删除：{state.location}{state.title}')
+                _remove_converted(state)
+                convertor_db.delete(guid)
+
+        convertor_db.add_all(self.new)
+
+
+def _get_converted_file(state: ConvertorState) -> Path:
+    """ 按转换记录，得到已转换笔记的输出路径，不含 `.md` 后缀 """
+    return Path(str(Path(Config.output_dir)) + state.location + state.file_name).expanduser()
+
+
+def _remove_converted(state: ConvertorState):
+    """ 删除已转换的笔记及其附件目录 """
+    target_file = _get_converted_file(state)
+    Path(str(target_file) + ".md").unlink(missing_ok=True)
+    shutil.rmtree(str(target_file) + "_Attachments", ignore_errors=True)
+
+
+def _move_converted(document: WizDocument, state: ConvertorState) -> bool:
+    """ 把已转换的笔记及附件目录改名到新位置，并更新 front matter 及正文中引用附件的路径
+
+    Returns:
+        bool: 原来的文件不存在，或新位置已被占用时返回 False
+    """
+    old_file = _get_converted_file(state)
+    new_file = get_target_file(document)
+    old_md = Path(str(old_file) + ".md")
+    new_md = Path(str(new_file) + ".md")
+    if not old_md.exists() or (new_md.exists() and new_md != old_md):
+        return False
+
+    log.info(f'笔记已移动：{state.location}{state.title} -> {document.location}{document.title}')
+    new_md.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(old_md, new_md)
+    old_attachments_dir = Path(str(old_file) + "_Attachments")
+    new_attachments_dir = Path(str(new_file) + "_Attachments")
+    if old_attachments_dir.exists():
+        shutil.rmtree(new_attachments_dir, ignore_errors=True)
+        shutil.move(old_attachments_dir, new_attachments_dir)
+
+    # front matter 重新生成（标题可能变了），正文中引用附件的路径替换为新路径
+    text = new_md.read_text("UTF-8")
+    end = text.find("\n---\n", 3) if text.startswith("---\n") else -1
+    body = text[end + len("\n---\n"):] if end >= 0 else text
+    from .markdown.wiz_md_convertor import get_attachment_relative_path
+    body = body.replace(get_attachment_relative_path(old_attachments_dir), get_attachment_relative_path(new_attachments_dir))
+    atomic_write_text(new_md, build_front_matter(document) + "\n" + body)
+    os.utime(new_md, (document.get_accessed(), document.get_modified()))
+    return True
@@ -0,0 +1,152 @@
+import time
+from pathlib import Path
+from common.log import log
+from config import Config
+from convertor_db import ConvertorDB
+from .wiz_convertor import WizConvertor
+from .wiz_db import WizDB
+from .wiz_document_filter import WizDocumentFilter
+from .wiz_storage import WizStorage
+
+HIGH_WATER_MARK = 'watch_high_water_mark'
+""" ConvertorDB 中记录高水位时间的键 """
+
+
+class WizWatcher(object):
+    """ 监视模式：为知客户端运行时，持续把修改过的笔记同步到输出目录
+
+    - 每隔 `Config.watch_interval` 秒检查 index.db 的修改时间，有变化时才查询数据库
+    - 只查询 `DT_MODIFIED` 不早于高水位时间的笔记，不再遍历全部笔记
+    - 笔记 `Config.watch_debounce` 秒内没有新的修改才转换，连续编辑只转换一次
+    - 高水位时间保存在 ConvertorDB 中，重启后从上次的位置继续；第一次运行时先全量同步
+    - 转换失败的笔记隔 `Config.watch_retry_interval` 秒重试，高水位时间不越过它们
+
+    只移动、不修改的笔记 `DT_MODIFIED` 不变，不会触发转换，下次正常运行时同步
+    """
+
+    wiz_db: WizDB
+    convertor_db: ConvertorDB
+    wiz_storage: WizStorage
+    document_filter: WizDocumentFilter
+
+    high_water_mark: str
+    """ 这个时间之前修改的笔记都已转换，格式为：`%Y-%m-%d %H:%M:%S` """
+
+    _pending: dict[str, tuple[str, float]]
+    """ 待转换的笔记：guid -> (DT_MODIFIED, 发现这次修改的时间)；转换失败的笔记，时间推后到重试的时候 """
+
+    _converted: dict[str, str]
+    """ 已转换的笔记：guid -> DT_MODIFIED，避免高水位时间附近的笔记重复转换 """
+
+    _index_mtime: tuple
+    """ 上次查询时 index.db 及其 WAL 文件的修改时间 """
+
+    def __init__(self, wiz_dir: Path, wiz_db: WizDB, convertor_db: ConvertorDB, wiz_storage: WizStorage,
+                 document_filter: WizDocumentFilter = None) -> None:
+        self.wiz_dir = wiz_dir
+        self.wiz_db = wiz_db
+        self.convertor_db = convertor_db
+        self.wiz_storage = wiz_storage
+        self.document_filter = document_filter
+        self.high_water_mark = None
+        self._pending = {}
+        self._converted = {}
+        self._index_mtime = None
+
+    def run(self):
+        """ 持续监视，直到按 Ctrl+C
+        """
+        self.start()
+        log.info(f'开始监视为知笔记的修改，每 {Config.watch_interval} 秒检查一次，按 Ctrl+C 退出')
+        try:
+            while True:
+                self.poll()
+                time.sleep(Config.watch_interval)
+        except KeyboardInterrupt:
+            log.info('退出监视模式')
+
+    def start(self):
+        """ 读取高水位时间；没有记录时，先全量同步一次
+        """
+        self.high_water_mark = self.convertor_db.get_meta(HIGH_WATER_MARK)
+        if self.high_water_mark is None:
+            # 先取时间再同步，同步期间修改的笔记下次查询时还会查到
+            high_water_mark = self.wiz_db.get_max_modified() or ''
+            WizConvertor(self.convertor_db, self.wiz_storage, self.document_filter)
+            self._save_high_water_mark(high_water_mark)
+            # 同步期间又修改过的笔记，读取时间早于修改时间，不算已转换，下次查询时转换
+            states = self.convertor_db.get_all_state()
+            for guid, modified in self.wiz_db.get_modified_since(high_water_mark):
+                state = states.get(guid)
+                if state is not None and state.success and state.extract_time and state.extract_time >= modified:
+                    self._converted[guid] = modified
+        log.debug(f'高水位时间：{self.high_water_mark}')
+
+    def poll(self, now: float = None) -> int:
+        """ 检查一次：index.db 有变化时查询修改过的笔记，并转换已稳定的笔记
+
+        Returns:
+            int: 这次转换的笔记数
+        """
+        now = time.monotonic() if now is None else now
+        if self._index_changed():
+            self._find_modified(now)
+        return self._convert_ready(now)
+
+    def _index_changed(self) -> bool:
+        mtime = tuple(_get_mtime(self.wiz_dir.joinpath(name)) for name in ('index.db', 'index.db-wal'))
+        if mtime == self._index_mtime:
+            return False
+        self._index_mtime = mtime
+        return True
+
+    def _find_modified(self, now: float):
+        for guid, modified in self.wiz_db.get_modified_since(self.high_water_mark):
+            if self._converted.get(guid) == modified:
+                continue
+            pending = self._pending.get(guid)
+            if pending is None or pending[0] != modified:
+                # 新的修改，重新开始计时
+                self._pending[guid] = (modified, now)
+
+    def _convert_ready(self, now: float) -> int:
+        ready = [guid for guid, (_, found) in self._pending.items() if now - found >= Config.watch_debounce]
+        if not ready:
+            return 0
+
+        self.wiz_storage.refresh()
+        documents = self.wiz_storage.get_documents(ready)
+        log.info(f'转换修改过的笔记 {len(documents)} 篇')
+        failed = WizConvertor(self.convertor_db, self.wiz_storage, self.document_filter, documents).report.failed_guids
+        converted = len(documents) - len(failed)
+
+        # 转换失败的笔记留在待转换中，稍后重试
+        for guid in ready:
+            if guid in failed:
+                modified = self._pending[guid][0]
+                self._pending[guid] = (modified, now + Config.watch_retry_interval - Config.watch_debounce)
+                continue
+            self._converted[guid] = self._pending.pop(guid)[0]
+        if failed:
+            log.warning(f'{len(failed)} 篇笔记转换失败，{Config.watch_retry_interval} 秒后重试')
+        if not self._converted:
+            return converted
+        # 还在等待的笔记可能比已转换的更早，高水位时间不能越过它们
+        high_water_mark = max(self._converted.values())
+        if self._pending:
+            high_water_mark = min(high_water_mark, min(modified for modified, _ in self._pending.values()))
+        self._save_high_water_mark(max(self.high_water_mark, high_water_mark))
+        return converted
+
+    def _save_high_water_mark(self, high_water_mark: str):
+        self.high_water_mark = high_water_mark
+        self.convertor_db.set_meta(HIGH_WATER_MARK, high_water_mark)
+        # 早于高水位时间的笔记不会再被查到，不必再记录
+        self._converted = {guid: modified for guid, modified in self._converted.items() if modified >= high_water_mark}
+
+
+def _get_mtime(path: Path) -> int:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
@@ -0,0 +1,204 @@
+""" 生成模拟的为知笔记数据目录，用于性能测试
+
+生成的目录结构与为知笔记一致：
+- `index.db`：WIZ_DOCUMENT、WIZ_TAG、WIZ_DOCUMENT_TAG、WIZ_DOCUMENT_ATTACHMENT 四张表
+- `文件夹/标题.ziw`：zip 压缩包，`index.html` 为正文，`index_files/` 下是图片，todolist 笔记另有 `wiz_todolist.xml`
+- `文件夹/标题_Attachments/`：附件
+
+同样的参数、同样的随机种子，生成的内容完全相同
+
+用法：python tests/benchmark/kb_generator.py <数据目录> --notes 1000
+"""
+import argparse
+import random
+import shutil
+import sqlite3
+import uuid
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+
+SCHEMA = '''
+CREATE TABLE WIZ_DOCUMENT (
+    DOCUMENT_GUID TEXT PRIMARY KEY, DOCUMENT_TITLE TEXT, DOCUMENT_LOCATION TEXT, DOCUMENT_NAME TEXT,
+    DOCUMENT_TYPE TEXT, DT_CREATED TEXT, DT_MODIFIED TEXT, DT_ACCESSED TEXT, DOCUMENT_URL TEXT,
+    DOCUMENT_ATTACHEMENT_COUNT INTEGER
+);
+CREATE TABLE WIZ_TAG (TAG_GUID TEXT PRIMARY KEY, TAG_NAME TEXT, TAG_GROUP_GUID TEXT);
+CREATE TABLE WIZ_DOCUMENT_TAG (DOCUMENT_GUID TEXT, TAG_GUID TEXT);
+CREATE TABLE WIZ_DOCUMENT_ATTACHMENT (ATTACHMENT_GUID TEXT, DOCUMENT_GUID TEXT, ATTACHMENT_NAME TEXT, DT_DATA_MODIFIED TEXT);
+'''
+
+WORDS = ['为知', '笔记', 'Obsidian', 'markdown', '转换', 'python', '性能', 'index', '附件', '图片',
+         'lorem', 'ipsum', 'dolor', 'sit', 'amet', '数据库', '标签', '文件夹', 'link', 'todo']
+
+
+@dataclass
+class KBSpec:
+    """ 模拟知识库的规模与内容比例 """
+
+    notes: int = 200
+    """ 笔记数 """
+
+    folders: int = 20
+    """ 文件夹数，笔记平均分布在各文件夹中 """
+
+    tags: int = 30
+    """ 标签数，按三层嵌套生成 """
+
+    html_size: int = 8 * 1024
+    """ index.html 的平均大小（字节），实际大小在 1/4 ~ 2 倍之间随机 """
+
+    images: int = 3
+    """ 每篇笔记的平均图片数 """
+
+    image_size: int = 20 * 1024
+    """ 每张图片的平均大小（字节） """
+
+    shared_image_ratio: float = 0.3
+    """ 图片中，多篇笔记共用同一张（相同内容）的比例 """
+
+    link_ratio: float = 0.3
+    """ 含内链的笔记比例 """
+
+    attachment_ratio: float = 0.1
+    """ 有附件的笔记比例 """
+
+    todolist_ratio: float = 0.05
+    """ todolist 笔记的比例 """
+
+    gbk_ratio: float = 0.1
+    """ 以 GBK 编码保存 index.html 的笔记比例 """
+
+    seed: int = 1
+
+
+def generate_kb(data_dir: Path, spec: KBSpec) -> Path:
+    """ 在 data_dir 下生成模拟的为知笔记数据目录，目录已存在时先删除
+
+    Returns:
+        Path: 数据目录
+    """
+    rnd = random.Random(spec.seed)
+    if data_dir.exists():
+        shutil.rmtree(data_dir)
+    data_dir.mkdir(parents=True)
+
+    db = sqlite3.connect(data_dir.joinpath('index.db'))
+    db.executescript(SCHEMA)
+
+    tag_guids = _generate_tags(db, spec, rnd)
+    guids = [str(uuid.UUID(int=rnd.getrandbits(128))) for _ in range(spec.notes)]
+    folders = [f'/My Notes/分类{i // 5}/文件夹{i}/' for i in range(spec.folders)]
+    shared_images = [rnd.randbytes(spec.image_size) for _ in range(10)]
+
+    for i, guid in enumerate(guids):
+        location = folders[i % len(folders)]
+        title = f'笔记 {i}' + ('.md' if rnd.random() < 0.1 else '')
+        name = f'{title}.ziw'
+        modified = f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d} 10:00:00'
+        is_todolist = rnd.random() < spec.todolist_ratio
+
+        folder = data_dir.joinpath(location.strip('/'))
+        folder.mkdir(parents=True, exist_ok=True)
+
+        attachments = []
+        if rnd.random() < spec.attachment_ratio:
+            attachments_dir = folder.joinpath(f'{title}_Attachments')
+            attachments_dir.mkdir(exist_ok=True)
+            for k in range(rnd.randint(1, 3)):
+                attachment = (str(uuid.UUID(int=rnd.getrandbits(128))), guid, f'附件{k}.txt', modified)
+                attachments_dir.joinpath(attachment[2]).write_text(f'附件 {attachment[0]}', 'UTF-8')
+                attachments.append(attachment)
+        db.executemany('INSERT INTO WIZ_DOCUMENT_ATTACHMENT VALUES (?, ?, ?, ?)', attachments)
+
+        db.execute('INSERT INTO WIZ_DOCUMENT VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                   (guid, title, location, name, 'todolist2' if is_todolist else 'document',
+                    '2024-01-01 10:00:00', modified, modified,
+                    f'https://example.com/{i}' if rnd.random() < 0.2 else None, len(attachments)))
+        db.executemany('INSERT INTO WIZ_DOCUMENT_TAG VALUES (?, ?)',
+                       [(guid, tag) for tag in rnd.sample(tag_guids, min(len(tag_guids), rnd.randint(0, 3)))])
+
+        images = {}
+        for k in range(rnd.randint(0, spec.images * 2)):
+            if rnd.random() < spec.shared_image_ratio:
+                index = rnd.randrange(len(shared_images))
+                images[f'shared{index}.png'] = shared_images[index]
+            else:
+                images[f'image{k}.png'] = rnd.randbytes(rnd.randint(spec.image_size // 4, spec.image_size * 2))
+
+        links = [rnd.choice(guids) for _ in range(rnd.randint(1, 5))] if rnd.random() < spec.link_ratio else []
+        encoding = 'gbk' if rnd.random() < spec.gbk_ratio else 'utf-8'
+        html = _generate_html(rnd, spec, i, list(images), links, attachments, encoding)
+
+        with zipfile.ZipFile(folder.joinpath(name), 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr('index.html', html.encode(encoding))
+            for image_name, data in images.items():
+                z.writestr(f'index_files/{image_name}', data)
+            if is_todolist:
+                z.writestr('index_files/wiz_todolist.xml', _generate_todolist(rnd))
+
+    db.commit()
+    db.close()
+    return data_dir
+
+
+def _generate_tags(db: sqlite3.Connection, spec: KBSpec, rnd: random.Random) -> list[str]:
+    """ 生成三层嵌套的标签 """
+    tags = []
+    for i in range(spec.tags):
+        guid = str(uuid.UUID(int=rnd.getrandbits(128)))
+        # 前 1/3 为顶层标签，其余挂在前面的标签下
+        parent = tags[rnd.randrange(len(tags))][0] if tags and i >= spec.tags // 3 else None
+        tags.append((guid, f'标签{i}', parent))
+    db.executemany('INSERT INTO WIZ_TAG VALUES (?, ?, ?)', tags)
+    return [tag[0] for tag in tags]
+
+
+def _generate_html(rnd: random.Random, spec: KBSpec, i: int, images: list[str], links: list[str],
+                   attachments: list[tuple], encoding: str) -> str:
+    parts = [f'<html><head><meta http-equiv="Content-Type" content="text/html; charset={encoding}"></head><body>',
+             f'<h1>笔记 {i}</h1>']
+    for image in images:
+        parts.append(f'<p><img src="index_files/{image}" style="max-width: 100%"></p>')
+    for guid in links:
+        parts.append(f'<p><a href="wiz://open_document?guid={guid}&amp;kbguid=&amp;private_kbguid=">相关笔记</a></p>')
+    for attachment in attachments:
+        parts.append(f'<p><a href="wiz://open_attachment?guid={attachment[0]}">{attachment[2]}</a></p>')
+    if i % 4 == 0:
+        parts.append('<ul><li>列表</li><ul><li>嵌套列表</li></ul></ul>')
+    if i % 5 == 0:
+        parts.append('<pre class="brush:python;toolbar:false">def hello():\n    print("你好")</pre>')
+    if i % 6 == 0:
+        parts.append('<table><tr><th>名称</th><th>数量</th></tr><tr><td>为知</td><td>1</td></tr></table>')
+
+    target_size = rnd.randint(spec.html_size // 4, spec.html_size * 2)
+    size = sum(len(part) for part in parts)
+    while size < target_size:
+        paragraph = '<p>' + ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(10, 60))) + '</p>'
+        parts.append(paragraph)
+        size += len(paragraph.encode('utf-8'))
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def _generate_todolist(rnd: random.Random) -> str:
+    todos = ''.join(f'<todo Text="任务{k}" Complete="{rnd.choice((0, 4))}"><todo Text="子任务{k}" Complete="0"/></todo>'
+                    for k in range(rnd.randint(1, 5)))
+    return f'<root>{todos}</root>'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成模拟的为知笔记数据目录')
+    parser.add_argument('data_dir', type=Path, help='生成的数据目录，已存在时会被删除')
+    defaults = KBSpec()
+    for name, value in vars(defaults).items():
+        parser.add_argument(f'--{name.replace("_", "-")}', type=type(value), default=value)
+    args = parser.parse_args()
+    spec = KBSpec(**{name: getattr(args, name) for name in vars(defaults)})
+    generate_kb(args.data_dir, spec)
+    print(f'已生成 {spec.notes} 篇笔记：{args.data_dir}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+""" 内存测试：测量每篇笔记的元数据（WizDocument 及其附件、标签）占用的内存
+
+不读写磁盘，直接在内存中构造笔记；用 tracemalloc 统计构造前后的内存差，除以笔记数
+- 构造后：刚从数据库读出，同步计划只用到 guid、标题、文件夹、修改时间
+- 使用后：访问过 ziw 路径、附件目录、时间戳等，相当于转换时
+
+用法：python tests/benchmark/memory_benchmark.py --notes 100000
+"""
+import argparse
+import gc
+import sys
+import tracemalloc
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent.joinpath('src')))
+from wiz.entity.wiz_attachment import WizAttachment
+from wiz.entity.wiz_document import WizDocument
+from wiz.entity.wiz_tag import WizTag, WizTagTree
+
+
+def _build_documents(count: int, tags: list[WizTag]) -> list[WizDocument]:
+    wiz_dir = Path('/data/My Knowledge/Data/user@example.com')
+    documents = []
+    for i in range(count):
+        guid = str(uuid.UUID(int=i))
+        title = f'笔记标题 {i}'
+        attachment_count = 1 if i % 10 == 0 else 0
+        document = WizDocument(guid, title, f'/My Notes/分类{i % 50}/文件夹{i % 500}/', f'{title}.ziw', 'document',
+                               '2024-01-01 10:00:00', f'2024-02-{i % 28 + 1:02d} 10:00:00', '2024-03-01 10:00:00',
+                               None, attachment_count, wiz_dir)
+        document.resolve_attachments([WizAttachment(str(uuid.UUID(int=i + count)), guid, '附件.pdf', '2024-01-01 10:00:00')
+                                      for _ in range(attachment_count)])
+        document.resolve_tags([tags[i % len(tags)]] if i % 3 else [])
+        documents.append(document)
+    return documents
+
+
+def _use_documents(documents: list[WizDocument]):
+    """ 访问转换时会用到的属性 """
+    for document in documents:
+        document.file
+        document.attachments_dir
+        document.output_file_name
+        document.get_modified()
+        document.get_accessed()
+
+
+def measure(count: int) -> tuple[float, float]:
+    """
+    Returns:
+        tuple[float, float]: 构造后、使用后每篇笔记占用的字节数
+    """
+    tags = [WizTag(f'tag-{i}', f'标签{i}', f'tag-{i - 1}' if i else None) for i in range(20)]
+    WizTagTree(tags)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    documents = _build_documents(count, tags)
+    gc.collect()
+    built = tracemalloc.get_traced_memory()[0]
+    _use_documents(documents)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (built - before) / count, (used - before) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='每篇笔记元数据占用的内存')
+    parser.add_argument('--notes', type=int, default=100000, help='构造的笔记数')
+    args = parser.parse_args()
+
+    built, used = measure(args.notes)
+    print(f'{args.notes} 篇笔记，每篇占用：构造后 {built:.0f} 字节，使用后 {used:.0f} 字节')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+""" 性能测试：生成模拟的为知笔记数据，测量各阶段的耗时与内存峰值，结果追加到 output/benchmark/results.jsonl
+
+测量的阶段，每个阶段在单独的子进程中运行，互不影响：
+- startup：读取为知数据库，初始化 `WizStorage`
+- convert：全量转换（输出目录为空）
+- rerun：再次运行，没有需要转换的笔记
+
+每次结果以当前 git commit 为键记录下来，并与上一次不同 commit 的结果对比，方便发现性能退化
+
+用法：python tests/benchmark/run_benchmark.py --notes 1000 --jobs 4
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块，见 `_peak_rss_mb`
+    resource = None
+
+BENCHMARK_DIR = Path(__file__).parent
+ROOT_DIR = BENCHMARK_DIR.parent.parent
+SRC_DIR = ROOT_DIR.joinpath('src')
+RESULTS_FILE = ROOT_DIR.joinpath('output', 'benchmark', 'results.jsonl')
+""" 与转换输出一样放在 output 下，不写入源码目录 """
+
+PHASES = ['startup', 'convert', 'rerun']
+
+sys.path.insert(0, str(BENCHMARK_DIR))
+from kb_generator import KBSpec, generate_kb
+
+
+def run_phase(phase: str, data_dir: Path, work_dir: Path, jobs: int) -> dict:
+    """ 在当前进程中运行一个阶段（由子进程调用）
+
+    Returns:
+        dict: seconds 耗时，peak_rss_mb 进程内存峰值，无法测量时为 None
+    """
+    sys.path.insert(0, str(SRC_DIR))
+    import logging
+    from config import Config
+    Config.convertor_db_path = str(work_dir.joinpath('convertor.db'))
+    Config.output_dir = str(work_dir.joinpath('notes'))
+    Config.temp_dir = str(work_dir.joinpath('temp'))
+    Config.image_cache_dir = str(work_dir.joinpath('image_cache'))
+    Config.conversion_cache_path = str(work_dir.joinpath('conversion_cache.db'))
+    Config.jobs = jobs
+
+    from convertor_db import ConvertorDB
+    from wiz.wiz_db import WizDB
+    from wiz.wiz_storage import WizStorage
+    from wiz.wiz_convertor import WizConvertor
+    logging.getLogger().setLevel(logging.WARNING)
+
+    start = time.perf_counter()
+    # 转换过程中会逐篇 print 进度，不计入测量
+    with contextlib.redirect_stdout(io.StringIO()):
+        convertor_db = ConvertorDB()
+        wiz_storage = WizStorage(data_dir, WizDB(data_dir), convertor_db)
+        if phase != 'startup':
+            WizConvertor(convertor_db, wiz_storage)
+    seconds = time.perf_counter() - start
+    peak_rss_mb = _peak_rss_mb()
+    return {'seconds': round(seconds, 3), 'peak_rss_mb': round(peak_rss_mb, 1) if peak_rss_mb is not None else None}
+
+
+def _peak_rss_mb() -> float:
+    """ 进程内存峰值（MB），无法测量时返回 None
+
+    多进程转换时，取主进程与子进程中较大的；Windows 上用 psutil（需另外安装），只统计主进程
+    """
+    if resource is not None:
+        peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                       resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        # ru_maxrss 在 macOS 上单位是字节，Linux 上是 KB
+        return peak_rss / 1024 / 1024 if sys.platform == 'darwin' else peak_rss / 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    memory = psutil.Process().memory_info()
+    return getattr(memory, 'peak_wset', memory.rss) / 1024 / 1024
+
+
+def _run_phase_in_subprocess(phase: str, data_dir: Path, work_dir: Path, jobs: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, '--phase', phase, '--data-dir', str(data_dir), '--work-dir', str(work_dir), '--jobs', str(jobs)],
+        check=True, stdout=subprocess.PIPE, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _git_commit() -> str:
+    """ 当前 commit，工作区有未提交的修改时加上 `-dirty` """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, check=True,
+                                stdout=subprocess.PIPE, text=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT_DIR, check=True,
+                               stdout=subprocess.PIPE, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + '-dirty' if dirty else commit
+
+
+def _load_results() -> list[dict]:
+    if not RESULTS_FILE.exists():
+        return []
+    with open(RESULTS_FILE, encoding='UTF-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _print_comparison(result: dict, previous: dict):
+    print(f'\n{"阶段":<10}{"耗时(秒)":>12}{"内存峰值(MB)":>16}', end='')
+    if previous:
+        print(f'    对比 {previous["commit"]}', end='')
+    print()
+    for phase in PHASES:
+        current = result['phases'][phase]
+        peak_rss_mb = current['peak_rss_mb']
+        line = f'{phase:<10}{current["seconds"]:>12.3f}' + (f'{peak_rss_mb:>16.1f}' if peak_rss_mb is not None else f'{"-":>16}')
+        if previous and phase in previous['phases']:
+            before = previous['phases'][phase]
+            change = (current['seconds'] - before['seconds']) / before['seconds'] * 100 if before['seconds'] else 0
+            line += f'    耗时 {change:+.1f}%'
+            if peak_rss_mb is not None and before.get('peak_rss_mb') is not None:
+                line += f'，内存 {peak_rss_mb - before["peak_rss_mb"]:+.1f} MB'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='为知笔记转换的性能测试')
+    parser.add_argument('--notes', type=int, default=KBSpec.notes, help='模拟的笔记数')
+    parser.add_argument('--html-size', type=int, default=KBSpec.html_size, help='index.html 的平均大小（字节）')
+    parser.add_argument('--images', type=int, default=KBSpec.images, help='每篇笔记的平均图片数')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='转换使用的进程数')
+    parser.add_argument('--repeat', type=int, default=1, help='每个阶段重复的次数，取最快的一次')
+    parser.add_argument('--keep', type=Path, help='保留生成的数据与输出到这个目录，默认使用临时目录，结束后删除')
+    parser.add_argument('--no-save', action='store_true', help='不写入 results.jsonl')
+    parser.add_argument('--phase', choices=PHASES, help=argparse.SUPPRESS)
+    parser.add_argument('--data-dir', type=Path, help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # 子进程：只运行一个阶段，把结果输出到 stdout
+    if args.phase:
+        print(json.dumps(run_phase(args.phase, args.data_dir, args.work_dir, args.jobs)))
+        return
+
+    spec = KBSpec(notes=args.notes, html_size=args.html_size, images=args.images)
+    base_dir = args.keep or Path(tempfile.mkdtemp(prefix='wiz-benchmark-'))
+    try:
+        data_dir = base_dir.joinpath('data')
+        start = time.perf_counter()
+        generate_kb(data_dir, spec)
+        print(f'已生成 {spec.notes} 篇笔记，耗时 {time.perf_counter() - start:.2f} 秒')
+
+        phases = {}
+        for _ in range(args.repeat):
+            work_dir = base_dir.joinpath('work')
+            shutil.rmtree(work_dir, ignore_errors=True)
+            work_dir.mkdir(parents=True)
+            for phase in PHASES:
+                measured = _run_phase_in_subprocess(phase, data_dir, work_dir, args.jobs)
+                if phase not in phases or measured['seconds'] < phases[phase]['seconds']:
+                    phases[phase] = measured
+    finally:
+        if not args.keep:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    result = {
+        'commit': _git_commit(),
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'spec': vars(spec),
+        'jobs': args.jobs,
+        'phases': phases,
+    }
+    # 与上一次相同规模、不同 commit 的结果对比
+    previous = next((r for r in reversed(_load_results())
+                     if r['spec'] == result['spec'] and r['jobs'] == result['jobs'] and r['commit'] != result['commit']), None)
+    _print_comparison(result, previous)
+
+    if not args.no_save:
+        RESULTS_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(RESULTS_FILE, 'a', encoding='UTF-8') as f:
+            f.write(json.dumps(result, ensure_ascii=False) + '\n')
+        print(f'\n结果已保存：{RESULTS_FILE}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+import codecs
+
+import pytest
+
+from common.utils import atomic_write_text, decode_html
+
+TEXT = "<p>为知笔记转 Obsidian，中文内容</p>"
+
+
+def test_atomic_write_text_keeps_original_error(tmp_path):
+    target = tmp_path.joinpath("missing", "note.md")
+    # 目录不存在，临时文件创建失败，抛出的应当是原来的异常
+    with pytest.raises(FileNotFoundError) as e:
+        atomic_write_text(target, "内容")
+    assert e.value.__context__ is None
+
+    target = tmp_path.joinpath("note.md")
+    target.write_text("旧内容", "UTF-8")
+    with pytest.raises(LookupError):
+        atomic_write_text(target, "新内容", encoding="no-such-encoding")
+    assert target.read_text("UTF-8") == "旧内容"
+    assert [path.name for path in tmp_path.iterdir()] == ["note.md"]
+
+
+@pytest.mark.parametrize("html_bytes, expected_tier", [
+    (codecs.BOM_UTF16_LE + TEXT.encode("utf-16-le"), "bom"),
+    (codecs.BOM_UTF8 + TEXT.encode("utf-8"), "bom"),
+    ('<meta charset="gbk">'.encode("ascii") + TEXT.encode("gbk"), "meta"),
+    # 声明为 UTF-16 但能按 ASCII 读出声明，实际按 UTF-8 解码
+    ('<meta charset="utf-16">'.encode("ascii") + TEXT.encode("utf-8"), "meta"),
+    (TEXT.encode("utf-8"), "utf-8"),
+    ((TEXT * 20).encode("gb18030"), "chardet"),
+])
+def test_decode_html_tiers(html_bytes, expected_tier):
+    text, tier = decode_html(html_bytes)
+    assert tier == expected_tier
+    assert TEXT in text
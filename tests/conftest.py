@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 与运行时一样，把 src 目录加到 sys.path 中
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath("src")))
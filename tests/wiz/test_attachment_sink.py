@@ -0,0 +1,76 @@
+import io
+import os
+
+import pytest
+
+from config import Config
+from wiz import wiz_attachment_sink
+from wiz.wiz_attachment_sink import AttachmentSink
+
+CONTENT = b"shared screenshot" * 100
+MTIMES = [1700000000, 1700001000, 1700002000]
+
+
+def _place_all(sink, targets, content=CONTENT):
+    for target, mtime in zip(targets, MTIMES):
+        sink.place(target, len(content), mtime, lambda: io.BytesIO(content))
+    return sink.take_stats()
+
+
+@pytest.fixture
+def targets(tmp_path):
+    return [tmp_path.joinpath(f"note{i}_Attachments", "a.png") for i in range(3)]
+
+
+@pytest.fixture(autouse=True)
+def make_dirs(targets):
+    for target in targets:
+        target.parent.mkdir()
+
+
+def _reflink_unsupported(source, target):
+    raise OSError("不支持 reflink")
+
+
+@pytest.mark.parametrize("mode", ["copy", "hardlink", "reflink"])
+def test_unchanged_files_are_skipped(targets, monkeypatch, mode):
+    monkeypatch.setattr(Config, "attachment_dedupe", mode)
+    # reflink 不可用时改为复制
+    monkeypatch.setattr(wiz_attachment_sink, "_reflink", _reflink_unsupported)
+    copied, deduplicated, skipped = _place_all(AttachmentSink(), targets)
+    assert all(target.read_bytes() == CONTENT for target in targets)
+    assert (copied, deduplicated, skipped) == ((len(CONTENT), 2 * len(CONTENT), 0) if mode == "hardlink"
+                                               else (3 * len(CONTENT), 0, 0))
+
+    # 再次运行（新的 sink，没有本次运行的去重记录），内容都没有变化，全部跳过
+    assert _place_all(AttachmentSink(), targets) == (0, 0, 3 * len(CONTENT))
+
+
+def test_hardlink_keeps_shared_mtime(targets, monkeypatch):
+    monkeypatch.setattr(Config, "attachment_dedupe", "hardlink")
+    _place_all(AttachmentSink(), targets)
+    assert targets[0].stat().st_nlink == 3
+    # 链接的文件不改共用 inode 的修改时间，第一个文件的修改时间不被后面的覆盖
+    assert all(int(target.stat().st_mtime) == MTIMES[0] for target in targets)
+
+
+def test_changed_content_is_copied(targets, monkeypatch):
+    monkeypatch.setattr(Config, "attachment_dedupe", "hardlink")
+    _place_all(AttachmentSink(), targets)
+
+    # 同样大小、同样修改时间，内容不同，仍然重新写入；硬链接的其他文件不受影响
+    changed = CONTENT[::-1]
+    sink = AttachmentSink()
+    sink.place(targets[1], len(changed), MTIMES[1], lambda: io.BytesIO(changed))
+    assert sink.take_stats() == (len(changed), 0, 0)
+    assert targets[1].read_bytes() == changed and int(targets[1].stat().st_mtime) == MTIMES[1]
+    assert targets[0].read_bytes() == targets[2].read_bytes() == CONTENT
+
+
+def test_mtime_change_is_copied(targets, monkeypatch):
+    monkeypatch.setattr(Config, "attachment_dedupe", "copy")
+    _place_all(AttachmentSink(), targets[:1])
+    os.utime(targets[0], (0, 0))
+    assert _place_all(AttachmentSink(), targets[:1]) == (len(CONTENT), 0, 0)
+    assert int(targets[0].stat().st_mtime) == MTIMES[0]
+    assert not list(targets[0].parent.glob(".*.tmp"))
@@ -0,0 +1,43 @@
+from pathlib import Path
+
+from wiz.entity.wiz_attachment import WizAttachment
+from wiz.wiz_conversion_cache import CacheEntry, ConversionCache, make_cache_key
+
+HTML = (b'<p><a href="wiz://open_document/?guid=doc-2&amp;kbguid=">note</a>'
+        b'<a href="wiz://open_attachment?guid=att-1">file</a><img src="https://a.com/x.png"></p>')
+ATTACHMENTS = {"att-1": WizAttachment("att-1", "doc-1", "a.pdf", "2024-01-01 00:00:00")}
+LINK_TARGETS = {"doc-2": "/My Notes/b", "doc-3": "/My Notes/c"}
+
+
+def _key(html=HTML, path="My Notes/a_Attachments/", attachments=ATTACHMENTS, link_targets=LINK_TARGETS, remote_images=None):
+    return make_cache_key(html, path, attachments, link_targets, remote_images or {})
+
+
+def test_cache_key_depends_on_used_context():
+    key = _key()
+    assert _key() == key
+    assert _key(html=HTML + b' ') != key
+    assert _key(path="My Notes/moved_Attachments/") != key
+    assert _key(link_targets={**LINK_TARGETS, "doc-2": "/My Notes/renamed"}) != key
+    assert _key(attachments={"att-1": WizAttachment("att-1", "doc-1", "b.pdf", "2024-01-01 00:00:00")}) != key
+    assert _key(remote_images={"https://a.com/x.png": Path("abc.png")}) != key
+    # 没有被这篇笔记引用的笔记改名，不影响缓存
+    assert _key(link_targets={**LINK_TARGETS, "doc-3": "/My Notes/renamed"}) == key
+
+
+def test_put_get_and_lru_eviction(tmp_path):
+    cache = ConversionCache(str(tmp_path.joinpath("cache.db")))
+    try:
+        entry = CacheEntry("# 标题\n", "utf-8", ["index_files/a.png"], ["missing"])
+        for i in range(5):
+            cache.put(f"key-{i}", entry)
+        cache.touch("key-0")
+        assert cache.get("key-0") == entry
+        assert cache.get("nope") is None
+
+        size = cache.query_scalar("SELECT size FROM conversion_cache WHERE key = 'key-0'")
+        cache.evict(size * 2)
+        keys = {row[0] for row in cache.query_list("SELECT key FROM conversion_cache")}
+        assert keys == {"key-0", "key-4"}
+    finally:
+        cache.close()
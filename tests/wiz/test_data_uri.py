@@ -0,0 +1,62 @@
+import base64
+import logging
+
+from wiz.wiz_attachment_sink import AttachmentSink
+from wiz.wiz_data_uri import extract_data_uris
+from wiz.wiz_note_file import ExtractedNoteFile
+
+PNG = bytes(range(256)) * 40
+GIF = b"GIF89a" + bytes(100)
+
+
+def _data_uri(mime: str, data: bytes, fold: bool = False) -> str:
+    payload = base64.b64encode(data).decode("ascii")
+    if fold:
+        payload = "\n".join(payload[i:i + 76] for i in range(0, len(payload), 76))
+    return f"data:{mime};base64,{payload}"
+
+
+def test_extract_data_uris(tmp_path):
+    html = (f'<p><img src="{_data_uri("image/png", PNG)}" alt="a"></p>'
+            f"<p><img src='{_data_uri('image/png', PNG, fold=True)}'></p>"
+            f'<p><img class="x" src="{_data_uri("image/gif", GIF)}"></p>'
+            f'<p><img src="data:image/png;base64,%2Fabc"></p>'
+            f'<p><img src="index_files/a.png"></p>').encode("utf-8")
+    note_file = ExtractedNoteFile(tmp_path.joinpath("extract"), AttachmentSink())
+    target_dir = tmp_path.joinpath("note_Attachments")
+
+    result = extract_data_uris(html, note_file, target_dir, 1700000000).decode("utf-8")
+
+    assert "base64,iVBOR" not in result and len(result) < 400
+    # 内容相同的图片（包括换行折叠过的）只写入一次，文件名相同
+    assert len(note_file.inline_resources) == 2
+    png, gif = sorted(note_file.inline_resources, key=lambda src: src.endswith(".gif"))
+    assert png.startswith("index_files/data-") and png.endswith(".png") and gif.endswith(".gif")
+    assert result.count(f'src="{png}"') == 1 and result.count(f"src='{png}'") == 1
+    assert target_dir.joinpath(png[len("index_files/"):]).read_bytes() == PNG
+    assert target_dir.joinpath(gif[len("index_files/"):]).read_bytes() == GIF
+    # 不完整的 base64 及普通图片保留原样
+    assert 'src="data:image/png;base64,%2Fabc"' in result
+    assert 'src="index_files/a.png"' in result
+
+
+def test_no_data_uri_returns_original(tmp_path):
+    html = b'<p><img src="index_files/a.png"></p>'
+    note_file = ExtractedNoteFile(tmp_path, AttachmentSink())
+    assert extract_data_uris(html, note_file, tmp_path.joinpath("att"), 0) is html
+    assert not tmp_path.joinpath("att").exists()
+
+
+def test_malformed_payload_kept(tmp_path, caplog):
+    html = (b'<p><img src="data:image/png;base64,AAAAA"></p>'
+            b'<p><img src="data:image/png;base64,AB=CDEFG"></p>'
+            + f'<p><img src="{_data_uri("image/gif", GIF)}"></p>'.encode("ascii"))
+    note_file = ExtractedNoteFile(tmp_path, AttachmentSink())
+
+    with caplog.at_level(logging.WARNING):
+        result = extract_data_uris(html, note_file, tmp_path.joinpath("att"), 0)
+
+    # 有误的 data URI 原样保留，不影响同一篇笔记中的其他图片
+    assert b'src="data:image/png;base64,AAAAA"' in result and b'src="data:image/png;base64,AB=CDEFG"' in result
+    assert len(note_file.inline_resources) == 1
+    assert caplog.text.count("base64 内容有误") == 2
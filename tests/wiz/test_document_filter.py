@@ -0,0 +1,57 @@
+import pytest
+
+from config import Config
+from convertor_db import ConvertorDB, ConvertorState
+from tests.benchmark.kb_generator import KBSpec, generate_kb
+from wiz.wiz_db import WizDB
+from wiz.wiz_document_filter import WizDocumentFilter, parse_shard
+from wiz.wiz_storage import WizStorage
+
+SPEC = KBSpec(notes=40, folders=4, tags=6, html_size=256, images=0)
+
+
+@pytest.fixture(scope="module")
+def documents(tmp_path_factory):
+    data_dir = generate_kb(tmp_path_factory.mktemp("kb").joinpath("data"), SPEC)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(Config, "convertor_db_path", str(tmp_path_factory.mktemp("db").joinpath("convertor.db")))
+        return list(WizStorage(data_dir, WizDB(data_dir), ConvertorDB()).iter_documents())
+
+
+@pytest.mark.parametrize("m", [1, 3, 4])
+def test_shards_partition_all_documents(documents, m):
+    shards = [{d.guid for d in WizDocumentFilter(shard=(i, m)).apply(documents)} for i in range(1, m + 1)]
+    assert sum(len(shard) for shard in shards) == len(documents)
+    assert set().union(*shards) == {d.guid for d in documents}
+
+
+def test_folder_tag_and_modified_filters(documents):
+    folder = documents[0].location
+    assert all(d.location == folder for d in WizDocumentFilter(folders=[folder.strip('/')]).apply(documents))
+
+    tagged = [d for d in documents if d.tags]
+    tag = tagged[0].tags[0].nesting_name
+    matched = list(WizDocumentFilter(tags=[tag]).apply(documents))
+    assert tagged[0] in matched
+    assert all(any(t.nesting_name.startswith(tag) for t in d.tags) for d in matched)
+
+    since = sorted(d.modified for d in documents)[len(documents) // 2]
+    assert all(d.modified >= since for d in WizDocumentFilter(modified_since=since).apply(documents))
+
+
+def test_delete_scope():
+    state = ConvertorState("/My Notes/a/", "a.ziw", "a", "a.md", True, None)
+    assert WizDocumentFilter(folders=["/My Notes/a"]).in_delete_scope("guid", state)
+    assert not WizDocumentFilter(folders=["/My Notes/b"]).in_delete_scope("guid", state)
+    assert not WizDocumentFilter(tags=["x"]).in_delete_scope("guid", state)
+
+
+def test_invalid_arguments():
+    assert parse_shard("2/4") == (2, 4)
+    assert WizDocumentFilter(modified_since="2024-01-02").modified_since == "2024-01-02 00:00:00"
+    with pytest.raises(ValueError):
+        parse_shard("2")
+    with pytest.raises(ValueError):
+        WizDocumentFilter(shard=(0, 4))
+    with pytest.raises(ValueError):
+        WizDocumentFilter(modified_since="yesterday")
@@ -0,0 +1,112 @@
+import os
+
+import pytest
+
+from config import Config
+from convertor_db import ConvertorDB, ConvertorState
+from wiz.wiz_convert_task import ConvertResult, PARTIAL_SUFFIX
+from wiz.wiz_extract_cache import ExtractCache
+
+
+@pytest.fixture
+def temp_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "convertor_db_path", str(tmp_path.joinpath("c.db")))
+    monkeypatch.setattr(Config, "temp_max_bytes", 1000)
+    monkeypatch.setattr(Config, "temp_cleanup_on_success", True)
+    temp_dir = tmp_path.joinpath("temp")
+    temp_dir.mkdir()
+    return temp_dir
+
+
+def _extract(temp_dir, guid, size, mtime=None):
+    """ 模拟一个解压目录 """
+    extract_dir = temp_dir.joinpath(guid)
+    extract_dir.joinpath("index_files").mkdir(parents=True)
+    extract_dir.joinpath("index.html").write_bytes(b"x" * (size - 10))
+    extract_dir.joinpath("index_files", "a.png").write_bytes(b"x" * 10)
+    if mtime is not None:
+        os.utime(extract_dir, (mtime, mtime))
+    return extract_dir
+
+
+def _result(guid, success, extracted_size=None) -> ConvertResult:
+    result = ConvertResult(guid)
+    result.success = success
+    if extracted_size is not None:
+        result.extract_time = "2024-01-01 10:00:00"
+        result.extracted_size = extracted_size
+    return result
+
+
+def _state(success, extract_time="2024-01-01 10:00:00") -> ConvertorState:
+    return ConvertorState("/a/", "n.ziw", "n", "n", success, extract_time)
+
+
+def test_scan_sizes_and_partial_dirs(temp_dir):
+    _extract(temp_dir, "a", 300)
+    _extract(temp_dir, "b", 200)
+    _extract(temp_dir, "c" + PARTIAL_SUFFIX, 100)
+
+    cache = ExtractCache(temp_dir)
+    assert cache.total == 500
+    # 崩溃时没解压完的目录，启动时删除
+    assert sorted(path.name for path in temp_dir.iterdir()) == ["a", "b"]
+
+
+def test_eviction_keeps_dirs_in_use(temp_dir):
+    for i, guid in enumerate(["a", "b", "c", "d"]):
+        _extract(temp_dir, guid, 300, mtime=1700000000 + i)
+    cache = ExtractCache(temp_dir)
+    assert cache.total == 1200
+
+    # a、b 最久未使用，但在待转换中，不能淘汰；d 刚用过，淘汰 c
+    cache.use("a")
+    cache.use("b")
+    cache.release(_result("d", False, 300))
+    assert sorted(path.name for path in temp_dir.iterdir()) == ["a", "b", "d"]
+    assert cache.total == 900
+
+    # 其余目录都在使用中时，只能淘汰刚转换完的目录
+    cache.use("d")
+    _extract(temp_dir, "e", 400)
+    cache.release(_result("e", False, 400))
+    assert sorted(path.name for path in temp_dir.iterdir()) == ["a", "b", "d"]
+    assert cache.total == 900
+
+
+@pytest.mark.parametrize("cleanup", [True, False])
+def test_cleanup_on_success(temp_dir, monkeypatch, cleanup):
+    monkeypatch.setattr(Config, "temp_cleanup_on_success", cleanup)
+    cache = ExtractCache(temp_dir)
+    for guid, success in [("ok", True), ("failed", False)]:
+        cache.use(guid)
+        _extract(temp_dir, guid, 100)
+        cache.release(_result(guid, success, 100))
+
+    assert temp_dir.joinpath("ok").exists() is not cleanup
+    # 转换失败的笔记保留解压目录，下次不用重新解压
+    assert temp_dir.joinpath("failed").exists()
+    assert cache.total == (100 if cleanup else 200)
+
+
+def test_reconcile(temp_dir):
+    convertor_db = ConvertorDB()
+    states = {guid: _state(success) for guid, success in
+              [("kept", False), ("deleted", False), ("gone_failed", False), ("gone_converted", True)]}
+    states["never_extracted"] = _state(False, None)
+    convertor_db.executemany("INSERT INTO wiz_convertor(guid, location, name, title, file_name, success, extract_time) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)", [(guid, *state) for guid, state in states.items()])
+    for guid in ["kept", "deleted", "orphan"]:
+        _extract(temp_dir, guid, 100)
+
+    cache = ExtractCache(temp_dir)
+    cache.reconcile(states, {"deleted"}, convertor_db)
+
+    # 没有转换记录的、已在为知中删除的目录，删除
+    assert sorted(path.name for path in temp_dir.iterdir()) == ["kept"]
+    assert cache.total == 100
+    # 只有解压目录已不存在、且没有转换成功的笔记，清除解压时间
+    extract_times = {guid: state.extract_time for guid, state in convertor_db.get_all_state().items()}
+    assert extract_times == {"kept": "2024-01-01 10:00:00", "deleted": "2024-01-01 10:00:00", "gone_failed": None,
+                             "gone_converted": "2024-01-01 10:00:00", "never_extracted": None}
+    convertor_db.close()
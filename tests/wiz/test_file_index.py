@@ -0,0 +1,67 @@
+import logging
+import sqlite3
+
+import pytest
+
+from config import Config
+from convertor_db import ConvertorDB
+from tests.benchmark.kb_generator import KBSpec, generate_kb
+from wiz.wiz_db import WizDB
+from wiz.wiz_file_index import WizFileIndex
+from wiz.wiz_storage import WizStorage
+
+SPEC = KBSpec(notes=20, folders=3, tags=2, html_size=256, images=0, attachment_ratio=0.6)
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "convertor_db_path", str(tmp_path.joinpath("convertor.db")))
+    return generate_kb(tmp_path.joinpath("data"), SPEC)
+
+
+@pytest.fixture
+def documents(data_dir):
+    return _load(data_dir)
+
+
+def _load(data_dir):
+    return list(WizStorage(data_dir, WizDB(data_dir), ConvertorDB()).iter_documents())
+
+
+def test_stats_match_filesystem(documents):
+    file_index = WizFileIndex(documents)
+    for document in documents:
+        stat = document.file.stat()
+        assert file_index.stat(document.file) == (stat.st_size, stat.st_mtime)
+        assert set(file_index.get_attachment_stats(document)) == {attachment.name for attachment in document.attachments}
+    assert not file_index.exists(documents[0].file.with_name("不存在.ziw"))
+
+
+def test_missing_files_reported_upfront(documents, caplog):
+    missing_document = documents[0]
+    missing_document.file.unlink()
+    document = next(d for d in documents[1:] if d.attachments)
+    attachment = document.attachments[0]
+    document.attachments_dir.joinpath(attachment.name).unlink()
+
+    file_index = WizFileIndex(documents)
+    assert not file_index.exists(missing_document.file)
+    assert attachment.name not in file_index.get_attachment_stats(document)
+
+    with caplog.at_level(logging.WARNING):
+        file_index.log_missing(documents)
+    assert f"{missing_document.location}{missing_document.title}" in caplog.text
+    assert f"{document.location}{document.title}：{attachment.name}" in caplog.text
+
+
+def test_attachment_count_mismatch(data_dir):
+    # DOCUMENT_ATTACHEMENT_COUNT 过期为 0，但仍有附件记录
+    with sqlite3.connect(data_dir.joinpath("index.db")) as conn:
+        guid = conn.execute("SELECT DOCUMENT_GUID FROM WIZ_DOCUMENT_ATTACHMENT LIMIT 1").fetchone()[0]
+        conn.execute("UPDATE WIZ_DOCUMENT SET DOCUMENT_ATTACHEMENT_COUNT = 0 WHERE DOCUMENT_GUID = ?", (guid,))
+    documents = _load(data_dir)
+    document = next(d for d in documents if d.guid == guid)
+    assert document.attachment_count == 0 and document.attachments
+
+    file_index = WizFileIndex(documents)
+    assert set(file_index.get_attachment_stats(document)) == {attachment.name for attachment in document.attachments}
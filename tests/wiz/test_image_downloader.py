@@ -0,0 +1,141 @@
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from config import Config
+from convertor_db import ConvertorDB
+from tests.benchmark.kb_generator import KBSpec, generate_kb
+from wiz.wiz_convertor import WizConvertor
+from wiz.wiz_db import WizDB
+from wiz.wiz_note_file import ZipNoteFile
+from wiz.wiz_storage import WizStorage
+from wiz.wiz_image_downloader import ImageDownloader, find_remote_images
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """ `/*.png` 返回图片，`/stalled*` 返回一部分后不再响应，其它路径 404，并记录收到的请求 """
+
+    requests: list[str] = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.path.startswith("/stalled"):
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(PNG) * 2))
+            self.end_headers()
+            self.wfile.write(PNG)
+            self.wfile.flush()
+            time.sleep(1)
+        elif self.path.endswith(".png"):
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(PNG)))
+            self.end_headers()
+            self.wfile.write(PNG)
+        else:
+            self.send_error(404)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    ImageHandler.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_retry(monkeypatch):
+    monkeypatch.setattr(Config, "image_download_retries", 0)
+
+
+def _download(cache_dir, urls):
+    downloader = ImageDownloader(cache_dir)
+    try:
+        return downloader.download_all(urls)
+    finally:
+        downloader.close()
+
+
+def test_find_remote_images():
+    html = b'<p><img src="https://a.com/x.png?a=1&amp;b=2"><IMG alt="" src=\'http://b.com/y.jpg\'><img src="index_files/z.png"></p>'
+    assert find_remote_images(html) == {"https://a.com/x.png?a=1&b=2", "http://b.com/y.jpg"}
+
+
+def test_find_remote_images_ignores_data_src():
+    # 懒加载的占位图：data-src 才是真实地址，转换时不会改写，不应下载
+    html = b'<img data-src="https://a.com/lazy.png" src="index_files/placeholder.gif"><img data-src="https://a.com/b.png" src="https://a.com/real.png">'
+    assert find_remote_images(html) == {"https://a.com/real.png"}
+
+
+def test_download_and_cache_hit(server, tmp_path):
+    urls = {f"{server}/a.png", f"{server}/b.png"}
+    images = _download(tmp_path, urls)
+
+    assert set(images) == urls
+    for file in images.values():
+        assert file.read_bytes() == PNG
+        assert file.suffix == ".png"
+    assert sorted(ImageHandler.requests) == ["/a.png", "/b.png"]
+
+    # 重复运行，直接使用缓存，不再请求
+    ImageHandler.requests.clear()
+    assert _download(tmp_path, urls) == images
+    assert ImageHandler.requests == []
+
+
+def test_download_not_found(server, tmp_path):
+    images = _download(tmp_path, {f"{server}/missing.gif", f"{server}/ok.png"})
+
+    assert set(images) == {f"{server}/ok.png"}
+    assert not list(tmp_path.glob("*.part"))
+
+
+def test_download_timeout_mid_stream(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "image_download_timeout", (1, 0.3))
+    images = _download(tmp_path, {f"{server}/stalled.png", f"{server}/ok.png"})
+
+    assert set(images) == {f"{server}/ok.png"}
+    assert not list(tmp_path.glob("*.part"))
+
+
+@pytest.mark.parametrize("pipeline", [False, True])
+def test_images_downloaded_while_converting(server, tmp_path, monkeypatch, pipeline):
+    data_dir = generate_kb(tmp_path.joinpath("data"), KBSpec(notes=4, folders=1, tags=1, html_size=256, images=0,
+                                                             todolist_ratio=0, link_ratio=0))
+    note = sorted(data_dir.rglob("*.ziw"))[0]
+    with zipfile.ZipFile(note, "w") as zip_file:
+        zip_file.writestr("index.html", f'<p><img src="{server}/a.png"><img data-src="{server}/lazy.png" src="{server}/b.png"></p>')
+    for key, value in {"output_dir": str(tmp_path.joinpath("notes")), "convertor_db_path": str(tmp_path.joinpath("c.db")),
+                       "image_cache_dir": str(tmp_path.joinpath("image_cache")), "conversion_cache": False,
+                       "download_images": True, "pipeline": pipeline}.items():
+        monkeypatch.setattr(Config, key, value)
+    reads = []
+    read_index_html = ZipNoteFile.read_index_html
+    monkeypatch.setattr(ZipNoteFile, "read_index_html", lambda self: reads.append(self) or read_index_html(self))
+
+    wiz_db = WizDB(data_dir)
+    convertor_db = ConvertorDB()
+    try:
+        assert WizConvertor(convertor_db, WizStorage(data_dir, wiz_db, convertor_db)).report.converted == 4
+    finally:
+        convertor_db.close()
+        wiz_db.close()
+
+    # 转换时才下载，每篇笔记的 index.html 只读取一次
+    assert len(reads) == 4
+    assert sorted(ImageHandler.requests) == ["/a.png", "/b.png"]
+    markdown = next(tmp_path.joinpath("notes").rglob(note.stem + ".md")).read_text("utf-8")
+    assert "http" not in markdown.split("---")[-1]
@@ -0,0 +1,74 @@
+import sqlite3
+
+import pytest
+
+from config import Config
+from convertor_db import ConvertorDB
+from tests.benchmark.kb_generator import KBSpec, generate_kb
+from wiz.wiz_convertor import WizConvertor
+from wiz.wiz_db import WizDB
+from wiz.wiz_storage import WizStorage
+
+SPEC = KBSpec(notes=16, folders=2, tags=2, html_size=256, images=0, attachment_ratio=0.3, link_ratio=0.6)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    return generate_kb(tmp_path.joinpath("data"), SPEC)
+
+
+def _convert(data_dir, out_dir, monkeypatch) -> tuple[WizConvertor, ConvertorDB]:
+    for key, value in {"output_dir": str(out_dir.joinpath("notes")), "convertor_db_path": str(out_dir.joinpath("c.db")),
+                       "conversion_cache_path": str(out_dir.joinpath("cache.db")), "download_images": False}.items():
+        monkeypatch.setattr(Config, key, value)
+    wiz_db = WizDB(data_dir)
+    convertor_db = ConvertorDB()
+    try:
+        return WizConvertor(convertor_db, WizStorage(data_dir, wiz_db, convertor_db)), convertor_db
+    finally:
+        wiz_db.close()
+
+
+def _read_tree(root):
+    return {path.relative_to(root): path.read_bytes() for path in root.rglob("*") if path.is_file()}
+
+
+def _most_linked(convertor_db: ConvertorDB) -> str:
+    return convertor_db.query_scalar(
+        "SELECT target FROM wiz_link WHERE link_type='open_document' GROUP BY target ORDER BY count(*) DESC, target LIMIT 1")
+
+
+def test_renamed_target_re_renders_linking_notes(data_dir, tmp_path, monkeypatch):
+    _, convertor_db = _convert(data_dir, tmp_path.joinpath("inc"), monkeypatch)
+    target = _most_linked(convertor_db)
+    backlinks = convertor_db.get_backlinks(target)
+    assert backlinks and all(link_type == "open_document" for _, link_type in backlinks)
+    assert convertor_db.get_linking_documents([target]) == {source for source, _ in backlinks}
+    convertor_db.close()
+
+    with sqlite3.connect(data_dir.joinpath("index.db")) as conn:
+        conn.execute("UPDATE WIZ_DOCUMENT SET DOCUMENT_TITLE = '改名后的笔记' WHERE DOCUMENT_GUID = ?", (target,))
+
+    convertor, convertor_db = _convert(data_dir, tmp_path.joinpath("inc"), monkeypatch)
+    convertor_db.close()
+    # 链接到目标笔记的笔记（包括链接自身的目标笔记）重新转换，其余笔记不转换
+    assert convertor.report.converted == len(backlinks)
+
+    _convert(data_dir, tmp_path.joinpath("full"), monkeypatch)[1].close()
+    assert _read_tree(tmp_path.joinpath("inc", "notes")) == _read_tree(tmp_path.joinpath("full", "notes"))
+
+
+def test_deleted_note_removes_its_links(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "convertor_db_path", str(tmp_path.joinpath("c.db")))
+    convertor_db = ConvertorDB()
+    convertor_db.save_links("a", {("open_document", "b"), ("open_attachment", "x")})
+    convertor_db.save_links("c", {("open_document", "b")})
+    convertor_db.flush()
+    assert convertor_db.get_backlinks("b") == [("a", "open_document"), ("c", "open_document")]
+    assert convertor_db.get_linking_documents(["x"]) == set()
+
+    convertor_db.save_links("c", set())
+    convertor_db.delete("a")
+    convertor_db.flush()
+    assert convertor_db.get_backlinks("b") == []
+    convertor_db.close()
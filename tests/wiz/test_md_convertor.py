@@ -0,0 +1,73 @@
+from pathlib import Path
+
+import pytest
+
+from config import Config
+from wiz.entity.wiz_attachment import WizAttachment
+from wiz.markdown.wiz_md_convertor import wiz_html_to_md
+from wiz.wiz_note_file import WizNoteFile
+
+FIXTURES_DIR = Path(__file__).parent.joinpath("fixtures")
+FIXTURES = sorted(FIXTURES_DIR.glob("*.html"))
+
+LINK_TARGETS = {"11111111-2222-3333-4444-555555555555": "/My Notes/目标笔记"}
+ATTACHMENTS = {"att-1": WizAttachment("att-1", "doc-1", "说明书.pdf", "2024-01-01 00:00:00")}
+
+
+class FakeNoteFile(WizNoteFile):
+    """ 只记录被复制的图片，不读写真实的 ziw 文件 """
+
+    def __init__(self) -> None:
+        self.copied = []
+
+    def copy_resource(self, src: str, target_dir: Path) -> Path:
+        self.copied.append(src)
+        return target_dir.joinpath(Path(src).name)
+
+
+def _convert(html_file: Path, parser: str, output_dir: Path, monkeypatch):
+    monkeypatch.setattr(Config, "output_dir", str(output_dir))
+    monkeypatch.setattr(Config, "html_parser", parser)
+    note_file = FakeNoteFile()
+    unresolved = set()
+    markdown = wiz_html_to_md(html_file.read_text("UTF-8"), note_file, ATTACHMENTS,
+                              output_dir.joinpath("My Notes", "note_Attachments"), LINK_TARGETS, unresolved)
+    return markdown, note_file.copied, unresolved
+
+
+def _normalize(markdown: str):
+    """ 不同解析器对空白文字节点的处理略有不同，比较前忽略空行、行首行尾的空格（不含缩进用的 tab） """
+    lines = (line.strip(" ") for line in markdown.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+@pytest.mark.parametrize("parser", ["lxml", "html5lib"])
+@pytest.mark.parametrize("html_file", FIXTURES, ids=[f.stem for f in FIXTURES])
+def test_parser_output_equivalent(html_file, parser, tmp_path, monkeypatch):
+    pytest.importorskip(parser)
+    expected, expected_copied, expected_unresolved = _convert(html_file, "html.parser", tmp_path, monkeypatch)
+    markdown, copied, unresolved = _convert(html_file, parser, tmp_path, monkeypatch)
+
+    assert _normalize(markdown) == _normalize(expected)
+    assert copied == expected_copied
+    assert unresolved == expected_unresolved
+
+
+def test_rewrite_images_and_links(tmp_path, monkeypatch):
+    markdown, copied, unresolved = _convert(FIXTURES_DIR.joinpath("links_images.html"), "html.parser", tmp_path, monkeypatch)
+
+    assert "[[/My Notes/目标笔记|另一篇笔记]]" in markdown
+    assert "[[My Notes/note_Attachments/说明书.pdf]]" in markdown
+    assert "![[My Notes/note_Attachments/1cde3ccd-3c93-413f-8582-fa727bc19afe.png]]" in markdown
+    # 链接中的图片先替换，链接文字中保留图片
+    assert "[[/My Notes/目标笔记|![[My Notes/note_Attachments/inside-link.jpg]]]]" in markdown
+    assert "https://example.com/logo.png" in markdown
+    assert copied == ["index_files/1cde3ccd-3c93-413f-8582-fa727bc19afe.png", "index_files/inside-link.jpg"]
+    assert unresolved == {"not-exists"}
+
+
+def test_fix_nested_list(tmp_path, monkeypatch):
+    markdown, _, _ = _convert(FIXTURES_DIR.joinpath("nested_list.html"), "html.parser", tmp_path, monkeypatch)
+
+    lines = [line for line in markdown.splitlines() if line.strip()]
+    assert lines.index("* 第一层") < lines.index("\t+ 第二层 A") < lines.index("\t\t- 第三层")
@@ -0,0 +1,126 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from config import Config
+from convertor_db import ConvertorDB
+from tests.benchmark.kb_generator import KBSpec, generate_kb
+from wiz import wiz_convert_task, wiz_pipeline
+from wiz.wiz_convertor import WizConvertor
+from wiz.wiz_db import WizDB
+from wiz.wiz_storage import WizStorage
+
+SPEC = KBSpec(notes=24, folders=3, tags=3, html_size=1024, images=2, image_size=256, attachment_ratio=0.5,
+              todolist_ratio=0.1)
+
+
+@pytest.fixture(scope="module")
+def data_dir(tmp_path_factory):
+    return generate_kb(tmp_path_factory.mktemp("kb").joinpath("data"), SPEC)
+
+
+def _convert(data_dir, out_dir, monkeypatch, **config) -> WizConvertor:
+    for key, value in {"output_dir": str(out_dir.joinpath("notes")), "convertor_db_path": str(out_dir.joinpath("c.db")),
+                       "conversion_cache": False, "download_images": False, **config}.items():
+        monkeypatch.setattr(Config, key, value)
+    wiz_db = WizDB(data_dir)
+    convertor_db = ConvertorDB()
+    try:
+        return WizConvertor(convertor_db, WizStorage(data_dir, wiz_db, convertor_db))
+    finally:
+        convertor_db.close()
+        wiz_db.close()
+
+
+def _read_tree(root):
+    return {path.relative_to(root): path.read_bytes() for path in root.rglob("*") if path.is_file()}
+
+
+@pytest.mark.parametrize("config", [
+    {"pipeline_read_ahead": 2, "pipeline_writers": 3, "pipeline_write_queue": 2},
+    {"pipeline_prefetch_max_bytes": 0},
+])
+def test_pipeline_output_matches_sequential(data_dir, tmp_path, monkeypatch, config):
+    sequential = _convert(data_dir, tmp_path.joinpath("seq"), monkeypatch, pipeline=False)
+    pipelined = _convert(data_dir, tmp_path.joinpath("pipe"), monkeypatch, pipeline=True, **config)
+
+    assert pipelined.report.converted == sequential.report.converted == SPEC.notes
+    assert _read_tree(tmp_path.joinpath("pipe", "notes")) == _read_tree(tmp_path.joinpath("seq", "notes"))
+    assert pipelined.report.bytes_copied == sequential.report.bytes_copied
+
+
+def test_reader_error_does_not_hang(data_dir, tmp_path, monkeypatch):
+    read_note = wiz_pipeline.read_note
+
+    def failing_read_note(job):
+        if job.task.index == 3:
+            raise MemoryError("读取失败")
+        read_note(job)
+
+    monkeypatch.setattr(wiz_pipeline, "read_note", failing_read_note)
+    errors = []
+
+    def run():
+        try:
+            _convert(data_dir, tmp_path, monkeypatch, pipeline=True)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive()
+    assert len(errors) == 1 and isinstance(errors[0].__cause__, MemoryError)
+
+
+def test_writer_error_does_not_hang(data_dir, tmp_path, monkeypatch):
+    write_note = wiz_pipeline.write_note
+
+    def failing_write_note(job, sink):
+        if job.task.index == 3:
+            raise OSError("写入失败")
+        return write_note(job, sink)
+
+    monkeypatch.setattr(wiz_pipeline, "write_note", failing_write_note)
+    errors = []
+
+    def run():
+        try:
+            _convert(data_dir, tmp_path, monkeypatch, pipeline=True)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive()
+    assert len(errors) == 1 and isinstance(errors[0].__cause__, OSError)
+
+
+@pytest.mark.parametrize("config", [{"pipeline": True}, {"pipeline": False, "stream_from_zip": False}])
+def test_note_modified_during_conversion_is_reconverted(tmp_path, monkeypatch, config):
+    data_dir = generate_kb(tmp_path.joinpath("data"), KBSpec(notes=3, folders=1, tags=1, html_size=256, images=0))
+    monkeypatch.setattr(Config, "temp_dir", str(tmp_path.joinpath("temp")))
+    write_note = wiz_convert_task._write_note
+    edited = []
+    lock = threading.Lock()
+
+    def write_and_edit(document, target_file, content):
+        # 读取笔记之后、保存转换结果之前，笔记在为知中又被修改；流水线有多个写入线程，只修改一篇
+        with lock:
+            first = not edited
+            edited.append(document.guid)
+        if first:
+            time.sleep(1.1)
+            with sqlite3.connect(data_dir.joinpath("index.db")) as conn:
+                conn.execute("UPDATE WIZ_DOCUMENT SET DT_MODIFIED = datetime('now', 'localtime') WHERE DOCUMENT_GUID = ?",
+                             (document.guid,))
+        write_note(document, target_file, content)
+
+    monkeypatch.setattr(wiz_convert_task, "_write_note", write_and_edit)
+    assert _convert(data_dir, tmp_path, monkeypatch, **config).report.converted == 3
+
+    convertor = _convert(data_dir, tmp_path, monkeypatch, **config)
+    assert convertor.report.converted == 1
@@ -0,0 +1,123 @@
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from config import Config
+from convertor_db import ConvertorDB
+from tests.benchmark.kb_generator import KBSpec, generate_kb
+from wiz.wiz_convertor import WizConvertor
+from wiz.wiz_db import WizDB
+from wiz.wiz_document_filter import WizDocumentFilter
+from wiz.wiz_storage import WizStorage
+from wiz.wiz_sync_plan import WizSyncPlan
+
+SPEC = KBSpec(notes=8, folders=2, tags=1, html_size=256, images=0, attachment_ratio=1, link_ratio=0)
+
+
+@pytest.fixture
+def kb(tmp_path, monkeypatch):
+    """ 全部转换过一次的笔记库：(数据目录, 为知数据库, 转换记录) """
+    data_dir = generate_kb(tmp_path.joinpath("data"), SPEC)
+    for key, value in {"output_dir": str(tmp_path.joinpath("notes")), "convertor_db_path": str(tmp_path.joinpath("c.db")),
+                       "conversion_cache": False, "download_images": False, "propagate_deletes": True}.items():
+        monkeypatch.setattr(Config, key, value)
+    wiz_db = WizDB(data_dir)
+    convertor_db = ConvertorDB()
+    WizConvertor(convertor_db, WizStorage(data_dir, wiz_db, convertor_db))
+    yield data_dir, wiz_db, convertor_db
+    convertor_db.close()
+    wiz_db.close()
+
+
+def _update(data_dir, sql, *parameters):
+    with sqlite3.connect(data_dir.joinpath("index.db")) as conn:
+        conn.execute(sql, parameters)
+
+
+def _plan(kb, **kwargs) -> WizSyncPlan:
+    data_dir, wiz_db, convertor_db = kb
+    return WizSyncPlan(WizStorage(data_dir, wiz_db, convertor_db).iter_documents(), convertor_db, **kwargs)
+
+
+def _outputs(kb, guid) -> tuple[Path, Path]:
+    """ 按转换记录中的位置，得到已转换笔记的 md 文件与附件目录 """
+    kb[2].flush()
+    state = kb[2].get_all_state()[guid]
+    file = Config.output_dir + state.location + state.file_name
+    return Path(file + ".md"), Path(file + "_Attachments")
+
+
+def _guids(kb):
+    return [guid for guid, _, _ in kb[1].get_all_document_locations()]
+
+
+def test_moved_note_is_renamed(kb):
+    guid = _guids(kb)[0]
+    old_md, old_attachments = _outputs(kb, guid)
+    _update(kb[0], "UPDATE WIZ_DOCUMENT SET DOCUMENT_TITLE = '新标题' WHERE DOCUMENT_GUID = ?", guid)
+
+    plan = _plan(kb)
+    assert [document.guid for document, _ in plan.moved] == [guid] and not plan.changed
+    plan.apply(kb[2])
+
+    new_md, new_attachments = _outputs(kb, guid)
+    assert new_md.name == "新标题.md" and new_md.exists() and new_attachments.is_dir()
+    assert not old_md.exists() and not old_attachments.exists()
+    assert not plan.changed
+
+
+def test_moved_and_changed_note_removed_on_apply(kb):
+    guid = _guids(kb)[0]
+    old_md, old_attachments = _outputs(kb, guid)
+    _update(kb[0], "UPDATE WIZ_DOCUMENT SET DOCUMENT_TITLE = '新标题', DT_MODIFIED = '2030-01-01 00:00:00' "
+                   "WHERE DOCUMENT_GUID = ?", guid)
+
+    plan = _plan(kb)
+    assert [document.guid for document in plan.changed] == [guid] and not plan.moved
+    # 生成同步计划时不动文件
+    assert old_md.exists() and old_attachments.is_dir()
+
+    plan.apply(kb[2])
+    assert not old_md.exists() and not old_attachments.exists()
+    # 转换记录指向新位置，下次运行不再当作移动
+    assert _outputs(kb, guid)[0].name == "新标题.md"
+
+
+def test_move_target_occupied(kb):
+    guid, other = _guids(kb)[:2]
+    old_md, old_attachments = _outputs(kb, guid)
+    occupied_md, _ = _outputs(kb, other)
+    # 改成与另一篇笔记相同的位置和标题，新位置已被占用
+    location, title = kb[1].query_list("SELECT DOCUMENT_LOCATION, DOCUMENT_TITLE FROM WIZ_DOCUMENT WHERE DOCUMENT_GUID = ?",
+                                       (other,))[0]
+    _update(kb[0], "UPDATE WIZ_DOCUMENT SET DOCUMENT_LOCATION = ?, DOCUMENT_TITLE = ? WHERE DOCUMENT_GUID = ?",
+            location, title, guid)
+
+    plan = _plan(kb)
+    plan.apply(kb[2])
+    # 不覆盖已占用的位置，删掉原来的文件，改为重新转换
+    assert [document.guid for document in plan.changed] == [guid]
+    assert occupied_md.exists()
+    assert not old_md.exists() and not old_attachments.exists()
+    assert _outputs(kb, guid)[0] == occupied_md
+
+
+def test_deleted_out_of_scope_is_kept(kb):
+    guid = _guids(kb)[0]
+    md, attachments = _outputs(kb, guid)
+    state = kb[2].get_all_state()[guid]
+    _update(kb[0], "DELETE FROM WIZ_DOCUMENT WHERE DOCUMENT_GUID = ?", guid)
+    other_folder = next(location for _, _, location in kb[1].get_all_document_locations() if location != state.location)
+
+    out_of_scope = WizDocumentFilter(folders=[other_folder])
+    plan = _plan(kb, delete_scope=out_of_scope.in_delete_scope)
+    assert not plan.deleted
+    plan.apply(kb[2])
+    assert md.exists() and guid in kb[2].get_all_state()
+
+    plan = _plan(kb, delete_scope=WizDocumentFilter(folders=[state.location]).in_delete_scope)
+    assert [deleted for deleted, _ in plan.deleted] == [guid]
+    plan.apply(kb[2])
+    assert not md.exists() and not attachments.exists()
+    assert guid not in kb[2].get_all_state()
@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import pytest
+
+from config import Config
+from convertor_db import ConvertorDB
+from tests.benchmark.kb_generator import KBSpec, generate_kb
+from wiz.wiz_db import WizDB
+from wiz.wiz_storage import WizStorage
+from wiz.wiz_sync_plan import WizSyncPlan
+
+SPEC = KBSpec(notes=30, folders=4, tags=6, html_size=512, images=1, image_size=64, attachment_ratio=0.5)
+
+
+@pytest.fixture(scope="module")
+def data_dir(tmp_path_factory):
+    return generate_kb(tmp_path_factory.mktemp("kb").joinpath("data"), SPEC)
+
+
+def _storage(data_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "convertor_db_path", str(tmp_path.joinpath("convertor.db")))
+    return WizStorage(data_dir, WizDB(data_dir), ConvertorDB())
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, 500])
+def test_iter_documents_in_batches(data_dir, tmp_path, monkeypatch, batch_size):
+    storage = _storage(data_dir, tmp_path, monkeypatch)
+    documents = list(storage.iter_documents(batch_size))
+
+    assert len(documents) == storage.document_count == SPEC.notes
+    assert len({document.guid for document in documents}) == SPEC.notes
+    for document in documents:
+        assert len(document.attachments) == document.attachment_count
+        assert all(tag.nesting_name for tag in document.tags)
+    assert any(document.attachments for document in documents)
+    assert any(document.tags for document in documents)
+
+
+def test_repeated_instances_are_isolated(data_dir, tmp_path, monkeypatch):
+    first = _storage(data_dir, tmp_path, monkeypatch)
+    second = _storage(data_dir, tmp_path, monkeypatch)
+
+    assert len(list(first.iter_documents())) == len(list(second.iter_documents())) == SPEC.notes
+    assert first.all_tags is not second.all_tags
+
+
+def test_link_targets_and_get_document(data_dir, tmp_path, monkeypatch):
+    storage = _storage(data_dir, tmp_path, monkeypatch)
+    documents = list(storage.iter_documents())
+    link_targets = storage.get_link_targets()
+
+    assert link_targets == {document.guid: document.location + document.output_file_name for document in documents}
+    document = storage.get_document(documents[3].guid)
+    assert document.file == documents[3].file
+    assert [a.guid for a in document.attachments] == [a.guid for a in documents[3].attachments]
+    assert storage.get_document("missing") is None
+
+
+def test_sync_plan_from_index_matches_full_scan(data_dir, tmp_path, monkeypatch):
+    storage = _storage(data_dir, tmp_path, monkeypatch)
+    convertor_db = storage.convertor_db
+    documents = list(storage.iter_documents())
+    convertor_db.add_all(documents[:20])
+    extract_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for document in documents[:15]:
+        convertor_db.save_result(document.guid, True)
+        convertor_db.save_extract_time(document.guid, extract_time)
+    convertor_db.execute("UPDATE wiz_convertor SET title = 'old' WHERE guid = ?", (documents[0].guid,))
+    convertor_db.execute("INSERT INTO wiz_convertor(guid, location, name, title) VALUES ('gone', '/a/', 'a', 'a')")
+    convertor_db.flush()
+
+    full = WizSyncPlan(storage.iter_documents(), convertor_db)
+    fast = WizSyncPlan.from_index(storage, convertor_db)
+    for attr in ("new", "changed"):
+        assert [d.guid for d in getattr(fast, attr)] == [d.guid for d in getattr(full, attr)]
+    assert [d.guid for d, _ in fast.moved] == [d.guid for d, _ in full.moved] == [documents[0].guid]
+    assert fast.deleted == full.deleted
+    assert fast.unchanged == full.unchanged == 14
@@ -0,0 +1,95 @@
+import sqlite3
+
+import pytest
+
+from config import Config
+from convertor_db import ConvertorDB
+from tests.benchmark.kb_generator import KBSpec, generate_kb
+from wiz.wiz_db import WizDB
+from wiz.wiz_storage import WizStorage
+from wiz import wiz_watcher
+from wiz.wiz_watcher import HIGH_WATER_MARK, WizWatcher
+
+SPEC = KBSpec(notes=12, folders=2, tags=2, html_size=256, images=0, attachment_ratio=0)
+
+
+@pytest.fixture
+def new_watcher(tmp_path, monkeypatch):
+    """ 还没有全量同步过的监视器 """
+    data_dir = generate_kb(tmp_path.joinpath("data"), SPEC)
+    for key, value in {"output_dir": "out/notes", "convertor_db_path": "out/convertor.db",
+                       "conversion_cache_path": "out/conversion_cache.db", "download_images": False,
+                       "watch_debounce": 3, "watch_retry_interval": 60}.items():
+        monkeypatch.setattr(Config, key, str(tmp_path.joinpath(value)) if isinstance(value, str) else value)
+    wiz_db = WizDB(data_dir)
+    convertor_db = ConvertorDB()
+    yield WizWatcher(data_dir, wiz_db, convertor_db, WizStorage(data_dir, wiz_db, convertor_db))
+    convertor_db.close()
+    wiz_db.close()
+
+
+@pytest.fixture
+def watcher(new_watcher):
+    new_watcher.start()
+    return new_watcher
+
+
+def _touch(watcher, guid, modified):
+    with sqlite3.connect(watcher.wiz_dir.joinpath("index.db")) as conn:
+        conn.execute("UPDATE WIZ_DOCUMENT SET DT_MODIFIED = ? WHERE DOCUMENT_GUID = ?", (modified, guid))
+
+
+def test_debounced_conversion_of_modified_notes(watcher):
+    high_water_mark = watcher.convertor_db.get_meta(HIGH_WATER_MARK)
+    assert high_water_mark == watcher.wiz_db.get_max_modified()
+    # 全量同步之后，只有高水位时间那一秒修改的笔记会被查到，都已转换过
+    assert watcher.poll(now=0) == 0
+
+    guid = watcher.wiz_db.get_all_document_locations()[0][0]
+    _touch(watcher, guid, "2030-01-01 10:00:00")
+    assert watcher.poll(now=100) == 0
+    # 等待期间又有修改，重新计时
+    _touch(watcher, guid, "2030-01-01 10:00:01")
+    assert watcher.poll(now=102) == 0
+    assert watcher.poll(now=104) == 0
+    assert watcher.poll(now=105) == 1
+    assert watcher.convertor_db.get_meta(HIGH_WATER_MARK) == "2030-01-01 10:00:01"
+
+    # 没有新的修改，不再转换
+    assert watcher.poll(now=200) == 0
+
+
+def test_failed_conversion_is_retried(watcher):
+    guid = watcher.wiz_db.get_all_document_locations()[0][0]
+    document = watcher.wiz_storage.get_documents([guid])[0]
+    # 同步中文件暂时不可用，转换失败
+    hidden = document.file.with_name(document.file.name + ".hidden")
+    document.file.rename(hidden)
+    _touch(watcher, guid, "2030-01-01 10:00:00")
+    assert watcher.poll(now=100) == 0
+    assert watcher.poll(now=103) == 0
+    assert watcher.convertor_db.get_meta(HIGH_WATER_MARK) < "2030-01-01 10:00:00"
+
+    hidden.rename(document.file)
+    # 重试间隔之前不重试
+    assert watcher.poll(now=150) == 0
+    assert watcher.poll(now=163) == 1
+    assert watcher.convertor_db.get_meta(HIGH_WATER_MARK) == "2030-01-01 10:00:00"
+
+
+def test_note_modified_during_initial_sync(new_watcher, monkeypatch):
+    guid = new_watcher.wiz_db.get_all_document_locations()[0][0]
+    convertor = wiz_watcher.WizConvertor
+
+    def convert_and_edit(*args, **kwargs):
+        result = convertor(*args, **kwargs)
+        # 全量同步读取这篇笔记之后，笔记又被修改
+        _touch(new_watcher, guid, "2030-01-01 10:00:00")
+        monkeypatch.setattr(wiz_watcher, "WizConvertor", convertor)
+        return result
+
+    monkeypatch.setattr(wiz_watcher, "WizConvertor", convert_and_edit)
+    new_watcher.start()
+    assert new_watcher.poll(now=0) == 0
+    assert new_watcher.poll(now=3) == 1
+    assert new_watcher.convertor_db.get_meta(HIGH_WATER_MARK) == "2030-01-01 10:00:00"